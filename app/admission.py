@@ -0,0 +1,232 @@
+import asyncio
+import heapq
+import itertools
+import json
+import re
+import time
+from collections import Counter
+from typing import Optional
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.config import logger, settings
+from app.functions import api_key_cache
+from app.timing import record
+
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# причины отказа
+QUEUE_FULL = "queue_full"
+DEADLINE = "deadline"
+TIMEOUT = "timeout"
+
+
+class Limiter:
+    """
+    Ограничение одновременных запросов с очередью по приоритету.
+
+    Освободившееся место получает ожидающий с наименьшим priority, при
+    равенстве - пришедший раньше. Если по среднему времени обработки
+    запрос не дождется места за timeout, он отклоняется сразу, а не после
+    ожидания.
+    """
+
+    def __init__(self, name: str, limit: int, queue_size: int) -> None:
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed: Counter[str] = Counter()
+        # скользящее среднее времени обработки, секунды
+        self.service_time = 0.05
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+
+    def predicted_wait(self, priority: int) -> float:
+        ahead = sum(
+            1 for waiter_priority, _, future in self._waiters
+            if waiter_priority <= priority and not future.done()
+        )
+        return (ahead + 1) * self.service_time / self.limit
+
+    async def acquire(self, priority: int, timeout: float) -> Optional[str]:
+        """
+        Занимает место.
+
+        :return: None, если место получено, иначе причина отказа
+        """
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+            self.admitted += 1
+            return None
+        if self.waiting >= self.queue_size:
+            self.shed[QUEUE_FULL] += 1
+            return QUEUE_FULL
+        if self.predicted_wait(priority) > timeout:
+            self.shed[DEADLINE] += 1
+            return DEADLINE
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.shed[TIMEOUT] += 1
+            return TIMEOUT
+        except BaseException:
+            # место могли передать уже после отмены ожидания
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            self.waiting -= 1
+        self.admitted += 1
+        return None
+
+    def release(self, duration: Optional[float] = None) -> None:
+        if duration is not None:
+            self.service_time += (duration - self.service_time) * 0.1
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # место переходит ожидающему, active не меняется
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def metrics(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "service_ms": round(self.service_time * 1000, 1),
+            "shed": {reason: self.shed[reason] for reason in (QUEUE_FULL, DEADLINE, TIMEOUT)},
+        }
+
+
+class AdmissionController:
+    """Общий лимит на API и отдельные лимиты тяжелых маршрутов"""
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        queue_size: int,
+        route_limits: dict[str, int],
+        exempt: list[str],
+        queue_timeout: float,
+    ) -> None:
+        self.total = Limiter("total", max_concurrency, queue_size)
+        self.routes = [
+            (re.compile(pattern), Limiter(pattern, limit, queue_size))
+            for pattern, limit in route_limits.items()
+        ]
+        self.exempt = tuple(exempt)
+        self.queue_timeout = queue_timeout
+
+    def route_limiter(self, path: str) -> Optional[Limiter]:
+        for pattern, limiter in self.routes:
+            if pattern.search(path):
+                return limiter
+        return None
+
+    async def priority(self, method: str, api_key: Optional[str], heavy: bool) -> int:
+        """
+        0 - чтение с api-key из кэша, дальше запросы дороже: без кэша
+        авторизация идет в базу, запись дороже чтения, тяжелые маршруты
+        дороже всего.
+        """
+        priority = 0 if method in READ_METHODS else 2
+        if not api_key or not await api_key_cache.get_many([api_key]):
+            priority += 1
+        if heavy:
+            priority += 2
+        return priority
+
+    def metrics(self) -> dict:
+        limiters = [self.total] + [limiter for _, limiter in self.routes]
+        return {limiter.name: limiter.metrics() for limiter in limiters}
+
+
+class AdmissionMiddleware:
+    """
+    Ограничивает одновременные запросы к API до пула соединений с базой.
+
+    Лишние запросы ждут в ограниченной очереди; если места не дождаться
+    за queue_timeout, сразу отдается 503 с Retry-After: при всплеске часть
+    запросов быстро получает отказ, а не все - таймаут пула.
+    """
+
+    def __init__(self, app: ASGIApp, controller: AdmissionController) -> None:
+        self.app = app
+        self.controller = controller
+
+    async def _shed(self, send: Send) -> None:
+        body = json.dumps(
+            {
+                "result": False,
+                "error_type": "Overloaded",
+                "error_message": "Сервер перегружен, повторите запрос позже",
+            },
+            ensure_ascii=False,
+        ).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(settings.admission.retry_after_seconds).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        path = scope.get("path", "")
+        if (
+            scope["type"] != "http"
+            or not path.startswith("/api/")
+            or path.startswith(self.controller.exempt)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        route = self.controller.route_limiter(path)
+        priority = await self.controller.priority(
+            scope["method"], Headers(scope=scope).get("api-key"), heavy=route is not None
+        )
+        limiters = [limiter for limiter in (route, self.controller.total) if limiter]
+        acquired: list[Limiter] = []
+        start = time.perf_counter()
+        started: Optional[float] = None
+        try:
+            for limiter in limiters:
+                reason = await limiter.acquire(priority, self.controller.queue_timeout)
+                if reason is not None:
+                    logger.warning(f"Запрос {path} отклонен ({limiter.name}: {reason})")
+                    await self._shed(send)
+                    return
+                acquired.append(limiter)
+            started = time.perf_counter()
+            record("queue", started - start)
+            await self.app(scope, receive, send)
+        finally:
+            # в среднее время обработки ожидание в очереди не входит
+            duration = time.perf_counter() - started if started is not None else None
+            for limiter in acquired:
+                limiter.release(duration)
+
+
+admission_controller = AdmissionController(
+    max_concurrency=settings.admission.max_concurrency,
+    queue_size=settings.admission.queue_size,
+    route_limits=settings.admission.route_limits,
+    exempt=settings.admission.exempt,
+    queue_timeout=settings.admission.queue_timeout_ms / 1000,
+)
@@ -1,36 +1,81 @@
-from fastapi import APIRouter, Depends, File, HTTPException, Request, UploadFile, status
+import asyncio
+import hashlib
+import threading
+from typing import Literal, Optional
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+    status,
+)
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
 
-from app.base_models import Tweet
+from app.admission import admission_controller
+from app.base_models import Tweet, User
+from app.batch import BatchAborted, run_batch
 from app.basic_schema import (
+    AdmissionMetricsRead,
+    BatchCreate,
+    BatchRead,
+    FollowPage,
+    JobMetricsRead,
+    LikesPage,
     MediaRead,
+    NotificationsPage,
+    PoolMetricsRead,
+    PresignedUploadComplete,
+    PresignedUploadCreate,
+    PresignedUploadRead,
     ResultBase,
     TweetCreate,
     TweetRead,
+    TrendsRead,
     TweetResponse,
+    UploadCreate,
+    UploadFinalize,
+    UploadRead,
     UserRead,
 )
-from app.config import logger
+from app.compression import negotiate
+from app.config import logger, settings
 from app.db_helper import db_helper
 from app.error_handling import handle_api_errors
+from app.events import broker, event_stream
+from app.idempotency import fingerprint, idempotency_store
+from app.jobs import job_queue
+from app.notifications import get_notifications, mark_all_read
+from app.profiler import ProfilerBusy, SamplingProfiler, is_admin
+from app.sharding import shards
 from app.functions import (
-    add_like,
-    check_follow_user,
-    create_follow_to_user,
-    delete_following_by_id,
-    delete_like,
-    delete_tweet_by_id,
+    complete_media_upload,
+    follow_user,
+    get_feed,
+    get_follow_page,
     get_media,
     get_tweet_by_id,
-    get_tweets_info,
-    get_user_by_id,
+    get_tweet_likes,
     get_user_id_by_api_key,
+    get_user_info,
+    like_tweet,
+    media_name,
+    post_tweet,
+    presign_media_upload,
+    remove_tweet,
     save_media,
-    update_tweet_with_media,
-    write_new_tweet,
+    stream_user_tweets,
+    unfollow_user,
+    unlike_tweet,
 )
+from app.trends import trend_tracker
+from app.uploads import append_chunk, create_upload, finalize_upload, get_upload
 
 router = APIRouter(prefix="/api", tags=["Работа с микроблогами"])
 
@@ -55,22 +100,17 @@ test_user = {
 @handle_api_errors()
 async def get_users_me(
     request: Request,
+    response: Response,
     session: AsyncSession = Depends(db_helper.session_getter),
 ):
 
     api_key: str = request.headers.get("api-key")
     user_id = await get_user_id_by_api_key(session=session, api_key=api_key)
-    if user_id:
-        user = await get_user_by_id(session=session, user_id=user_id)
-        if user:
-            logger.info("Получен юзер")
-            return {"result": True, "user": user}
-        else:
-            logger.error(f"Пользователь с id={id} не найден")
-            raise HTTPException(status_code=401, detail="Ошибка ввода данных")
-    else:
+    if not user_id:
         logger.error(f"id={id} не найден")
         raise HTTPException(status_code=401, detail="Ошибка ввода данных")
+    user = await get_user_info(session=session, user_id=user_id)
+    return negotiate(request, response, UserRead, user)
 
 
 @router.get(
@@ -82,38 +122,107 @@ async def get_users_me(
 )
 @handle_api_errors()
 async def get_user(
+    request: Request,
+    response: Response,
     id: int,
     session: AsyncSession = Depends(db_helper.session_getter),
 ):
 
-    user = await get_user_by_id(session=session, user_id=id)
-    if user:
-        logger.info("Получен юзер")
-        return {"result": True, "user": user}
-    else:
+    user = await get_user_info(session=session, user_id=id)
+    return negotiate(request, response, UserRead, user)
+
+
+@router.get(
+    "/users/{id}/{direction}",
+    summary="Подписчики или подписки пользователя",
+    description="Постраничный список подписчиков (followers) или подписок (following) "
+    "пользователя, от новых к старым. Следующая страница запрашивается с cursor=next_cursor",
+    response_model=FollowPage,
+    status_code=200,
+)
+@handle_api_errors()
+async def get_user_follows(
+    id: int,
+    direction: Literal["followers", "following"],
+    limit: int = Query(
+        settings.users.follow_page_size, ge=1, le=settings.users.follow_max_page_size
+    ),
+    cursor: Optional[int] = Query(None, ge=1),
+    session: AsyncSession = Depends(db_helper.session_getter),
+):
+    if await session.get(User, id) is None:
         logger.error(f"Пользователь с id={id} не найден")
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+    users, next_cursor = await get_follow_page(
+        session=session, user_id=id, direction=direction, limit=limit, cursor=cursor
+    )
+    return {"result": True, "users": users, "next_cursor": next_cursor}
+
+
+@router.get(
+    "/users/{id}/tweets/export",
+    summary="Выгрузка твитов пользователя",
+    description="Потоковая выгрузка всех твитов пользователя в формате NDJSON",
+    status_code=200,
+)
+@handle_api_errors()
+async def export_user_tweets(
+    request: Request,
+    id: int,
+    session: AsyncSession = Depends(db_helper.session_getter),
+):
+    api_key: str = request.headers.get("api-key")
+    user_id = await get_user_id_by_api_key(session=session, api_key=api_key)
+    if not user_id:
+        logger.error(f"id={id} не найден")
         raise HTTPException(status_code=401, detail="Ошибка ввода данных")
+    user = await session.get(User, id)
+    # выгрузка идет в своей сессии, эта больше не нужна
+    await session.close()
+    if not user:
+        logger.error(f"Пользователь с id={id} не найден")
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+
+    async def export():
+        async with db_helper.session_factory() as export_session:
+            async for chunk in stream_user_tweets(session=export_session, user_id=id):
+                yield chunk
+
+    logger.info(f"Начали выгрузку твитов пользователя {id}")
+    return StreamingResponse(
+        export(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="tweets_{id}.ndjson"'},
+    )
 
 
 @router.get(
     "/tweets",
     summary="Получение твитов",
-    description="Получение твита - id, контент, ссылки на картинки, автор, и лайки",
+    description="Получение твита - id, контент, ссылки на картинки, автор, и лайки. "
+    "Если база не отвечает, отдается последняя удачная лента с заголовками Age и "
+    "X-Feed-Stale",
     response_model=TweetRead,
     status_code=200,
 )
 @handle_api_errors()
 async def get_tweets(
-    request: Request, session: AsyncSession = Depends(db_helper.session_getter)
+    request: Request,
+    response: Response,
+    session: AsyncSession = Depends(db_helper.session_getter),
 ):
     logger.info("Начался процесс получение твитов")
 
     api_key: str = request.headers.get("api-key")
     user_id = await get_user_id_by_api_key(session=session, api_key=api_key)
     if user_id:
-        tweets = await get_tweets_info(session=session)
+        tweets, age = await get_feed(session=session, user_id=user_id)
+        if age is not None:
+            # база не ответила вовремя: отдана последняя удачная лента
+            response.headers["Age"] = str(int(age))
+            response.headers["X-Feed-Stale"] = "1"
         logger.info(f"Получили в функцию get_tweets твиты {tweets}")
-        return tweets
+        return negotiate(request, response, TweetRead, tweets)
     else:
         logger.error(f"id={id} не найден")
         raise HTTPException(status_code=401, detail="Ошибка ввода данных")
@@ -122,13 +231,15 @@ async def get_tweets(
 @router.post(
     "/tweets",
     summary="Публикация твита",
-    description="Эндпоинт для публикации твита",
+    description="Эндпоинт для публикации твита. С заголовком Idempotency-Key "
+    "повтор запроса возвращает ответ первого и не создает дубликат",
     response_model=TweetResponse,
     status_code=200,
 )
 @handle_api_errors()
 async def create_tweet(
     request: Request,
+    response: Response,
     tweet_data: TweetCreate,
     session: AsyncSession = Depends(db_helper.session_getter),
 ):
@@ -139,29 +250,61 @@ async def create_tweet(
     if not user_id:
         logger.error(f"id={id} не найден")
         raise HTTPException(status_code=401, detail="Ошибка ввода данных")
-    tweet_id: int = await write_new_tweet(
-        user_id=user_id, content=tweet_data.tweet_data, session=session
-    )
-    image_ids: list[int] = tweet_data.image_ids
-    if image_ids:
-        logger.info(f"обнаружены изображения {image_ids}")
-        await update_tweet_with_media(
-            media_ids=image_ids, tweet_id=tweet_id, session=session
+    digest = fingerprint("tweet", tweet_data.model_dump_json())
+    async with idempotency_store.request(request, response, user_id, digest) as idempotent:
+        if idempotent.response is not None:
+            return idempotent.response
+        after_commit: list = []
+        result = await post_tweet(
+            session=session,
+            user_id=user_id,
+            tweet_data=tweet_data,
+            after_commit=after_commit,
         )
-    logger.info("Твит добавлен")
-    return {"result": True, "tweet_id": tweet_id}
+        for action in after_commit:
+            action()
+        return idempotent.save(result)
+
+
+@router.get(
+    "/trends",
+    summary="Получение трендов",
+    description="Самые популярные хэштеги и упоминания за последнее время",
+    response_model=TrendsRead,
+    status_code=200,
+)
+@handle_api_errors()
+async def get_trends(
+    request: Request,
+    limit: int = Query(10, ge=1, le=100),
+    kind: Literal["hashtag", "mention"] | None = None,
+    session: AsyncSession = Depends(db_helper.session_getter),
+):
+    api_key: str = request.headers.get("api-key")
+    user_id = await get_user_id_by_api_key(session=session, api_key=api_key)
+    if not user_id:
+        logger.error(f"id={id} не найден")
+        raise HTTPException(status_code=401, detail="Ошибка ввода данных")
+    trends = [
+        {"tag": tag, "count": count}
+        for tag, count in trend_tracker.top(limit=limit, kind=kind)
+    ]
+    logger.info(f"Получены тренды {trends}")
+    return {"result": True, "trends": trends}
 
 
 @router.post(
     "/medias",
     summary="Добавление изображения к твиту",
-    description="Эндпоинт для добавления изображения к твиту",
+    description="Эндпоинт для добавления изображения к твиту. С заголовком "
+    "Idempotency-Key повтор запроса не загружает файл заново",
     response_model=MediaRead,
     status_code=201,
 )
 @handle_api_errors()
 async def post_media_with_tweet(
     request: Request,
+    response: Response,
     file: UploadFile = File(...),
     session: AsyncSession = Depends(db_helper.session_getter),
 ):
@@ -170,21 +313,187 @@ async def post_media_with_tweet(
     logger.info(f"Получен запрос POST MEDIA для API key: {api_key}")
     user_id = await get_user_id_by_api_key(session=session, api_key=api_key)
     if user_id:
-        file_url = f"{api_key}_{file.filename}"
-        media = await get_media(file_url=file_url, session=session)
-        if media:
-            return {"result": True, "media_id": media.id}
-        else:
-            media_id = await save_media(
-                session=session, file=file, file_url=file_url, user_id=user_id
-            )
-            return {"result": True, "media_id": media_id}
+        # файл читается один раз: и для ключа идемпотентности, и для хранилища
+        data = await file.read()
+        content_hash = hashlib.sha256(data).hexdigest()
+        digest = fingerprint("media", file.filename, content_hash)
+        async with idempotency_store.request(request, response, user_id, digest) as idempotent:
+            if idempotent.response is not None:
+                return idempotent.response
+            file_url = media_name(user_id, file.filename, content_hash)
+            media = await get_media(file_url=file_url, session=session, user_id=user_id)
+            if media:
+                return idempotent.save({"result": True, "media_id": media.id})
+            else:
+                media_id = await save_media(
+                    session=session, data=data, file_url=file_url, user_id=user_id
+                )
+                return idempotent.save({"result": True, "media_id": media_id})
 
     else:
         logger.error(f"id={id} не найден")
         raise HTTPException(status_code=401, detail="Ошибка ввода данных")
 
 
+@router.post(
+    "/medias/presigned",
+    summary="Ссылка для прямой загрузки изображения",
+    description="Клиент загружает файл по ссылке прямо в хранилище, минуя "
+    "приложение, затем вызывает /medias/presigned/complete",
+    response_model=PresignedUploadRead,
+    status_code=200,
+)
+@handle_api_errors()
+async def post_media_presigned(
+    request: Request,
+    upload_data: PresignedUploadCreate,
+    session: AsyncSession = Depends(db_helper.session_getter),
+):
+    api_key: str = request.headers.get("api-key")
+    user_id = await get_user_id_by_api_key(session=session, api_key=api_key)
+    if not user_id:
+        logger.error(f"Пользователь для API key: {api_key} не найден")
+        raise HTTPException(status_code=401, detail="Ошибка ввода данных")
+    return presign_media_upload(user_id=user_id, filename=upload_data.filename)
+
+
+@router.post(
+    "/medias/presigned/complete",
+    summary="Завершение прямой загрузки изображения",
+    description="Создает картинку для файла, загруженного по ссылке, "
+    "как POST /api/medias",
+    response_model=MediaRead,
+    status_code=201,
+)
+@handle_api_errors()
+async def complete_media_presigned(
+    request: Request,
+    upload_data: PresignedUploadComplete,
+    session: AsyncSession = Depends(db_helper.session_getter),
+):
+    api_key: str = request.headers.get("api-key")
+    user_id = await get_user_id_by_api_key(session=session, api_key=api_key)
+    if not user_id:
+        logger.error(f"Пользователь для API key: {api_key} не найден")
+        raise HTTPException(status_code=401, detail="Ошибка ввода данных")
+    media_id = await complete_media_upload(
+        session=session,
+        user_id=user_id,
+        file_url=upload_data.name,
+    )
+    return {"result": True, "media_id": media_id}
+
+
+@router.post(
+    "/medias/uploads",
+    summary="Начало загрузки изображения по частям",
+    description="Создает загрузку на size байт. Части отправляются PUT с offset, "
+    "после последней - finalize с sha256 файла",
+    response_model=UploadRead,
+    status_code=201,
+)
+@handle_api_errors()
+async def post_media_upload(
+    request: Request,
+    upload_data: UploadCreate,
+    session: AsyncSession = Depends(db_helper.session_getter),
+):
+    api_key: str = request.headers.get("api-key")
+    user_id = await get_user_id_by_api_key(session=session, api_key=api_key)
+    if not user_id:
+        logger.error(f"Пользователь для API key: {api_key} не найден")
+        raise HTTPException(status_code=401, detail="Ошибка ввода данных")
+    return await create_upload(
+        session=session,
+        user_id=user_id,
+        filename=upload_data.filename,
+        size=upload_data.size,
+    )
+
+
+@router.get(
+    "/medias/uploads/{upload_id}",
+    summary="Состояние загрузки",
+    description="Сколько байт уже принято: с этого offset продолжается загрузка",
+    response_model=UploadRead,
+    status_code=200,
+)
+@handle_api_errors()
+async def get_media_upload(
+    request: Request,
+    upload_id: str,
+    session: AsyncSession = Depends(db_helper.session_getter),
+):
+    api_key: str = request.headers.get("api-key")
+    user_id = await get_user_id_by_api_key(session=session, api_key=api_key)
+    if not user_id:
+        logger.error(f"Пользователь для API key: {api_key} не найден")
+        raise HTTPException(status_code=401, detail="Ошибка ввода данных")
+    return await get_upload(session=session, upload_id=upload_id, user_id=user_id)
+
+
+@router.put(
+    "/medias/uploads/{upload_id}",
+    summary="Загрузка части изображения",
+    description="Тело запроса - байты файла начиная с offset. При обрыве "
+    "соединения принятые байты сохраняются",
+    response_model=UploadRead,
+    status_code=200,
+)
+@handle_api_errors()
+async def put_media_upload_chunk(
+    request: Request,
+    upload_id: str,
+    offset: int = Query(..., ge=0),
+    session: AsyncSession = Depends(db_helper.session_getter),
+):
+    api_key: str = request.headers.get("api-key")
+    user_id = await get_user_id_by_api_key(session=session, api_key=api_key)
+    if not user_id:
+        logger.error(f"Пользователь для API key: {api_key} не найден")
+        raise HTTPException(status_code=401, detail="Ошибка ввода данных")
+    return await append_chunk(
+        session=session,
+        upload_id=upload_id,
+        user_id=user_id,
+        offset=offset,
+        chunks=request.stream(),
+    )
+
+
+@router.post(
+    "/medias/uploads/{upload_id}/finalize",
+    summary="Завершение загрузки изображения",
+    description="Проверяет sha256 файла и создает картинку, как POST /api/medias",
+    response_model=MediaRead,
+    status_code=201,
+)
+@handle_api_errors()
+async def finalize_media_upload(
+    request: Request,
+    response: Response,
+    upload_id: str,
+    finalize_data: UploadFinalize,
+    session: AsyncSession = Depends(db_helper.session_getter),
+):
+    api_key: str = request.headers.get("api-key")
+    user_id = await get_user_id_by_api_key(session=session, api_key=api_key)
+    if not user_id:
+        logger.error(f"Пользователь для API key: {api_key} не найден")
+        raise HTTPException(status_code=401, detail="Ошибка ввода данных")
+    digest = fingerprint("upload", upload_id, finalize_data.checksum)
+    async with idempotency_store.request(request, response, user_id, digest) as idempotent:
+        if idempotent.response is not None:
+            return idempotent.response
+        media_id = await finalize_upload(
+            session=session,
+            upload_id=upload_id,
+            user_id=user_id,
+            checksum=finalize_data.checksum,
+        )
+        return idempotent.save({"result": True, "media_id": media_id})
+
+
 @router.post(
     "/tweets/{id}/likes",
     summary="Добавление лайка к твиту с определенному ID",
@@ -200,21 +509,45 @@ async def post_like_to_tweet(
     api_key: str = request.headers.get("api-key")
     logger.info(f"Получен запрос POST LIKE для tweet ID: {id}, API key: {api_key}")
     user_id = await get_user_id_by_api_key(session=session, api_key=api_key)
-    if user_id:
-        tweet: Tweet = await get_tweet_by_id(session=session, tweet_id=id)
-        if tweet:
-            await add_like(user_id=user_id, tweet_id=id, session=session)
-            logger.info(
-                f"Выполнен запрос POST LIKE для tweet ID: {id}, user ID: {user_id}"
-            )
-            return {"result": True}
-        else:
-            logger.error(
-                f"Запрос POST LIKE для tweet ID: {id}, user ID: {user_id} не выполнен. Твит не найден"
-            )
-    else:
+    if not user_id:
         logger.error(f"id={id} не найден")
         raise HTTPException(status_code=401, detail="Ошибка ввода данных")
+    after_commit: list = []
+    result = await like_tweet(
+        session=session, user_id=user_id, tweet_id=id, after_commit=after_commit
+    )
+    for action in after_commit:
+        action()
+    return result
+
+
+@router.get(
+    "/tweets/{id}/likes",
+    summary="Список лайков твита",
+    description="Постраничный список лайкнувших твит, от новых к старым. "
+    "Следующая страница запрашивается с cursor=next_cursor",
+    response_model=LikesPage,
+    status_code=200,
+)
+@handle_api_errors()
+async def get_likes_of_tweet(
+    request: Request,
+    id: int,
+    limit: int = Query(
+        settings.tweets.likes_page_size, ge=1, le=settings.tweets.likes_max_page_size
+    ),
+    cursor: Optional[int] = Query(None, ge=1),
+    session: AsyncSession = Depends(db_helper.session_getter),
+):
+    api_key: str = request.headers.get("api-key")
+    user_id = await get_user_id_by_api_key(session=session, api_key=api_key)
+    if not user_id:
+        logger.error(f"id={id} не найден")
+        raise HTTPException(status_code=401, detail="Ошибка ввода данных")
+    tweet: Tweet = await get_tweet_by_id(session=session, tweet_id=id)
+    if not tweet:
+        raise HTTPException(status_code=404, detail="Твит не найден")
+    return await get_tweet_likes(tweet_id=id, session=session, limit=limit, cursor=cursor)
 
 
 @router.delete(
@@ -233,24 +566,16 @@ async def delete_likes_from_tweet(
     api_key: str = request.headers.get("api-key")
     logger.info(f"Получен запрос DELETE Like для tweet ID: {id}, API key: {api_key}")
     user_id = await get_user_id_by_api_key(session=session, api_key=api_key)
-    if user_id:
-        tweet: Tweet = await get_tweet_by_id(session=session, tweet_id=id)
-        if tweet:
-            await delete_like(user_id=user_id, tweet_id=id, session=session)
-            logger.info(f"Лайк удален")
-            return {"result": True}
-        else:
-            logger.info(
-                f"Пользователь id {id} не является автором твита. Удаление запрещено"
-            )
-            raise HTTPException(
-                status_code=403,
-                detail="Ошибка на стороне сервера",
-            )
-
-    else:
+    if not user_id:
         logger.error(f"id={id} не найден")
         raise HTTPException(status_code=401, detail="Ошибка ввода данных")
+    after_commit: list = []
+    result = await unlike_tweet(
+        session=session, user_id=user_id, tweet_id=id, after_commit=after_commit
+    )
+    for action in after_commit:
+        action()
+    return result
 
 
 @router.delete(
@@ -270,26 +595,10 @@ async def delete_tweet(
     api_key: str = request.headers.get("api-key")
     logger.info(f"Получен запрос DELETE для tweet ID: {id}, API key: {api_key}")
     user_id = await get_user_id_by_api_key(session=session, api_key=api_key)
-    if user_id:
-        tweet: Tweet = await get_tweet_by_id(session=session, tweet_id=id)
-        if tweet:
-            if tweet.user_id == user_id:
-                await delete_like(user_id=user_id, tweet_id=id, session=session)
-                logger.info(f"Лайк удален")
-                await delete_tweet_by_id(tweet_id=id, session=session)
-                logger.info("Твит удален")
-                return {"result": True}
-        else:
-            logger.info(
-                f"Пользователь id {id} не является автором твита. Удаление запрещено"
-            )
-            raise HTTPException(
-                status_code=403,
-                detail="Ошибка на стороне сервера",
-            )
-    else:
+    if not user_id:
         logger.error(f"id={id} не найден")
         raise HTTPException(status_code=401, detail="Ошибка ввода данных")
+    return await remove_tweet(session=session, user_id=user_id, tweet_id=id)
 
 
 @router.post(
@@ -315,25 +624,17 @@ async def post_follow_to_user(
             logger.error(f"id={id} не найден")
             raise HTTPException(status_code=401, detail="Ошибка ввода данных")
 
-        is_already_following = await check_follow_user(
-            user_id=follower_id, following_id=id, session=session
+        after_commit: list = []
+        result = await follow_user(
+            session=session,
+            follower_id=follower_id,
+            following_id=id,
+            after_commit=after_commit,
         )
-
-        if is_already_following:
-            logger.info(f"Пользователь {follower_id} уже подписан на {id}")
-            raise HTTPException(
-                status_code=401, detail="Запрос не обработан. Пользователь уже подписан"
-            )
-
-        success = await create_follow_to_user(
-            follower_id=follower_id, following_id=id, session=session
-        )
-
-        if not success:
-            logger.error(f"Ошибка создания подписки {follower_id} на {id}")
-            raise HTTPException(status_code=500, detail="Ошибка создания подписки")
-
-        return {"result": True}
+    # события уходят только после фиксации транзакции
+    for action in after_commit:
+        action()
+    return result
 
 
 @router.delete(
@@ -349,25 +650,229 @@ async def delete_follow_from_user(
     id: int,
     session: AsyncSession = Depends(db_helper.session_getter),
 ):
+    async with session.begin():
+        api_key: str = request.headers.get("api-key")
+        logger.info(f"Получен запрос DELETE для user ID: {id}, API key: {api_key}")
+        follower_id = await get_user_id_by_api_key(session=session, api_key=api_key)
+        if not follower_id:
+            logger.error(f"id={id} не найден")
+            raise HTTPException(status_code=401, detail="Ошибка получения ID")
+        after_commit: list = []
+        result = await unfollow_user(
+            session=session,
+            follower_id=follower_id,
+            following_id=id,
+            after_commit=after_commit,
+        )
+    # события уходят только после фиксации транзакции
+    for action in after_commit:
+        action()
+    return result
 
-    api_key: str = request.headers.get("api-key")
-    logger.info(f"Получен запрос DELETE для user ID: {id}, API key: {api_key}")
-    follower_id = await get_user_id_by_api_key(session=session, api_key=api_key)
-    if not follower_id:
+
+@router.get(
+    "/stream",
+    summary="Поток событий",
+    description="Server-Sent Events: новые твиты, лайки и подписки без опроса ленты. "
+    "EventSource не умеет передавать заголовки, поэтому ключ можно передать "
+    "параметром api_key",
+    status_code=200,
+)
+@handle_api_errors()
+async def get_event_stream(
+    request: Request,
+    api_key: str | None = None,
+    session: AsyncSession = Depends(db_helper.session_getter),
+):
+    api_key = request.headers.get("api-key") or api_key
+    user_id = await get_user_id_by_api_key(session=session, api_key=api_key)
+    # соединение возвращается в пул сразу, поток живет без него
+    await session.close()
+    if not user_id:
         logger.error(f"id={id} не найден")
-        raise HTTPException(status_code=401, detail="Ошибка получения ID")
-    is_already_following = await check_follow_user(
-        user_id=follower_id, following_id=id, session=session
+        raise HTTPException(status_code=401, detail="Ошибка ввода данных")
+    subscription = broker.subscribe(user_id=user_id)
+    return StreamingResponse(
+        event_stream(
+            broker=broker,
+            subscription=subscription,
+            is_disconnected=request.is_disconnected,
+            heartbeat=settings.stream.heartbeat_seconds,
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
-    if is_already_following:
-        logger.info(f"Пользователь {follower_id} подписан на {id}, подписка подтврждена")
-        await delete_following_by_id(
-            follower_id=follower_id, following_id=id, session=session
-        )
-        return {"result": True}
-    else:
-        logger.info(
-            f"Пользователь {follower_id} не подписан на {id}, удаление невозможно"
+
+@router.post(
+    "/batch",
+    summary="Пакет операций",
+    description="Выполняет несколько операций за один запрос: одна проверка api ключа "
+    "и одна сессия. При atomic=true все операции применяются или откатываются целиком; "
+    "при шардировании atomic недоступен",
+    response_model=BatchRead,
+    status_code=200,
+)
+@handle_api_errors()
+async def post_batch(request: Request, batch: BatchCreate):
+    api_key: str = request.headers.get("api-key")
+    logger.info(f"Получен пакет из {len(batch.operations)} операций, atomic={batch.atomic}")
+    if batch.atomic and shards.enabled:
+        # сессии шардов фиксируются сами, откатить их вместе с пакетом нельзя
+        raise HTTPException(
+            status_code=422, detail="atomic недоступен при шардировании"
         )
-        raise HTTPException(status_code=401, detail="Подписки не существует")
+    after_commit: list = []
+    session_context = (
+        db_helper.transaction_session() if batch.atomic else db_helper.session_factory()
+    )
+    try:
+        async with session_context as session:
+            user_id = await get_user_id_by_api_key(session=session, api_key=api_key)
+            if not user_id:
+                logger.error(f"id={id} не найден")
+                raise HTTPException(status_code=401, detail="Ошибка ввода данных")
+            results = await run_batch(
+                session=session,
+                user_id=user_id,
+                operations=batch.operations,
+                atomic=batch.atomic,
+                after_commit=after_commit,
+            )
+    except BatchAborted as e:
+        logger.info("Пакет операций откатан")
+        return {"result": False, "results": e.results}
+
+    for action in after_commit:
+        action()
+    return {
+        "result": all(result["status"] < 400 for result in results),
+        "results": results,
+    }
+
+
+@router.get(
+    "/admin/jobs",
+    summary="Метрики очереди задач",
+    description="Глубина очереди фоновых задач и задержки их выполнения в этом воркере. "
+    "Только для администраторов",
+    response_model=JobMetricsRead,
+    status_code=200,
+)
+@handle_api_errors()
+async def get_job_metrics(
+    request: Request,
+    session: AsyncSession = Depends(db_helper.session_getter),
+):
+    if not is_admin(request.headers.get("api-key")):
+        raise HTTPException(status_code=403, detail="Доступ только для администраторов")
+    metrics = await job_queue.metrics(session=session)
+    return {"result": True, **metrics}
+
+
+@router.get(
+    "/admin/profile",
+    summary="Профилирование воркера",
+    description="Сэмплирующий профилировщик на seconds секунд по потоку этого воркера. "
+    "Ответ - collapsed stacks для flamegraph.pl или speedscope. Только для администраторов",
+    response_class=PlainTextResponse,
+    status_code=200,
+)
+@handle_api_errors()
+async def profile_worker(
+    request: Request,
+    seconds: float = Query(10, gt=0),
+):
+    if not settings.profiler.enabled:
+        raise HTTPException(status_code=404, detail="Профилирование выключено")
+    if not is_admin(request.headers.get("api-key")):
+        raise HTTPException(status_code=403, detail="Доступ только для администраторов")
+    profiler = SamplingProfiler(
+        thread_id=threading.get_ident(), interval=settings.profiler.interval_ms / 1000
+    )
+    try:
+        profiler.start()
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    try:
+        await asyncio.sleep(min(seconds, settings.profiler.max_seconds))
+    finally:
+        stacks = profiler.stop()
+    return PlainTextResponse(stacks)
+
+
+@router.get(
+    "/admin/pool",
+    summary="Метрики пула соединений",
+    description="Занятость пула соединений с базой и ожидание соединения в этом воркере. "
+    "Только для администраторов",
+    response_model=PoolMetricsRead,
+    status_code=200,
+)
+@handle_api_errors()
+async def get_pool_metrics(request: Request):
+    if not is_admin(request.headers.get("api-key")):
+        raise HTTPException(status_code=403, detail="Доступ только для администраторов")
+    return {"result": True, **db_helper.pool_metrics()}
+
+
+@router.get(
+    "/admin/admission",
+    summary="Метрики ограничения нагрузки",
+    description="Занятость лимитов, очередь и число отказов 503 в этом воркере. "
+    "Только для администраторов",
+    response_model=AdmissionMetricsRead,
+    status_code=200,
+)
+@handle_api_errors()
+async def get_admission_metrics(request: Request):
+    if not is_admin(request.headers.get("api-key")):
+        raise HTTPException(status_code=403, detail="Доступ только для администраторов")
+    return {"result": True, "limiters": admission_controller.metrics()}
+
+
+@router.get(
+    "/notifications",
+    summary="Уведомления пользователя",
+    description="Постраничный список уведомлений о лайках и подписках, от новых к старым, "
+    "и количество непрочитанных. Следующая страница запрашивается с cursor=next_cursor",
+    response_model=NotificationsPage,
+    status_code=200,
+)
+@handle_api_errors()
+async def get_user_notifications(
+    request: Request,
+    limit: int = Query(
+        settings.notifications.page_size, ge=1, le=settings.notifications.max_page_size
+    ),
+    cursor: Optional[int] = Query(None, ge=1),
+    session: AsyncSession = Depends(db_helper.session_getter),
+):
+    api_key: str = request.headers.get("api-key")
+    user_id = await get_user_id_by_api_key(session=session, api_key=api_key)
+    if not user_id:
+        logger.error(f"id={id} не найден")
+        raise HTTPException(status_code=401, detail="Ошибка ввода данных")
+    return await get_notifications(
+        session=session, user_id=user_id, limit=limit, cursor=cursor
+    )
+
+
+@router.post(
+    "/notifications/read",
+    summary="Прочитать уведомления",
+    description="Отмечает все уведомления пользователя прочитанными",
+    response_model=ResultBase,
+    status_code=200,
+)
+@handle_api_errors()
+async def read_notifications(
+    request: Request, session: AsyncSession = Depends(db_helper.session_getter)
+):
+    api_key: str = request.headers.get("api-key")
+    user_id = await get_user_id_by_api_key(session=session, api_key=api_key)
+    if not user_id:
+        logger.error(f"id={id} не найден")
+        raise HTTPException(status_code=401, detail="Ошибка ввода данных")
+    await mark_all_read(session=session, user_id=user_id)
+    return {"result": True}
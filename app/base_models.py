@@ -2,7 +2,20 @@ import os
 import sys
 from datetime import datetime
 
-from sqlalchemy import DateTime, ForeignKey, Integer, MetaData, String, UniqueConstraint
+from sqlalchemy import (
+    Boolean,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    MetaData,
+    String,
+    Text,
+    UniqueConstraint,
+    text,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 from sqlalchemy.orm import DeclarativeBase, Mapped, backref, mapped_column, relationship
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -57,6 +70,9 @@ class Follow(Base):
         UniqueConstraint(
             "follower_id", "following_id", name="unique_follow_relationship"
         ),
+        # постраничный вывод подписчиков и подписок по id
+        Index("ix_follow_following_id_id", "following_id", "id"),
+        Index("ix_follow_follower_id_id", "follower_id", "id"),
     )
 
     def __repr__(self):
@@ -64,40 +80,83 @@ class Follow(Base):
 
 
 class Tweet(Base):
-    """Модель, описывающая твиты"""
+    """
+    Модель, описывающая твиты.
+
+    Таблица секционирована по месяцам created_at (см. app.partitions), поэтому
+    created_at входит в первичный ключ, а внешние ключи на tweets.id невозможны:
+    связи с лайками, картинками и тегами описаны только на уровне ORM.
+    """
 
     __tablename__ = "tweets"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     # текст коммента
     content: Mapped[str] = mapped_column(String(280), nullable=False)
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, primary_key=True, default=datetime.now
+    )
     # пользователь, поставивший лайк
-    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("users.id"), nullable=False, index=True
+    )
+    # оценка уникальных просмотров и ее скетч HyperLogLog (см. app.views)
+    views: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    views_sketch: Mapped[bytes] = mapped_column(LargeBinary, nullable=True)
 
     author = relationship("User", back_populates="tweets")
     # Отношение "один ко многим" с моделью Like (лайки твита)
     likes = relationship(
-        "Like", back_populates="tweet", cascade="all, delete-orphan, delete"
+        "Like",
+        primaryjoin="Tweet.id == foreign(Like.tweet_id)",
+        back_populates="tweet",
+        cascade="all, delete-orphan, delete",
+    )
+    image = relationship(
+        "Image",
+        primaryjoin="Tweet.id == foreign(Image.tweet_id)",
+        back_populates="tweet",
+        cascade="all, delete-orphan",
     )
-    image = relationship("Image", back_populates="tweet", cascade="all, delete-orphan")
+    tags = relationship(
+        "TweetTag",
+        primaryjoin="Tweet.id == foreign(TweetTag.tweet_id)",
+        back_populates="tweet",
+        cascade="all, delete-orphan",
+    )
+
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
 
     def __repr__(self):
         return f"<Tweet {self.content[:20]}>"
 
 
 class Like(Base):
+    """Модель, описывающая лайки. Секционирована по месяцам created_at"""
+
     __tablename__ = "likes"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), nullable=False)
-    tweet_id: Mapped[int] = mapped_column(
-        Integer, ForeignKey("tweets.id"), nullable=False
+    tweet_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, primary_key=True, default=datetime.now
     )
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
 
     user = relationship("User", back_populates="likes")
-    tweet = relationship("Tweet", back_populates="likes")
+    tweet = relationship(
+        "Tweet",
+        primaryjoin="Tweet.id == foreign(Like.tweet_id)",
+        back_populates="likes",
+    )
+
+    __table_args__ = (
+        # постраничный вывод лайков твита по id
+        Index("ix_likes_tweet_id_id", "tweet_id", "id"),
+        # лайкнутые пользователем твиты (см. app.liked_index)
+        Index("ix_likes_user_id_tweet_id", "user_id", "tweet_id"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
     def __repr__(self):
         return f"<Like user_id={self.user_id} tweet_id={self.tweet_id}>"
@@ -108,9 +167,187 @@ class Image(Base):
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     url: Mapped[str] = mapped_column(String(255), nullable=False)
-    tweet_id: Mapped[int] = mapped_column(Integer, ForeignKey("tweets.id"), nullable=True)
-
-    tweet = relationship("Tweet", back_populates="image")
+    tweet_id: Mapped[int] = mapped_column(Integer, nullable=True, index=True)
+    # загрузивший пользователь: по нему картинка лежит на его шарде (app.sharding)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), nullable=True)
+
+    tweet = relationship(
+        "Tweet",
+        primaryjoin="Tweet.id == foreign(Image.tweet_id)",
+        back_populates="image",
+    )
 
     def __repr__(self):
         return f"<Image {self.url}>"
+
+
+class TweetTag(Base):
+    """Модель, описывающая хэштеги и упоминания, извлеченные из твита"""
+
+    __tablename__ = "tweet_tags"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    tweet_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    # hashtag или mention
+    kind: Mapped[str] = mapped_column(String(10), nullable=False)
+    # тег в нижнем регистре, без # и @
+    tag: Mapped[str] = mapped_column(String(100), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+
+    tweet = relationship(
+        "Tweet",
+        primaryjoin="Tweet.id == foreign(TweetTag.tweet_id)",
+        back_populates="tags",
+    )
+
+    __table_args__ = (
+        UniqueConstraint("tweet_id", "kind", "tag", name="unique_tweet_tag"),
+        Index("ix_tweet_tags_kind_tag", "kind", "tag"),
+    )
+
+    def __repr__(self):
+        return f"<TweetTag {self.kind} {self.tag}>"
+
+
+class Job(Base):
+    """Модель, описывающая фоновую задачу в очереди"""
+
+    __tablename__ = "jobs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    # имя обработчика, см. app.jobs.job_handler
+    kind: Mapped[str] = mapped_column(String(50), nullable=False)
+    payload: Mapped[dict] = mapped_column(JSONB, nullable=False, default=dict)
+    # queued, running или failed; выполненные задачи удаляются
+    status: Mapped[str] = mapped_column(String(10), nullable=False, default="queued")
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    max_attempts: Mapped[int] = mapped_column(Integer, nullable=False)
+    run_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.now)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, nullable=False, default=datetime.now
+    )
+    started_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    last_error: Mapped[str] = mapped_column(Text, nullable=True)
+
+    __table_args__ = (
+        Index(
+            "ix_jobs_status_run_at",
+            "status",
+            "run_at",
+            postgresql_where=text("status IN ('queued', 'running')"),
+        ),
+    )
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.kind} {self.status}>"
+
+
+class Notification(Base):
+    """
+    Модель, описывающая уведомление.
+
+    События одного вида об одном объекте за bucket схлопываются в одну строку:
+    actor_count растет, в actor_ids хранятся последние участники.
+    """
+
+    __tablename__ = "notifications"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    # кому уведомление
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), nullable=False)
+    # like или follow
+    kind: Mapped[str] = mapped_column(String(10), nullable=False)
+    # твит для лайков, 0 для подписок
+    tweet_id: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # начало интервала, в котором события схлопываются
+    bucket: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    actor_ids: Mapped[list[int]] = mapped_column(ARRAY(Integer), nullable=False)
+    actor_count: Mapped[int] = mapped_column(Integer, nullable=False, default=1)
+    read: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, nullable=False, default=datetime.now
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime, nullable=False, default=datetime.now
+    )
+
+    __table_args__ = (
+        UniqueConstraint(
+            "user_id", "kind", "tweet_id", "bucket", name="unique_notification_group"
+        ),
+        Index("ix_notifications_user_id_id", "user_id", "id"),
+    )
+
+    def __repr__(self):
+        return f"<Notification {self.kind} {self.user_id} count={self.actor_count}>"
+
+
+class NotificationCounter(Base):
+    """Модель, описывающая счетчик непрочитанных уведомлений пользователя"""
+
+    __tablename__ = "notification_counters"
+
+    user_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("users.id"), primary_key=True
+    )
+    unread: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<NotificationCounter user_id={self.user_id} unread={self.unread}>"
+
+
+class IdempotencyKey(Base):
+    """
+    Модель, описывающая ключ идемпотентности запроса.
+
+    Строка без response - запрос еще выполняется; с response - повтор
+    запроса с тем же ключом получает этот ответ (см. app.idempotency).
+    """
+
+    __tablename__ = "idempotency_keys"
+
+    user_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("users.id"), primary_key=True
+    )
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    # хэш запроса: тот же ключ с другим запросом - ошибка клиента
+    fingerprint: Mapped[str] = mapped_column(String(64), nullable=False)
+    response: Mapped[dict] = mapped_column(JSONB, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, nullable=False, default=datetime.now, index=True
+    )
+
+    def __repr__(self):
+        return f"<IdempotencyKey {self.user_id} {self.key}>"
+
+
+class Upload(Base):
+    """
+    Модель, описывающая незавершенную загрузку файла по частям.
+
+    Части дописываются в файл staging_dir/<id>; received - сколько байт уже
+    принято. Пока часть принимается, загрузка закреплена за запросом:
+    lease_id - его метка, leased_until - до какого времени. После finalize
+    строка удаляется, а файл становится картинкой.
+    """
+
+    __tablename__ = "uploads"
+
+    id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    user_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("users.id"), nullable=False, index=True
+    )
+    filename: Mapped[str] = mapped_column(String(255), nullable=False)
+    size: Mapped[int] = mapped_column(Integer, nullable=False)
+    received: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    lease_id: Mapped[str] = mapped_column(String(32), nullable=True)
+    leased_until: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, nullable=False, default=datetime.now
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime, nullable=False, default=datetime.now
+    )
+
+    def __repr__(self):
+        return f"<Upload {self.id} {self.received}/{self.size}>"
@@ -1,7 +1,7 @@
 from datetime import datetime, timezone
-from typing import List, Optional
+from typing import Any, List, Literal, Optional
 
-from pydantic import BaseModel, ConfigDict, validator
+from pydantic import BaseModel, ConfigDict, Field, validator
 
 
 class ResultBase(BaseModel):
@@ -17,8 +17,13 @@ class UserBase(BaseModel):
 class UserData(BaseModel):
     id: int
     name: str
+    # первые страницы, остальное - через /users/{id}/followers и /following
     followers: List[UserBase]
     following: List[UserBase]
+    followers_count: int = 0
+    following_count: int = 0
+    followers_next_cursor: Optional[int] = None
+    following_next_cursor: Optional[int] = None
 
 
 class UserRead(BaseModel):
@@ -26,6 +31,12 @@ class UserRead(BaseModel):
     user: UserData
 
 
+class FollowPage(BaseModel):
+    result: bool
+    users: List[UserBase]
+    next_cursor: Optional[int] = None
+
+
 class UserCreate(UserBase):
     api_key: str
 
@@ -33,6 +44,13 @@ class UserCreate(UserBase):
 class LikeBase(BaseModel):
     id: int
     user_id: int
+    name: Optional[str] = None
+
+
+class LikesPage(BaseModel):
+    result: bool
+    likes: List[LikeBase]
+    next_cursor: Optional[int] = None
 
 
 class ImageBase(BaseModel):
@@ -44,7 +62,12 @@ class TweetBase(BaseModel):
     content: str
     attachments: Optional[List[str] | None] = None
     author: UserBase
+    # последние лайкнувшие, не больше tweets.likes_preview_size
     likes: List[LikeBase]
+    likes_count: int = 0
+    liked_by_me: bool = False
+    # уникальные зрители, оценка HyperLogLog; обновляется раз в views.interval_seconds
+    views: int = 0
 
 
 class TweetRead(BaseModel):
@@ -67,6 +90,42 @@ class MediaRead(BaseModel):
     media_id: int
 
 
+class UploadCreate(BaseModel):
+    filename: str = Field(..., min_length=1, max_length=200)
+    # полный размер файла в байтах
+    size: int = Field(..., gt=0)
+
+
+class UploadRead(BaseModel):
+    result: bool
+    upload_id: str
+    # сколько байт уже принято: с этого места продолжается загрузка
+    offset: int
+    size: int
+
+
+class UploadFinalize(BaseModel):
+    # sha256 всего файла, hex
+    checksum: str = Field(..., min_length=64, max_length=64)
+
+
+class PresignedUploadCreate(BaseModel):
+    filename: str = Field(..., min_length=1, max_length=200)
+
+
+class PresignedUploadRead(BaseModel):
+    result: bool
+    # по этой ссылке клиент загружает файл сам, запросом method
+    url: str
+    method: str
+    # имя файла в хранилище, его передают в /medias/presigned/complete
+    name: str
+
+
+class PresignedUploadComplete(BaseModel):
+    name: str = Field(..., min_length=1, max_length=200)
+
+
 class FollowingCreate(BaseModel):
     following_id: int
 
@@ -79,3 +138,109 @@ class LikeAdd(BaseModel):
 class FollowBase(BaseModel):
     follower_id: int
     following_id: int
+
+
+class TrendBase(BaseModel):
+    tag: str
+    count: int
+
+
+class TrendsRead(BaseModel):
+    result: bool
+    trends: List[TrendBase]
+
+
+class BatchOperation(BaseModel):
+    op: Literal[
+        "get_me",
+        "get_user",
+        "get_tweets",
+        "create_tweet",
+        "delete_tweet",
+        "like",
+        "unlike",
+        "follow",
+        "unfollow",
+    ]
+    # id из пути соответствующего эндпоинта: твит или пользователь
+    id: Optional[int] = None
+    # тело запроса соответствующего эндпоинта
+    data: Optional[dict[str, Any]] = None
+
+
+class BatchCreate(BaseModel):
+    atomic: bool = False
+    operations: List[BatchOperation] = Field(..., min_length=1, max_length=50)
+
+
+class BatchOperationResult(BaseModel):
+    status: int
+    body: dict[str, Any]
+
+
+class BatchRead(BaseModel):
+    result: bool
+    results: List[BatchOperationResult]
+
+
+class JobLatency(BaseModel):
+    p50: float
+    p95: float
+    max: float
+
+
+class JobMetricsRead(BaseModel):
+    result: bool
+    depth: dict[str, int]
+    oldest_queued_seconds: float
+    processed: int
+    retried: int
+    failed: int
+    latency_seconds: JobLatency
+
+
+class LimiterMetrics(BaseModel):
+    limit: int
+    active: int
+    waiting: int
+    admitted: int
+    # среднее время обработки, по нему предсказывается ожидание в очереди
+    service_ms: float
+    # отказы 503 по причинам: queue_full, deadline, timeout
+    shed: dict[str, int]
+
+
+class AdmissionMetricsRead(BaseModel):
+    result: bool
+    # total - общий лимит, остальные - лимиты маршрутов
+    limiters: dict[str, LimiterMetrics]
+
+
+class PoolMetricsRead(BaseModel):
+    result: bool
+    size: int
+    checked_out: int
+    overflow: int
+    checkouts: int
+    # ожидание соединения из пула, миллисекунды
+    wait_ms: JobLatency
+
+
+class NotificationBase(BaseModel):
+    id: int
+    # like или follow
+    kind: str
+    tweet_id: Optional[int] = None
+    # последние участники; всего их actor_count
+    actors: List[UserBase]
+    actor_count: int
+    read: bool
+    created_at: datetime
+    updated_at: datetime
+
+
+class NotificationsPage(BaseModel):
+    result: bool
+    notifications: List[NotificationBase]
+    unread: int
+    next_cursor: Optional[int] = None
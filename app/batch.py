@@ -0,0 +1,178 @@
+from typing import Any, Awaitable, Callable
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.basic_schema import BatchOperation, TweetCreate, UserRead
+from app.config import logger
+from app.functions import (
+    AfterCommit,
+    follow_user,
+    get_feed,
+    get_user_info,
+    like_tweet,
+    post_tweet,
+    remove_tweet,
+    unfollow_user,
+    unlike_tweet,
+)
+
+Handler = Callable[
+    [AsyncSession, int, BatchOperation, AfterCommit], Awaitable[dict[str, Any]]
+]
+
+
+class BatchAborted(Exception):
+    """Операция атомарного пакета завершилась ошибкой, транзакция откатывается"""
+
+    def __init__(self, results: list[dict[str, Any]]) -> None:
+        super().__init__("Пакет операций откатан")
+        self.results = results
+
+
+def _require_id(operation: BatchOperation) -> int:
+    if operation.id is None:
+        raise HTTPException(status_code=422, detail=f"Для {operation.op} нужен id")
+    return operation.id
+
+
+# Операции вызывают ту же логику из app.functions, что и эндпоинты
+
+
+async def get_me(session, user_id, operation, after_commit):
+    user = await get_user_info(session=session, user_id=user_id)
+    return UserRead.model_validate(user).model_dump(mode="json")
+
+
+async def get_user(session, user_id, operation, after_commit):
+    user = await get_user_info(session=session, user_id=_require_id(operation))
+    return UserRead.model_validate(user).model_dump(mode="json")
+
+
+async def get_tweets(session, user_id, operation, after_commit):
+    tweets, _ = await get_feed(session=session, user_id=user_id)
+    return tweets
+
+
+async def create_tweet(session, user_id, operation, after_commit):
+    tweet_data = TweetCreate.model_validate(operation.data or {})
+    return await post_tweet(
+        session=session, user_id=user_id, tweet_data=tweet_data, after_commit=after_commit
+    )
+
+
+async def delete_tweet(session, user_id, operation, after_commit):
+    return await remove_tweet(
+        session=session, user_id=user_id, tweet_id=_require_id(operation)
+    )
+
+
+async def like(session, user_id, operation, after_commit):
+    return await like_tweet(
+        session=session,
+        user_id=user_id,
+        tweet_id=_require_id(operation),
+        after_commit=after_commit,
+    )
+
+
+async def unlike(session, user_id, operation, after_commit):
+    return await unlike_tweet(
+        session=session,
+        user_id=user_id,
+        tweet_id=_require_id(operation),
+        after_commit=after_commit,
+    )
+
+
+async def follow(session, user_id, operation, after_commit):
+    return await follow_user(
+        session=session,
+        follower_id=user_id,
+        following_id=_require_id(operation),
+        after_commit=after_commit,
+    )
+
+
+async def unfollow(session, user_id, operation, after_commit):
+    return await unfollow_user(
+        session=session,
+        follower_id=user_id,
+        following_id=_require_id(operation),
+        after_commit=after_commit,
+    )
+
+
+HANDLERS: dict[str, Handler] = {
+    "get_me": get_me,
+    "get_user": get_user,
+    "get_tweets": get_tweets,
+    "create_tweet": create_tweet,
+    "delete_tweet": delete_tweet,
+    "like": like,
+    "unlike": unlike,
+    "follow": follow,
+    "unfollow": unfollow,
+}
+# статусы успешного ответа как у соответствующих эндпоинтов, по умолчанию 200
+STATUS_CODES = {
+    "delete_tweet": 202,
+    "like": 201,
+    "unlike": 202,
+    "follow": 202,
+    "unfollow": 202,
+}
+
+
+def _error(status: int, error_type: str, message: str) -> dict[str, Any]:
+    return {
+        "status": status,
+        "body": {"result": False, "error_type": error_type, "error_message": message},
+    }
+
+
+async def run_batch(
+    session: AsyncSession,
+    user_id: int,
+    operations: list[BatchOperation],
+    atomic: bool,
+    after_commit: AfterCommit,
+) -> list[dict[str, Any]]:
+    """
+    Выполняет операции пакета по очереди в одной сессии.
+
+    В атомарном режиме первая ошибка прерывает пакет через BatchAborted,
+    остальные операции помечаются статусом 424. Иначе ошибка откатывает
+    только свою операцию, и пакет продолжается.
+
+    :param after_commit: сюда копятся действия, которые нужно выполнить
+        после фиксации транзакции (рассылка событий)
+    :return: результат для каждой операции: статус и тело ответа
+    """
+    results: list[dict[str, Any]] = []
+    for index, operation in enumerate(operations):
+        logger.info(f"Пакет: операция {index} {operation.op} id={operation.id}")
+        pending: AfterCommit = []
+        try:
+            body = await HANDLERS[operation.op](session, user_id, operation, pending)
+            results.append({"status": STATUS_CODES.get(operation.op, 200), "body": body})
+            after_commit.extend(pending)
+            continue
+        except HTTPException as e:
+            results.append(_error(e.status_code, "AuthenticationError", str(e.detail)))
+        except ValidationError as e:
+            results.append(_error(422, "ValidationError", str(e)))
+        except SQLAlchemyError as e:
+            logger.error(f"Database error: {str(e)}", exc_info=True)
+            results.append(_error(400, "DatabaseError", str(e)))
+
+        if atomic:
+            results.extend(
+                _error(424, "BatchAborted", "Пакет операций откатан")
+                for _ in operations[index + 1 :]
+            )
+            raise BatchAborted(results)
+        await session.rollback()
+    return results
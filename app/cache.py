@@ -0,0 +1,287 @@
+import asyncio
+import json
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Iterable
+
+import asyncpg
+from sqlalchemy import func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import logger, settings
+
+
+class CacheBackend(ABC):
+    """Хранилище кэша: значения - json-совместимые объекты"""
+
+    @abstractmethod
+    async def get_many(self, keys: list[str]) -> dict[str, Any]: ...
+
+    @abstractmethod
+    async def set_many(self, values: dict[str, Any]) -> None: ...
+
+    @abstractmethod
+    async def delete_many(self, keys: list[str]) -> None: ...
+
+    @abstractmethod
+    async def clear(self) -> None: ...
+
+
+class LRUCacheBackend(CacheBackend):
+    """Кэш в памяти процесса с вытеснением давно не используемых ключей"""
+
+    def __init__(self, max_items: int, ttl_seconds: float) -> None:
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self._items: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    async def get_many(self, keys: list[str]) -> dict[str, Any]:
+        now = time.monotonic()
+        found = {}
+        for key in keys:
+            item = self._items.get(key)
+            if item is None:
+                continue
+            expires_at, value = item
+            if expires_at < now:
+                del self._items[key]
+                continue
+            self._items.move_to_end(key)
+            found[key] = value
+        return found
+
+    async def set_many(self, values: dict[str, Any]) -> None:
+        expires_at = time.monotonic() + self.ttl_seconds
+        for key, value in values.items():
+            self._items[key] = (expires_at, value)
+            self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    async def delete_many(self, keys: list[str]) -> None:
+        for key in keys:
+            self._items.pop(key, None)
+
+    async def clear(self) -> None:
+        self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Кэш в Redis или совместимом сервере.
+
+    Подходит любой клиент с интерфейсом redis.asyncio: mget, pipeline, delete.
+    """
+
+    def __init__(self, client: Any, ttl_seconds: int, prefix: str = "microblogs:") -> None:
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, ttl_seconds: int) -> "RedisCacheBackend":
+        import redis.asyncio as redis
+
+        return cls(client=redis.from_url(url), ttl_seconds=ttl_seconds)
+
+    async def get_many(self, keys: list[str]) -> dict[str, Any]:
+        if not keys:
+            return {}
+        values = await self.client.mget([self.prefix + key for key in keys])
+        return {
+            key: json.loads(value) for key, value in zip(keys, values) if value is not None
+        }
+
+    async def set_many(self, values: dict[str, Any]) -> None:
+        if not values:
+            return
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key, value in values.items():
+                pipe.set(self.prefix + key, json.dumps(value), ex=self.ttl_seconds)
+            await pipe.execute()
+
+    async def delete_many(self, keys: list[str]) -> None:
+        if keys:
+            await self.client.delete(*[self.prefix + key for key in keys])
+
+    async def clear(self) -> None:
+        # общий кэш не чистим целиком: ключи истекут по ttl
+        pass
+
+
+# меняется вместе с форматом закэшированного твита
+TWEET_CACHE_VERSION = 5
+
+
+def tweet_key(tweet_id: int) -> str:
+    return f"tweet:v{TWEET_CACHE_VERSION}:{tweet_id}"
+
+
+def user_key(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+# payload NOTIFY ограничен 8000 байт, запас - на разделители
+NOTIFY_PAYLOAD_LIMIT = 7900
+
+
+def notify_chunks(entries: list[str], limit: int = NOTIFY_PAYLOAD_LIMIT) -> list[str]:
+    """Склеивает записи через запятую в payload не длиннее limit байт"""
+    chunks: list[str] = []
+    current: list[str] = []
+    size = 0
+    for entry in entries:
+        length = len(entry.encode()) + 1
+        if current and size + length > limit:
+            chunks.append(",".join(current))
+            current, size = [], 0
+        current.append(entry)
+        size += length
+    if current:
+        chunks.append(",".join(current))
+    return chunks
+
+
+class CacheSubscriber(ABC):
+    """
+    Получатель своих сообщений из канала инвалидации: записей,
+    начинающихся с prefix (см. TweetCache.invalidate, events).
+    """
+
+    prefix: str
+
+    @abstractmethod
+    def notified(self, events: list[str]) -> None: ...
+
+    @abstractmethod
+    def reset(self) -> None:
+        """Сообщения могли потеряться, пока не было соединения LISTEN"""
+
+
+class TweetCache:
+    """
+    Кэш гидрированных твитов и их авторов.
+
+    Инвалидация рассылается через Postgres NOTIFY в транзакции записи,
+    поэтому остальные воркеры узнают о ней только после commit,
+    а откатанная запись никого не инвалидирует.
+    """
+
+    def __init__(self, backend: CacheBackend, channel: str) -> None:
+        self.backend = backend
+        self.channel = channel
+        self._listeners: list[asyncio.Task] = []
+        self._subscribers: list[CacheSubscriber] = []
+
+    def subscribe(self, subscriber: CacheSubscriber) -> None:
+        self._subscribers.append(subscriber)
+
+    async def _get(self, key_func, ids: Iterable[int]) -> dict[int, Any]:
+        ids = list(ids)
+        found = await self.backend.get_many([key_func(i) for i in ids])
+        return {i: found[key_func(i)] for i in ids if key_func(i) in found}
+
+    async def get_tweets(self, tweet_ids: Iterable[int]) -> dict[int, Any]:
+        return await self._get(tweet_key, tweet_ids)
+
+    async def get_users(self, user_ids: Iterable[int]) -> dict[int, Any]:
+        return await self._get(user_key, user_ids)
+
+    async def set_tweets(self, tweets: dict[int, Any]) -> None:
+        await self.backend.set_many({tweet_key(i): tweet for i, tweet in tweets.items()})
+
+    async def set_users(self, users: dict[int, Any]) -> None:
+        await self.backend.set_many({user_key(i): user for i, user in users.items()})
+
+    async def invalidate(
+        self,
+        session: AsyncSession,
+        tweet_ids: Iterable[int] = (),
+        user_ids: Iterable[int] = (),
+        events: Iterable[str] = (),
+    ) -> None:
+        """
+        Сбрасывает записи локально и ставит NOTIFY в текущую транзакцию.
+        Вызывать до commit. Длинный список уходит несколькими NOTIFY.
+
+        :param events: сообщения подписчиков, доходят до всех воркеров
+            вместе с инвалидацией, в том числе до этого
+        """
+        keys = [tweet_key(i) for i in tweet_ids] + [user_key(i) for i in user_ids]
+        events = list(events)
+        if not keys and not events:
+            return
+        await self.backend.delete_many(keys)
+        await session.execute(
+            select(
+                *[
+                    func.pg_notify(self.channel, chunk)
+                    for chunk in notify_chunks(keys + events)
+                ]
+            )
+        )
+        logger.info(f"Инвалидация кэша {keys + events}")
+
+    def _on_notify(self, connection, pid, channel, payload: str) -> None:
+        keys = payload.split(",")
+        for subscriber in self._subscribers:
+            events = [key for key in keys if key.startswith(subscriber.prefix)]
+            if events:
+                subscriber.notified(events)
+                keys = [key for key in keys if not key.startswith(subscriber.prefix)]
+        if keys:
+            asyncio.ensure_future(self.backend.delete_many(keys))
+
+    async def _listen(self, dsn: str) -> None:
+        while True:
+            try:
+                connection = await asyncpg.connect(dsn)
+            except (OSError, asyncpg.PostgresError) as e:
+                logger.error(f"Не удалось подключиться для LISTEN: {e}")
+                await asyncio.sleep(1)
+                continue
+            lost = asyncio.get_running_loop().create_future()
+            connection.add_termination_listener(lambda _: lost.done() or lost.set_result(None))
+            try:
+                await connection.add_listener(self.channel, self._on_notify)
+                # пока слушателя не было, инвалидации могли потеряться
+                await self.backend.clear()
+                for subscriber in self._subscribers:
+                    subscriber.reset()
+                logger.info(f"Слушаем инвалидации кэша в канале {self.channel}")
+                await lost
+                logger.error("Соединение LISTEN потеряно, переподключаемся")
+            finally:
+                if not connection.is_closed():
+                    await connection.close()
+
+    async def start_listener(self, *urls: str) -> None:
+        """Слушает каждую базу: при шардировании NOTIFY приходит и с шардов"""
+        for url in urls:
+            dsn = make_url(url).set(drivername="postgresql").render_as_string(
+                hide_password=False
+            )
+            self._listeners.append(asyncio.create_task(self._listen(dsn)))
+
+    async def stop_listener(self) -> None:
+        for listener in self._listeners:
+            listener.cancel()
+        await asyncio.gather(*self._listeners, return_exceptions=True)
+        self._listeners = []
+
+
+def create_backend(
+    max_items: int = settings.cache.max_items,
+    ttl_seconds: int = settings.cache.ttl_seconds,
+) -> CacheBackend:
+    if settings.cache.backend == "redis":
+        return RedisCacheBackend.from_url(settings.cache.redis_url, ttl_seconds=ttl_seconds)
+    return LRUCacheBackend(max_items=max_items, ttl_seconds=ttl_seconds)
+
+
+tweet_cache = TweetCache(backend=create_backend(), channel=settings.cache.channel)
@@ -0,0 +1,191 @@
+import gzip
+from typing import Any, Callable, Optional
+
+from pydantic import BaseModel
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+
+Compressor = Callable[[bytes, int], bytes]
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+# потоковые ответы отдаются без буферизации и не сжимаются
+STREAMING_TYPES = ("text/event-stream", "application/x-ndjson")
+
+
+def _gzip(body: bytes, level: int) -> bytes:
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def available_compressors() -> dict[str, Compressor]:
+    """
+    Доступные кодировки в порядке предпочтения сервера.
+
+    gzip есть всегда, brotli и zstd - если установлены пакеты brotli и zstandard.
+    """
+    compressors: dict[str, Compressor] = {}
+    try:
+        import zstandard
+
+        compressors["zstd"] = lambda body, level: zstandard.ZstdCompressor(
+            level=level
+        ).compress(body)
+    except ImportError:
+        pass
+    try:
+        import brotli
+
+        compressors["br"] = lambda body, level: brotli.compress(body, quality=level)
+    except ImportError:
+        pass
+    compressors["gzip"] = _gzip
+    return compressors
+
+
+def parse_accept(header: str) -> dict[str, float]:
+    """Значения заголовков Accept и Accept-Encoding с их q"""
+    values: dict[str, float] = {}
+    for part in header.split(","):
+        value, _, params = part.strip().partition(";")
+        if not value:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, number = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        values[value.strip().lower()] = q
+    return values
+
+
+def choose_encoding(accept_encoding: str, encodings: list[str]) -> Optional[str]:
+    """Кодировка с наибольшим q у клиента, при равенстве - в порядке сервера"""
+    accepted = parse_accept(accept_encoding)
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CompressionMiddleware:
+    """
+    Сжимает ответы по Accept-Encoding клиента.
+
+    Сжимаются только ответы, отданные одним куском и не меньше minimum_size
+    байт: потоковые ответы (SSE, NDJSON) проходят как есть, чтобы не
+    задерживать события.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        levels: Optional[dict[str, int]] = None,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {"gzip": 6, "br": 4, "zstd": 3, **(levels or {})}
+        self.compressors = available_compressors()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(
+            Headers(scope=scope).get("accept-encoding", ""), list(self.compressors)
+        )
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        passthrough = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough or start is None:
+                await send(message)
+                return
+
+            headers = MutableHeaders(raw=start["headers"])
+            body = message.get("body", b"")
+            if (
+                message.get("more_body", False)
+                or len(body) < self.minimum_size
+                or "content-encoding" in headers
+                or headers.get("content-type", "").startswith(STREAMING_TYPES)
+            ):
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            body = self.compressors[encoding](body, self.levels[encoding])
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+class MsgPackResponse(Response):
+    media_type = "application/msgpack"
+
+    def render(self, content: Any) -> bytes:
+        import msgpack
+
+        return msgpack.packb(content, use_bin_type=True)
+
+
+def msgpack_available() -> bool:
+    try:
+        import msgpack  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def wants_msgpack(request: Request) -> bool:
+    accepted = parse_accept(request.headers.get("accept", ""))
+    msgpack_q = max(accepted.get(media_type, 0.0) for media_type in MSGPACK_TYPES)
+    json_q = max(
+        accepted.get("application/json", 0.0),
+        accepted.get("application/*", 0.0),
+        accepted.get("*/*", 0.0),
+    )
+    return msgpack_q > 0 and msgpack_q >= json_q and msgpack_available()
+
+
+def negotiate(
+    request: Request, response: Response, model: type[BaseModel], content: Any
+) -> Any:
+    """
+    Ответ в MessagePack, если клиент просит его в Accept, иначе content как есть.
+
+    Без установленного пакета msgpack всегда отдается JSON. Заголовки и
+    статус, выставленные обработчиком в response, переносятся в ответ.
+    """
+    if not settings.compression.msgpack:
+        return content
+    response.headers["Vary"] = "Accept"
+    if not wants_msgpack(request):
+        return content
+    data = model.model_validate(content).model_dump(mode="json")
+    return MsgPackResponse(
+        data,
+        status_code=response.status_code or 200,
+        headers=dict(response.headers),
+    )
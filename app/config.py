@@ -1,10 +1,27 @@
 import logging
+from contextvars import ContextVar
+
+from typing import Literal
 
 from pydantic import BaseModel, PostgresDsn
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+# id текущего запроса, проставляется TimingMiddleware (app/timing.py)
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+_record_factory = logging.getLogRecordFactory()
+
+
+def _record_with_request_id(*args, **kwargs) -> logging.LogRecord:
+    record = _record_factory(*args, **kwargs)
+    record.request_id = request_id_var.get()
+    return record
+
+
+logging.setLogRecordFactory(_record_with_request_id)
 logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] - %(message)s",
 )
 logger = logging.getLogger(__name__)
 
@@ -12,6 +29,8 @@ logger = logging.getLogger(__name__)
 class RunConfig(BaseModel):
     host: str = "0.0.0.0"
     port: int = 8000
+    # режим разработки: index.html перечитывается при изменении файла
+    reload: bool = False
 
 
 # = Field(..., description="Database URL")
@@ -32,6 +51,216 @@ class DatabaseConfig(BaseModel):
     }
 
 
+class TrendsConfig(BaseModel):
+    # размер окна, за которое считаются тренды, и шаг его сдвига
+    window_seconds: int = 3600
+    bucket_seconds: int = 60
+    # параметры count-min sketch
+    width: int = 2048
+    depth: int = 4
+    # сколько кандидатов в тренды держим в памяти
+    capacity: int = 200
+
+
+class StreamConfig(BaseModel):
+    # сколько событий копится для одного клиента до выброса старых
+    queue_size: int = 100
+    # период пинга простаивающего соединения, секунд
+    heartbeat_seconds: float = 15.0
+
+
+class CacheConfig(BaseModel):
+    # memory - LRU в памяти воркера, redis - общий кэш
+    backend: Literal["memory", "redis"] = "memory"
+    redis_url: str = "redis://redis:6379/0"
+    max_items: int = 10000
+    ttl_seconds: int = 300
+    # канал Postgres LISTEN/NOTIFY для инвалидации между воркерами
+    channel: str = "cache_invalidation"
+    # api-key -> id пользователя в памяти воркера; ключи пользователей не меняются
+    api_keys_max_items: int = 100000
+    api_keys_ttl_seconds: int = 3600
+    # неизвестные ключи помним недолго: пользователь с таким ключом может появиться
+    unknown_api_keys_ttl_seconds: int = 5
+
+
+class ExportConfig(BaseModel):
+    # сколько строк серверный курсор отдает за одну выборку
+    fetch_size: int = 1000
+
+
+class PartitionConfig(BaseModel):
+    # на сколько месяцев вперед заранее создаются секции tweets и likes
+    months_ahead: int = 3
+    # секции старше стольких месяцев уходят в архив, 0 - хранить все;
+    # лайки архивируются своими секциями, теги и картинки твитов остаются
+    retention_months: int = 0
+    archive_dir: str = "archive"
+    interval_seconds: float = 86400
+
+
+class JobsConfig(BaseModel):
+    # количество воркеров очереди в каждом процессе, 0 - не запускать
+    workers: int = 2
+    # сколько задач воркер забирает за один запрос
+    batch_size: int = 10
+    poll_interval_seconds: float = 1.0
+    max_attempts: int = 5
+    # задержка перед повтором: backoff_seconds * 2 ** (attempts - 1), не больше max
+    backoff_seconds: float = 2.0
+    backoff_max_seconds: float = 300.0
+    # задача в статусе running дольше этого считается брошенной
+    visibility_timeout_seconds: float = 300.0
+
+
+class TweetsConfig(BaseModel):
+    # сколько лайков удаляется одним запросом при удалении твита
+    delete_chunk_size: int = 5000
+    # сколько последних лайкнувших показывается в ленте
+    likes_preview_size: int = 3
+    # размер страницы списка лайков по умолчанию и максимальный
+    likes_page_size: int = 50
+    likes_max_page_size: int = 200
+
+
+class NotificationsConfig(BaseModel):
+    # события об одном объекте за этот интервал схлопываются в одно уведомление
+    bucket_seconds: int = 3600
+    # сколько последних участников хранится в уведомлении
+    preview_size: int = 3
+    page_size: int = 20
+    max_page_size: int = 100
+
+
+class AdminConfig(BaseModel):
+    # api-key администраторов для служебных эндпоинтов
+    api_keys: list[str] = []
+
+
+class ProfilerConfig(BaseModel):
+    # выключен - ни эндпоинт, ни middleware профилирования не работают
+    enabled: bool = False
+    interval_ms: float = 5.0
+    # для одного запроса сэмплируем чаще: запросы короткие
+    request_interval_ms: float = 1.0
+    max_seconds: int = 60
+    header: str = "X-Profile"
+
+
+class CompressionConfig(BaseModel):
+    # ответы меньше этого размера не сжимаются
+    minimum_size: int = 1024
+    gzip_level: int = 6
+    br_level: int = 4
+    zstd_level: int = 3
+    # отдавать MessagePack по Accept: application/msgpack
+    msgpack: bool = True
+
+
+class MediaConfig(BaseModel):
+    # откуда отдаются загруженные файлы: location /media/ в nginx.conf для local,
+    # адрес бакета или CDN перед ним для s3
+    url_prefix: str = "/media/"
+    # local - каталог directory, s3 - S3-совместимое хранилище (AWS, MinIO)
+    storage: Literal["local", "s3"] = "local"
+    directory: str = "media"
+    s3_endpoint_url: str = "http://minio:9000"
+    s3_bucket: str = "media"
+    s3_region: str = "us-east-1"
+    s3_access_key: str = ""
+    s3_secret_key: str = ""
+    # сколько действует ссылка для прямой загрузки в хранилище
+    presign_expires_seconds: int = 900
+
+
+class UsersConfig(BaseModel):
+    # размер страницы подписчиков и подписок; первая страница отдается в профиле
+    follow_page_size: int = 50
+    follow_max_page_size: int = 200
+
+
+class ViewsConfig(BaseModel):
+    # 2**precision байт на твит; стандартная ошибка 1.04 / sqrt(2**precision)
+    precision: int = 12
+    # как часто просмотры из памяти воркера сохраняются в базу
+    interval_seconds: float = 60.0
+    # при стольких твитах с несохраненными просмотрами сохраняем досрочно
+    max_pending: int = 10000
+
+
+class IdempotencyConfig(BaseModel):
+    header: str = "Idempotency-Key"
+    # сколько помним ответ на ключ
+    ttl_seconds: int = 3600
+    # незавершенный ключ старше этого считается брошенным (воркер упал)
+    lock_seconds: int = 30
+    # сколько повтор ждет завершения первого запроса, потом 409
+    wait_seconds: float = 10.0
+    poll_interval_ms: float = 50.0
+    purge_interval_seconds: int = 600
+
+
+class UploadsConfig(BaseModel):
+    # на том же томе, что и media.directory: finalize переносит файл
+    # переименованием; с хранилищем s3 файл загружается туда при finalize
+    staging_dir: str = "media/.uploads"
+    max_size: int = 100 * 1024 * 1024
+    # больше одного PUT не принимается (client_max_body_size в nginx.conf)
+    chunk_max_size: int = 8 * 1024 * 1024
+    # незавершенная загрузка удаляется через это время после создания
+    ttl_seconds: int = 86400
+    # на столько часть загрузки закрепляется за принимающим ее запросом;
+    # брошенную запросом загрузку можно продолжить по истечении
+    lease_seconds: int = 300
+
+
+class AdmissionConfig(BaseModel):
+    enabled: bool = True
+    # одновременных запросов к API на воркер; не больше db.pool_size, чтобы
+    # очередь была здесь, а не в пуле SQLAlchemy
+    max_concurrency: int = 50
+    queue_size: int = 200
+    # запрос, который не дождется места за это время, сразу получает 503
+    queue_timeout_ms: float = 1000.0
+    retry_after_seconds: int = 1
+    # тяжелые маршруты (регулярное выражение пути -> лимит), в очереди они последние
+    route_limits: dict[str, int] = {
+        r"^/api/batch$": 4,
+        r"^/api/users/[^/]+/tweets/export$": 2,
+        r"^/api/medias": 8,
+    }
+    # долгие соединения и служебные эндпоинты не ограничиваются
+    exempt: list[str] = ["/api/stream", "/api/admin"]
+
+
+class FeedConfig(BaseModel):
+    # сколько ждать загрузки ленты из базы, прежде чем отдать сохраненную копию
+    timeout_ms: float = 1000.0
+    # копия старше этого не отдается: 503 вместо слишком старой ленты
+    max_stale_seconds: int = 300
+    max_items: int = 10000
+    # после стольких ошибок подряд лента breaker_reset_seconds берется только из копии
+    breaker_failures: int = 5
+    breaker_reset_seconds: float = 10.0
+
+
+class ShardingConfig(BaseModel):
+    # базы шардов для tweets, likes, images и tweet_tags; пусто - все в db.url
+    urls: list[str] = []
+    # корзины пользователей по шардам: {"0-127": 0, "128-255": 1};
+    # пусто - корзины делятся между шардами поровну по порядку
+    buckets: dict[str, int] = {}
+    pool_size: int = 10
+    max_overflow: int = 10
+
+
+class LikedIndexConfig(BaseModel):
+    # память под лайкнутые твиты пользователей в каждом воркере
+    max_bytes: int = 64 * 1024 * 1024
+    # у пользователей с большим числом лайков liked_by_me проверяется запросом
+    max_user_items: int = 100_000
+
+
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(
         env_file=(".env.template", ".env"),
@@ -43,6 +272,26 @@ class Settings(BaseSettings):
     db: DatabaseConfig = DatabaseConfig(
         url="postgresql+asyncpg://user:password@pg:5432/microblogs"
     )
+    trends: TrendsConfig = TrendsConfig()
+    stream: StreamConfig = StreamConfig()
+    cache: CacheConfig = CacheConfig()
+    export: ExportConfig = ExportConfig()
+    partitions: PartitionConfig = PartitionConfig()
+    jobs: JobsConfig = JobsConfig()
+    tweets: TweetsConfig = TweetsConfig()
+    users: UsersConfig = UsersConfig()
+    media: MediaConfig = MediaConfig()
+    compression: CompressionConfig = CompressionConfig()
+    admin: AdminConfig = AdminConfig()
+    notifications: NotificationsConfig = NotificationsConfig()
+    profiler: ProfilerConfig = ProfilerConfig()
+    views: ViewsConfig = ViewsConfig()
+    idempotency: IdempotencyConfig = IdempotencyConfig()
+    uploads: UploadsConfig = UploadsConfig()
+    admission: AdmissionConfig = AdmissionConfig()
+    feed: FeedConfig = FeedConfig()
+    sharding: ShardingConfig = ShardingConfig()
+    liked_index: LikedIndexConfig = LikedIndexConfig()
 
 
 settings = Settings()
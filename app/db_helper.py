@@ -1,19 +1,67 @@
 import os
 import sys
-from typing import AsyncGenerator
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator
 
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     AsyncSession,
     async_sessionmaker,
     create_async_engine,
 )
+from sqlalchemy.orm import Session
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from app.config import logger, settings
 
+from app.timing import record
+
 # from module_26_fastapi.homework.config.config import settings
 
+CHECKOUT_START = "checkout_start"
+# сессия из transaction_session: ее commit фиксирует только savepoint
+OUTER_TRANSACTION = "outer_transaction"
+
+
+def in_outer_transaction(session: AsyncSession) -> bool:
+    """Запись сессии еще может откатиться вместе с внешней транзакцией"""
+    return session.info.get(OUTER_TRANSACTION, False)
+
+
+class PoolSession(Session):
+    """Сессия, для которой считается ожидание соединения из пула"""
+
+
+class PoolStats:
+    """
+    Ожидание соединения из пула.
+
+    Время считается от первого запроса сессии, которому нужно соединение,
+    до начала транзакции на полученном соединении.
+    """
+
+    def __init__(self, window: int = 1000) -> None:
+        self.checkouts = 0
+        self.waits: deque[float] = deque(maxlen=window)
+
+    def percentiles(self) -> dict[str, float]:
+        if not self.waits:
+            return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+        values = sorted(self.waits)
+        return {
+            "p50": values[len(values) // 2] * 1000,
+            "p95": values[min(len(values) - 1, int(len(values) * 0.95))] * 1000,
+            "max": values[-1] * 1000,
+        }
+
+
+def _mark_checkout_start(session: Session) -> None:
+    if CHECKOUT_START not in session.info and not session.in_transaction():
+        session.info[CHECKOUT_START] = time.perf_counter()
+
 
 class DatabaseHelper:
     """
@@ -43,7 +91,46 @@ class DatabaseHelper:
             autoflush=False,
             autocommit=False,
             expire_on_commit=False,
+            sync_session_class=PoolSession,
         )
+        self.pool_stats = PoolStats()
+        self._track_pool()
+
+    def _track_pool(self) -> None:
+        stats = self.pool_stats
+
+        @event.listens_for(self.engine.sync_engine.pool, "checkout")
+        def on_checkout(*args: Any) -> None:
+            stats.checkouts += 1
+
+        @event.listens_for(PoolSession, "do_orm_execute")
+        def on_execute(orm_execute_state: Any) -> None:
+            _mark_checkout_start(orm_execute_state.session)
+
+        @event.listens_for(PoolSession, "before_flush")
+        def on_flush(session: Session, *args: Any) -> None:
+            _mark_checkout_start(session)
+
+        @event.listens_for(PoolSession, "after_begin")
+        def on_begin(session: Session, transaction: Any, connection: Any) -> None:
+            # слушатель общий для всех сессий: учитываем только свой движок
+            if connection.engine is not self.engine.sync_engine:
+                return
+            start = session.info.pop(CHECKOUT_START, None)
+            if start is not None:
+                wait = time.perf_counter() - start
+                stats.waits.append(wait)
+                record("pool", wait)
+
+    def pool_metrics(self) -> dict[str, Any]:
+        pool = self.engine.sync_engine.pool
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "checkouts": self.pool_stats.checkouts,
+            "wait_ms": self.pool_stats.percentiles(),
+        }
 
     async def dispose(self) -> None:
         """
@@ -54,7 +141,10 @@ class DatabaseHelper:
 
     async def session_getter(self) -> AsyncGenerator[AsyncSession, None]:
         """
-        Возвращает новый сеанс работы с базой данных
+        Возвращает новый сеанс работы с базой данных.
+
+        Сессия ленивая: соединение берется из пула только при первом запросе
+        к базе, поэтому ответы из кэша и отказы в авторизации пул не занимают.
 
         :return: Асинхронная сессия
         """
@@ -62,6 +152,31 @@ class DatabaseHelper:
         async with session:
             yield session
 
+    @asynccontextmanager
+    async def transaction_session(self) -> AsyncGenerator[AsyncSession, None]:
+        """
+        Возвращает сессию внутри внешней транзакции.
+
+        commit() внутри функций фиксирует только savepoint, вся работа
+        применяется при выходе из контекста или откатывается целиком при ошибке.
+
+        :return: Асинхронная сессия
+        """
+        async with self.engine.connect() as connection:
+            transaction = await connection.begin()
+            session = self.session_factory(
+                bind=connection, join_transaction_mode="create_savepoint"
+            )
+            session.info[OUTER_TRANSACTION] = True
+            try:
+                yield session
+                await session.close()
+                await transaction.commit()
+            except BaseException:
+                await session.close()
+                await transaction.rollback()
+                raise
+
 
 db_helper = DatabaseHelper(
     url=str(settings.db.url),
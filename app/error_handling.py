@@ -5,6 +5,7 @@ from sqlalchemy.exc import SQLAlchemyError
 from starlette.responses import JSONResponse
 
 from app.config import logger
+from app.timing import handler_done
 
 
 def handle_api_errors():
@@ -21,6 +22,7 @@ def handle_api_errors():
                         "error_type": "AuthenticationError",
                         "error_message": str(e.detail),
                     },
+                    headers=e.headers,
                 )
             except SQLAlchemyError as e:
                 logger.error(f"Database error: {str(e)}", exc_info=True)  #Improved message
@@ -42,6 +44,8 @@ def handle_api_errors():
                         "error_message": str(e),
                     },
                 )
+            finally:
+                handler_done()
 
         return wrapper
 
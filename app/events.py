@@ -0,0 +1,152 @@
+import asyncio
+import itertools
+import json
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Hashable
+
+from app.config import logger, settings
+
+TWEET = "tweet"
+LIKE = "like"
+FOLLOW = "follow"
+RESYNC = "resync"
+
+
+class Subscription:
+    """
+    Очередь событий одного подключения.
+
+    Очередь ограничена: событие с тем же ключом заменяет ожидающее (coalesce),
+    а при переполнении выбрасывается самое старое событие. Медленный клиент
+    получает событие resync и сам перечитывает ленту.
+    """
+
+    __slots__ = ("user_id", "maxsize", "dropped", "_pending", "_ready")
+
+    def __init__(self, user_id: int, maxsize: int) -> None:
+        self.user_id = user_id
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._pending: OrderedDict[Hashable, dict[str, Any]] = OrderedDict()
+        self._ready = asyncio.Event()
+
+    def put(self, key: Hashable, event: dict[str, Any]) -> None:
+        if key in self._pending:
+            self._pending[key] = event
+        else:
+            if len(self._pending) >= self.maxsize:
+                self._pending.popitem(last=False)
+                self.dropped += 1
+            self._pending[key] = event
+        self._ready.set()
+
+    async def get(self, timeout: float) -> list[dict[str, Any]]:
+        """
+        Ждет события не дольше timeout секунд и забирает все накопленные.
+        """
+        if not self._pending:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return []
+        events = list(self._pending.values())
+        self._pending.clear()
+        self._ready.clear()
+        if self.dropped:
+            events.append({"type": RESYNC, "dropped": self.dropped})
+            self.dropped = 0
+        return events
+
+
+class EventBroker:
+    """
+    Pub/sub внутри процесса: эндпоинты записи публикуют события,
+    подключенные клиенты получают их через свою Subscription.
+    """
+
+    def __init__(self, queue_size: int) -> None:
+        self.queue_size = queue_size
+        self._subscriptions: set[Subscription] = set()
+        self._sequence = itertools.count()
+
+    def subscribe(self, user_id: int) -> Subscription:
+        subscription = Subscription(user_id=user_id, maxsize=self.queue_size)
+        self._subscriptions.add(subscription)
+        logger.info(f"Подписка на события, всего подключений {len(self)}")
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscriptions.discard(subscription)
+        logger.info(f"Отписка от событий, всего подключений {len(self)}")
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    def publish(
+        self,
+        event: dict[str, Any],
+        key: Hashable | None = None,
+        audience: set[int] | None = None,
+    ) -> None:
+        """
+        Рассылает событие подписчикам без ожидания.
+
+        :param event: событие, сериализуемое в json
+        :param key: ключ для схлопывания однотипных событий, None - не схлопывать
+        :param audience: id пользователей, которым адресовано событие, None - всем
+        """
+        if key is None:
+            key = next(self._sequence)
+        for subscription in self._subscriptions:
+            if audience is None or subscription.user_id in audience:
+                subscription.put(key, event)
+
+    def publish_tweet(self, tweet_id: int, user_id: int) -> None:
+        self.publish({"type": TWEET, "tweet_id": tweet_id, "user_id": user_id})
+
+    def publish_like(self, tweet_id: int, user_id: int, liked: bool) -> None:
+        self.publish(
+            {"type": LIKE, "tweet_id": tweet_id, "user_id": user_id, "liked": liked},
+            key=(LIKE, tweet_id, user_id),
+        )
+
+    def publish_follow(self, follower_id: int, following_id: int, followed: bool) -> None:
+        self.publish(
+            {
+                "type": FOLLOW,
+                "follower_id": follower_id,
+                "following_id": following_id,
+                "followed": followed,
+            },
+            key=(FOLLOW, follower_id, following_id),
+            audience={follower_id, following_id},
+        )
+
+
+async def event_stream(
+    broker: EventBroker,
+    subscription: Subscription,
+    is_disconnected: Callable[[], Awaitable[bool]],
+    heartbeat: float,
+) -> AsyncIterator[str]:
+    """
+    Отдает события подписки в формате Server-Sent Events.
+
+    Пока событий нет, раз в heartbeat секунд отправляется комментарий,
+    чтобы прокси не закрывали простаивающее соединение.
+    """
+    try:
+        yield "retry: 3000\n\n"
+        while not await is_disconnected():
+            events = await subscription.get(timeout=heartbeat)
+            if not events:
+                yield ": ping\n\n"
+                continue
+            for event in events:
+                data = json.dumps(event, ensure_ascii=False)
+                yield f"event: {event['type']}\ndata: {data}\n\n"
+    finally:
+        broker.unsubscribe(subscription)
+
+
+broker = EventBroker(queue_size=settings.stream.queue_size)
@@ -0,0 +1,155 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.cache import CacheBackend, create_backend
+from app.config import logger, settings
+from app.db_helper import db_helper
+
+FeedLoader = Callable[[AsyncSession], Awaitable[dict[str, Any]]]
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class FeedUnavailable(Exception):
+    """Ленту не загрузить, а сохраненной копии нет или она слишком старая"""
+
+
+class CircuitBreaker:
+    """
+    Размыкатель: после failure_threshold ошибок подряд запросы к базе не
+    идут reset_seconds секунд, затем пропускается одна пробная загрузка.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int,
+        reset_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and self.clock() - self.opened_at >= self.reset_seconds:
+            # одна пробная загрузка; пока она идет, остальные получают копию
+            self.state = HALF_OPEN
+            return True
+        return False
+
+    def success(self) -> None:
+        if self.state != CLOSED:
+            logger.info("База отвечает, размыкатель ленты замкнут")
+        self.state = CLOSED
+        self.failures = 0
+
+    def failure(self) -> None:
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                logger.warning(f"Размыкатель ленты разомкнут после {self.failures} ошибок")
+            self.state = OPEN
+            self.opened_at = self.clock()
+
+
+def feed_key(user_id: int) -> str:
+    return f"feed:{user_id}"
+
+
+class FeedCache:
+    """
+    Последняя удачно загруженная лента каждого пользователя.
+
+    Лента загружается из базы отдельной задачей. Если она не успела за
+    timeout, упала или размыкатель разомкнут, отдается сохраненная копия не
+    старше max_stale_seconds, а задача продолжает работу в фоне и обновляет
+    копию. Одновременные запросы ленты пользователя ждут одну загрузку.
+    """
+
+    def __init__(
+        self,
+        backend: CacheBackend,
+        session_factory: async_sessionmaker[AsyncSession],
+        breaker: CircuitBreaker,
+        timeout: float,
+        max_stale_seconds: float,
+    ) -> None:
+        self.backend = backend
+        self.session_factory = session_factory
+        self.breaker = breaker
+        self.timeout = timeout
+        self.max_stale_seconds = max_stale_seconds
+        self._inflight: dict[str, asyncio.Task] = {}
+        # загрузки, уже засчитанные размыкателю как ошибка по timeout
+        self._timed_out: set[str] = set()
+
+    async def _refresh(self, key: str, load: FeedLoader) -> Optional[dict[str, Any]]:
+        try:
+            async with self.session_factory() as session:
+                feed = await load(session)
+            self.breaker.success()
+            await self.backend.set_many({key: {"stored_at": time.time(), "feed": feed}})
+            return feed
+        except Exception as e:
+            if key not in self._timed_out:
+                self.breaker.failure()
+            logger.error(f"Не удалось загрузить ленту {key}: {e}")
+            return None
+        finally:
+            self._inflight.pop(key, None)
+            self._timed_out.discard(key)
+
+    async def _stale(self, key: str) -> tuple[dict[str, Any], float]:
+        entry = (await self.backend.get_many([key])).get(key)
+        if entry is None:
+            raise FeedUnavailable("Лента недоступна")
+        age = time.time() - entry["stored_at"]
+        if age > self.max_stale_seconds:
+            raise FeedUnavailable("Лента недоступна")
+        logger.warning(f"Отдаем сохраненную ленту {key}, возраст {age:.0f} с")
+        return entry["feed"], age
+
+    async def get(self, user_id: int, load: FeedLoader) -> tuple[dict[str, Any], Optional[float]]:
+        """
+        :param load: загрузка ленты в переданной сессии, результат json-совместим
+        :return: лента и ее возраст в секундах, None - только что из базы
+        """
+        key = feed_key(user_id)
+        task = self._inflight.get(key)
+        if task is None:
+            if not self.breaker.allow():
+                return await self._stale(key)
+            task = self._inflight[key] = asyncio.create_task(self._refresh(key, load))
+        # wait, а не wait_for: загрузка не отменяется и обновит копию в фоне
+        done, _ = await asyncio.wait({task}, timeout=self.timeout)
+        if task in done and task.result() is not None:
+            return task.result(), None
+        if task not in done and key not in self._timed_out:
+            # ждущих загрузку много, а ошибка одна
+            self._timed_out.add(key)
+            self.breaker.failure()
+        return await self._stale(key)
+
+
+feed_cache = FeedCache(
+    backend=create_backend(
+        max_items=settings.feed.max_items, ttl_seconds=settings.feed.max_stale_seconds
+    ),
+    session_factory=db_helper.session_factory,
+    breaker=CircuitBreaker(
+        failure_threshold=settings.feed.breaker_failures,
+        reset_seconds=settings.feed.breaker_reset_seconds,
+    ),
+    timeout=settings.feed.timeout_ms / 1000,
+    max_stale_seconds=settings.feed.max_stale_seconds,
+)
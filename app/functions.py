@@ -1,16 +1,71 @@
+import json
 import os
-from typing import Optional, Type
+import re
+import uuid
+from typing import AsyncIterator, Callable, Literal, Optional, Type
 
-from fastapi import HTTPException, UploadFile, status
+from fastapi import HTTPException, status
 from pydantic import ValidationError
 from sqlalchemy import delete, func, insert, select, update, Result
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import InstrumentedAttribute, load_only, selectinload
-
-from app.base_models import Follow, Image, Like, Tweet, User
-from app.basic_schema import LikeBase, ResultBase, TweetBase, UserBase, UserData, UserRead
-from app.config import logger
+from sqlalchemy.orm import InstrumentedAttribute
+
+from app.base_models import Follow, Image, Like, Tweet, TweetTag, User
+from app.basic_schema import (
+    LikeBase,
+    ResultBase,
+    TweetBase,
+    TweetCreate,
+    TweetRead,
+    UserBase,
+    UserData,
+    UserRead,
+)
+from app.cache import LRUCacheBackend, tweet_cache
+from app.config import logger, settings
+from app.db_helper import in_outer_transaction
+from app.events import broker
+from app.feed_cache import FeedUnavailable, feed_cache
+from app.jobs import enqueue, job_handler
+from app.liked_index import like_event, liked_index
+from app.notifications import FOLLOW, LIKE, notify
+from app.sharding import id_bucket, merge_by_time, shards, user_bucket
+from app.storage import storage
+from app.timing import measure
+from app.trends import extract_tags, trend_tracker
+from app.views import view_tracker
+
+# действия после фиксации транзакции: рассылка событий, учет трендов
+AfterCommit = list[Callable[[], None]]
+
+
+def media_url(file_url: str) -> str:
+    return settings.media.url_prefix + file_url
+
+
+# длина части имени из хэша или uuid, hex-символов
+MEDIA_KEY_LENGTH = 32
+MEDIA_EXTENSION = re.compile(r"\.[a-z0-9]{1,10}")
+
+
+def media_name(user_id: int, filename: str, digest: Optional[str] = None) -> str:
+    """
+    Image.url и имя файла в хранилище: id автора и sha256 содержимого, а если
+    содержимое заранее неизвестно - случайный uuid. Имя публичное, поэтому
+    секретов в нем нет; от имени файла клиента остается только расширение.
+    """
+    extension = os.path.splitext(os.path.basename(filename))[1].lower()
+    if not MEDIA_EXTENSION.fullmatch(extension):
+        extension = ""
+    key = (digest or uuid.uuid4().hex)[:MEDIA_KEY_LENGTH]
+    return f"{user_id}_{key}{extension}"
+
+
+def is_media_name(user_id: int, name: str) -> bool:
+    """Имя выдано media_name этому пользователю"""
+    pattern = rf"{user_id}_[0-9a-f]{{{MEDIA_KEY_LENGTH}}}({MEDIA_EXTENSION.pattern})?"
+    return re.fullmatch(pattern, name) is not None
 
 
 async def get_api_key(request):
@@ -24,17 +79,42 @@ async def get_api_key(request):
     return api_key
 
 
+api_key_cache = LRUCacheBackend(
+    max_items=settings.cache.api_keys_max_items,
+    ttl_seconds=settings.cache.api_keys_ttl_seconds,
+)
+unknown_api_keys = LRUCacheBackend(
+    max_items=settings.cache.api_keys_max_items,
+    ttl_seconds=settings.cache.unknown_api_keys_ttl_seconds,
+)
+
+
 async def get_user_id_by_api_key(
     session: AsyncSession, api_key: str
 ) -> int | None:
+    with measure("auth"):
+        return await _get_user_id_by_api_key(session=session, api_key=api_key)
+
+
+async def _get_user_id_by_api_key(session: AsyncSession, api_key: str) -> int | None:
     logger.info("Стартанули получение id ")
+    if not api_key:
+        return None
+    # закэшированный ответ не берет соединение из пула
+    cached = await api_key_cache.get_many([api_key])
+    if cached:
+        return cached[api_key]
+    if await unknown_api_keys.get_many([api_key]):
+        return None
     try:
-        stmt = select(User).where(User.api_key == api_key)
+        stmt = select(User.id).where(User.api_key == api_key)
         result = await session.execute(stmt)
-        user = result.scalar_one_or_none()
-        if user:
-            logger.info(f"user id - {user.id}")
-            return user.id
+        user_id = result.scalar_one_or_none()
+        if user_id:
+            logger.info(f"user id - {user_id}")
+            await api_key_cache.set_many({api_key: user_id})
+            return user_id
+        await unknown_api_keys.set_many({api_key: True})
         return None
     except ValidationError as e:
         logger.error(f"Ошибка валидации Pydantic: {e}")
@@ -45,6 +125,39 @@ async def get_user_id_by_api_key(
         raise HTTPException(status_code=500, detail="Database error")
 
 
+async def get_follow_page(
+    session: AsyncSession,
+    user_id: int,
+    direction: Literal["followers", "following"],
+    limit: int,
+    cursor: Optional[int] = None,
+) -> tuple[list[UserBase], Optional[int]]:
+    """
+    Страница подписчиков или подписок пользователя, от новых к старым.
+
+    Постраничный вывод по ключу follow.id: cursor - значение next_cursor
+    предыдущей страницы.
+
+    :return: пользователи страницы и курсор следующей страницы
+    """
+    if direction == "followers":
+        owner, other = Follow.following_id, Follow.follower_id
+    else:
+        owner, other = Follow.follower_id, Follow.following_id
+    stmt = (
+        select(Follow.id, User.id.label("user_id"), User.name)
+        .join(User, User.id == other)
+        .where(owner == user_id)
+        .order_by(Follow.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor is not None:
+        stmt = stmt.where(Follow.id < cursor)
+    rows = (await session.execute(stmt)).all()
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return [UserBase(id=row.user_id, name=row.name) for row in rows[:limit]], next_cursor
+
+
 async def get_user_by_id(session: AsyncSession, user_id: int) -> Optional[UserData]:
     try:
         logger.info("Начали выполнение функции по получению объекта Юзера")
@@ -55,32 +168,37 @@ async def get_user_by_id(session: AsyncSession, user_id: int) -> Optional[UserDa
         if user is None:
             return None
 
-        logger.info("Начали получение фолловеров юзера")
-        followers_stmt = (
-            select(User)
-            .join(Follow, User.id == Follow.follower_id)
-            .where(Follow.following_id == user_id)
+        counts = await session.execute(
+            select(
+                select(func.count(Follow.id))
+                .where(Follow.following_id == user_id)
+                .scalar_subquery(),
+                select(func.count(Follow.id))
+                .where(Follow.follower_id == user_id)
+                .scalar_subquery(),
+            )
+        )
+        followers_count, following_count = counts.one()
+
+        page_size = settings.users.follow_page_size
+        followers_data, followers_cursor = await get_follow_page(
+            session=session, user_id=user_id, direction="followers", limit=page_size
         )
-        followers_result = await session.execute(followers_stmt)
-        followers_data = [
-            UserBase(id=f.id, name=f.name) for f in followers_result.scalars()
-        ]
-        logger.info(f"Получены фолловеры {followers_data}")
-
-        logger.info("Начали получение списка тех, на кого подписан юзер")
-        following_stmt = (
-            select(User)
-            .join(Follow, User.id == Follow.following_id)
-            .where(Follow.follower_id == user_id)
+        logger.info(f"Получено фолловеров {len(followers_data)} из {followers_count}")
+        following_data, following_cursor = await get_follow_page(
+            session=session, user_id=user_id, direction="following", limit=page_size
         )
-        following_result = await session.execute(following_stmt)
-        following_data = [
-            UserBase(id=f.id, name=f.name) for f in following_result.scalars()
-        ]
-        logger.info(f"Юзер подписан на {following_data}")
+        logger.info(f"Получено подписок {len(following_data)} из {following_count}")
 
         user_data = UserData(
-            id=user.id, name=user.name, followers=followers_data, following=following_data
+            id=user.id,
+            name=user.name,
+            followers=followers_data,
+            following=following_data,
+            followers_count=followers_count,
+            following_count=following_count,
+            followers_next_cursor=followers_cursor,
+            following_next_cursor=following_cursor,
         )
         return user_data
 
@@ -94,20 +212,49 @@ async def get_user_by_id(session: AsyncSession, user_id: int) -> Optional[UserDa
 
 async def get_tweet_by_id(session: AsyncSession, tweet_id: int) -> Tweet | None:
     stmt = select(Tweet).where(Tweet.id == tweet_id)
-    result = await session.execute(stmt)
-    tweet = result.scalar_one_or_none()
+    async with shards.for_tweet(session, tweet_id) as tweet_session:
+        result = await tweet_session.execute(stmt)
+        tweet = result.scalar_one_or_none()
     if tweet:
         logger.info(f"Твит {tweet} получен")
         return tweet
     return None
 
 
-async def write_new_tweet(user_id: id, content: str, session: AsyncSession) -> id:
+async def write_new_tweet(
+    user_id: id,
+    content: str,
+    session: AsyncSession,
+    after_commit: Optional[list[Callable[[], None]]] = None,
+) -> id:
+    """
+    Записывает твит и его теги и учитывает теги в трендах.
+
+    :param after_commit: если передан, теги попадают в тренды только после
+        фиксации внешней транзакции пакета, а не сразу
+    """
     logger.info("Начали процесс получения ид")
-    stmt = insert(Tweet).values(user_id=user_id, content=content).returning(Tweet.id)
-    result = await session.execute(stmt)
-    tweet_id = result.scalar_one()
-    await session.commit()
+    tags = extract_tags(content)
+    async with shards.for_user(session, user_id) as tweet_session:
+        new_id = await shards.new_id(tweet_session, "tweets", user_bucket(user_id))
+        stmt = (
+            insert(Tweet)
+            .values(user_id=user_id, content=content, **new_id)
+            .returning(Tweet.id)
+        )
+        result = await tweet_session.execute(stmt)
+        tweet_id = result.scalar_one()
+        if tags:
+            logger.info(f"В твите найдены теги {tags}")
+            await tweet_session.execute(
+                insert(TweetTag),
+                [{"tweet_id": tweet_id, "kind": kind, "tag": tag} for kind, tag in tags],
+            )
+        await tweet_session.commit()
+    if after_commit is None:
+        trend_tracker.add_tags(tags)
+    else:
+        after_commit.append(lambda: trend_tracker.add_tags(tags))
     logger.info(f"tweet id - {tweet_id}")
     return tweet_id
 
@@ -118,39 +265,48 @@ async def update_tweet_with_media(
     session: AsyncSession,
 ) -> None:
     try:
-        for media_id in media_ids:
-            update_tweet_id_query = (
-                update(Image).where(Image.id == media_id).values(tweet_id=tweet_id)
-            )
-            await session.execute(update_tweet_id_query)
-            await session.commit()
+        # картинки автора лежат на шарде его твитов
+        async with shards.for_tweet(session, tweet_id) as tweet_session:
+            for media_id in media_ids:
+                update_tweet_id_query = (
+                    update(Image).where(Image.id == media_id).values(tweet_id=tweet_id)
+                )
+                await tweet_session.execute(update_tweet_id_query)
+                await tweet_cache.invalidate(session=tweet_session, tweet_ids=[tweet_id])
+                await tweet_session.commit()
     except SQLAlchemyError as e:
         error_message = e
         raise HTTPException(status_code=400, detail={error_message})
 
 
-async def get_media(file_url: str, session: AsyncSession) -> Optional[Image]:
+async def get_media(file_url: str, session: AsyncSession, user_id: int) -> Optional[Image]:
     stmt = select(Image).where(Image.url == file_url)
-    result: Result = await session.execute(stmt)
-    image: Optional[Image] = result.scalars().one_or_none()
+    async with shards.for_user(session, user_id) as media_session:
+        result: Result = await media_session.execute(stmt)
+        image: Optional[Image] = result.scalars().one_or_none()
     return image
 
 
+async def insert_image(session: AsyncSession, user_id: int, file_url: str) -> int:
+    """Строка картинки без commit; session - сессия шарда пользователя"""
+    new_id = await shards.new_id(session, "images", user_bucket(user_id))
+    stmt = insert(Image).values(url=file_url, user_id=user_id, **new_id).returning(Image.id)
+    return (await session.execute(stmt)).scalar_one()
+
+
 async def save_media(
-    session: AsyncSession, file: UploadFile, user_id: int, file_url: str
+    session: AsyncSession, data: bytes, user_id: int, file_url: str
 )-> Optional[int]:
     try:
-        stmt = insert(Image).values(url=file_url).returning(Image.id)
-        result = await session.execute(stmt)
-        await session.commit()
-        image_id: Optional[int] = result.scalar_one()
-
-        if not os.path.exists("media"):
-            os.makedirs("media")
-        filepath = f"media/{file.filename}"
-        with open(filepath, "wb") as buffer:
-            contents = await file.read()
-            buffer.write(contents)
+        # сначала файл: строка картинки не должна ссылаться на незаписанный файл.
+        # Имя файла совпадает с Image.url, чтобы файл можно было найти по строке
+        await storage.write(file_url, data)
+
+        async with shards.for_user(session, user_id) as media_session:
+            image_id: Optional[int] = await insert_image(
+                session=media_session, user_id=user_id, file_url=file_url
+            )
+            await media_session.commit()
         return image_id
 
     except IntegrityError as e:
@@ -160,43 +316,327 @@ async def save_media(
         raise HTTPException(status_code=500, detail=f"Ошибка при сохранениии файла: {e}")
 
 
-async def get_tweets_info(session: AsyncSession):
-    select_query = (
-        select(Tweet).options(
-            load_only(Tweet.id, Tweet.content),
-            selectinload(Tweet.author),
-            selectinload(Tweet.likes),
+def presign_media_upload(user_id: int, filename: str) -> dict:
+    """
+    Ссылка для загрузки файла картинки клиентом прямо в хранилище.
+
+    Содержимое заранее неизвестно, поэтому имя файла - случайное (media_name).
+    """
+    file_url = media_name(user_id, filename)
+    presigned = storage.presign_upload(
+        file_url, expires_seconds=settings.media.presign_expires_seconds
+    )
+    if presigned is None:
+        raise HTTPException(
+            status_code=400, detail="Хранилище не поддерживает прямую загрузку"
+        )
+    return {"result": True, "name": file_url, **presigned}
+
+
+async def complete_media_upload(session: AsyncSession, user_id: int, file_url: str) -> int:
+    """
+    Записывает картинку, загруженную клиентом прямо в хранилище.
+
+    Файл через приложение не проходит: проверяется только, что он есть
+    и что имя выдано этому пользователю в presign_media_upload.
+    """
+    if not is_media_name(user_id, file_url):
+        raise HTTPException(status_code=422, detail="Неверное имя файла")
+    media = await get_media(file_url=file_url, session=session, user_id=user_id)
+    if media:
+        return media.id
+    if not await storage.exists(file_url):
+        raise HTTPException(status_code=404, detail="Файл не загружен в хранилище")
+    async with shards.for_user(session, user_id) as media_session:
+        image_id = await insert_image(
+            session=media_session, user_id=user_id, file_url=file_url
+        )
+        await media_session.commit()
+    logger.info(f"Картинка {file_url} загружена напрямую, id {image_id}")
+    return image_id
+
+
+async def load_likes_summary(
+    tweet_ids: list[int], session: AsyncSession, preview_size: int
+) -> dict[int, dict]:
+    """
+    Количество лайков и последние лайкнувшие для набора твитов.
+
+    Два запроса на всю пачку, сколько бы лайков ни было у твита. Имена
+    лайкнувших не загружаются: пользователи лежат в основной базе, а лайки
+    могут быть на шарде (см. load_users).
+    """
+    summary: dict[int, dict] = {
+        tweet_id: {"likes_count": 0, "likes": []} for tweet_id in tweet_ids
+    }
+    result = await session.execute(
+        select(Like.tweet_id, func.count(Like.id))
+        .where(Like.tweet_id.in_(tweet_ids))
+        .group_by(Like.tweet_id)
+    )
+    for tweet_id, count in result:
+        summary[tweet_id]["likes_count"] = count
+    position = (
+        func.row_number()
+        .over(partition_by=Like.tweet_id, order_by=Like.id.desc())
+        .label("position")
+    )
+    ranked = (
+        select(Like.id, Like.tweet_id, Like.user_id, position)
+        .where(Like.tweet_id.in_(tweet_ids))
+        .subquery()
+    )
+    result = await session.execute(
+        select(ranked.c.id, ranked.c.tweet_id, ranked.c.user_id)
+        .where(ranked.c.position <= preview_size)
+        .order_by(ranked.c.tweet_id, ranked.c.position)
+    )
+    for row in result:
+        summary[row.tweet_id]["likes"].append({"id": row.id, "user_id": row.user_id})
+    return summary
+
+
+async def load_attachments(
+    tweet_ids: list[int], session: AsyncSession
+) -> dict[int, list[str]]:
+    """Имена файлов картинок для набора твитов, одним запросом"""
+    attachments: dict[int, list[str]] = {tweet_id: [] for tweet_id in tweet_ids}
+    result = await session.execute(
+        select(Image.tweet_id, Image.url)
+        .where(Image.tweet_id.in_(tweet_ids))
+        .order_by(Image.id)
+    )
+    for tweet_id, url in result:
+        attachments[tweet_id].append(url)
+    return attachments
+
+
+async def get_liked_tweet_ids(
+    user_id: int, tweet_ids: list[int], session: AsyncSession
+) -> set[int]:
+    """Какие из твитов лайкнул пользователь, одним запросом"""
+    if not tweet_ids:
+        return set()
+    result = await session.execute(
+        select(Like.tweet_id)
+        .where(Like.user_id == user_id, Like.tweet_id.in_(tweet_ids))
+        .distinct()
+    )
+    return set(result.scalars().all())
+
+
+async def load_users(user_ids: set[int], session: AsyncSession) -> dict[int, dict]:
+    """Id и имена пользователей из кэша, недостающие - одним запросом"""
+    users = await tweet_cache.get_users(user_ids)
+    missing = user_ids - users.keys()
+    if missing:
+        result = await session.execute(
+            select(User.id, User.name).where(User.id.in_(missing))
+        )
+        loaded = {row.id: {"id": row.id, "name": row.name} for row in result}
+        await tweet_cache.set_users(loaded)
+        users.update(loaded)
+    return users
+
+
+async def load_feed_ids(session: AsyncSession) -> list[tuple]:
+    """(created_at, id) твитов базы от новых к старым"""
+    result = await session.execute(
+        select(Tweet.created_at, Tweet.id).order_by(
+            Tweet.created_at.desc(), Tweet.id.desc()
+        )
+    )
+    return [tuple(row) for row in result]
+
+
+async def load_tweets(session: AsyncSession, tweet_ids: list[int]) -> dict[int, dict]:
+    """Твиты для кэша вместе с лайками и картинками; все из одной базы"""
+    result = await session.execute(
+        select(Tweet.id, Tweet.content, Tweet.user_id, Tweet.views).where(
+            Tweet.id.in_(tweet_ids)
         )
-        # .options(selectinload(Tweet.likes))
     )
-    result = await session.execute(select_query)
-    tweets = result.scalars().all()
-    logger.info(f"Получили твиты {tweets}")
+    loaded = {
+        row.id: {
+            "id": row.id,
+            "content": row.content,
+            "author_id": row.user_id,
+            "views": row.views,
+        }
+        for row in result
+    }
+    likes = await load_likes_summary(
+        tweet_ids=list(loaded),
+        session=session,
+        preview_size=settings.tweets.likes_preview_size,
+    )
+    attachments = await load_attachments(tweet_ids=list(loaded), session=session)
+    for tweet_id, tweet in loaded.items():
+        tweet.update(likes[tweet_id])
+        tweet["attachments"] = attachments[tweet_id]
+    return loaded
+
+
+async def get_tweets_info(session: AsyncSession, user_id: Optional[int] = None):
+    # при шардировании ленты шардов загружаются параллельно и сливаются по времени
+    tweet_ids = merge_by_time(await shards.scatter(session, load_feed_ids))
+    tweets = await tweet_cache.get_tweets(tweet_ids)
+    missing = [tweet_id for tweet_id in tweet_ids if tweet_id not in tweets]
+    logger.info(f"Твитов в кэше {len(tweets)}, загружаем из базы {len(missing)}")
+    if missing:
+        loaded = {}
+        for part in await shards.scatter_ids(session, missing, load_tweets):
+            loaded.update(part)
+        # незафиксированные твиты атомарного пакета в общий кэш не кладем
+        if not in_outer_transaction(session):
+            await tweet_cache.set_tweets(loaded)
+        tweets.update(loaded)
+
+    # зависит от пользователя, поэтому не кэшируется вместе с твитом
+    liked = await liked_index.liked(user_id, tweet_ids) if user_id else set()
+    if liked is None:
+        # лайков у пользователя слишком много для индекса: проверяем запросом
+        liked = set()
+
+        async def load_liked(tweet_session: AsyncSession, ids: list[int]) -> set[int]:
+            return await get_liked_tweet_ids(
+                user_id=user_id, tweet_ids=ids, session=tweet_session
+            )
+
+        for part in await shards.scatter_ids(session, tweet_ids, load_liked):
+            liked |= part
+
+    user_ids = set()
+    for tweet in tweets.values():
+        user_ids.add(tweet["author_id"])
+        user_ids.update(like["user_id"] for like in tweet["likes"])
+    users = await load_users(user_ids=user_ids, session=session)
+
     tweet_responses = []
-    for tweet in tweets:
-        logger.info(f"Вносим в список {tweet}")
+    for tweet_id in tweet_ids:
+        tweet = tweets.get(tweet_id)
+        if tweet is None:
+            # твит удалили между запросами
+            continue
         tweet_responses.append(
             TweetBase(
-                id=tweet.id,
-                content=tweet.content,
-                author=UserBase(id=tweet.author.id, name=tweet.author.name),
+                id=tweet["id"],
+                content=tweet["content"],
+                attachments=[media_url(url) for url in tweet["attachments"]],
+                author=UserBase(**users[tweet["author_id"]]),
                 likes=[
-                    LikeBase(id=like.id, user_id=like.user_id) for like in tweet.likes
+                    LikeBase(name=users[like["user_id"]]["name"], **like)
+                    for like in tweet["likes"]
                 ],
+                likes_count=tweet["likes_count"],
+                liked_by_me=tweet_id in liked,
+                views=tweet["views"],
             )
         )
+    if user_id:
+        # просмотр засчитывается при выдаче ленты; в views попадет после сброса
+        view_tracker.record(
+            tweet_ids=[tweet.id for tweet in tweet_responses], viewer_id=user_id
+        )
     return {"result": True, "tweets": tweet_responses}  # Set the 'tweets' field
 
 
+async def get_tweet_likes(
+    tweet_id: int, session: AsyncSession, limit: int, cursor: Optional[int] = None
+) -> dict:
+    """
+    Страница лайков твита, от новых к старым.
+
+    Постраничный вывод по ключу: cursor - id последнего лайка предыдущей
+    страницы, поэтому глубокие страницы не дороже первой.
+    """
+    stmt = (
+        select(Like.id, Like.user_id)
+        .where(Like.tweet_id == tweet_id)
+        .order_by(Like.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor is not None:
+        stmt = stmt.where(Like.id < cursor)
+    async with shards.for_tweet(session, tweet_id) as tweet_session:
+        rows = (await tweet_session.execute(stmt)).all()
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    users = await load_users(user_ids={row.user_id for row in rows[:limit]}, session=session)
+    return {
+        "result": True,
+        "likes": [
+            LikeBase(id=row.id, user_id=row.user_id, name=users[row.user_id]["name"])
+            for row in rows[:limit]
+        ],
+        "next_cursor": next_cursor,
+    }
+
+
+async def stream_user_tweets(
+    session: AsyncSession, user_id: int, fetch_size: int = settings.export.fetch_size
+) -> AsyncIterator[str]:
+    """
+    Отдает твиты пользователя строками NDJSON через серверный курсор.
+
+    В памяти одновременно не больше fetch_size строк, одна пачка - один кусок ответа.
+    """
+    stmt = (
+        select(Tweet.id, Tweet.content, Tweet.created_at)
+        .where(Tweet.user_id == user_id)
+        .order_by(Tweet.id)
+        .execution_options(yield_per=fetch_size)
+    )
+    async with shards.for_user(session, user_id) as tweet_session:
+        result = await tweet_session.stream(stmt)
+        exported = 0
+        async for partition in result.partitions():
+            exported += len(partition)
+            yield "".join(
+                json.dumps(
+                    {
+                        "id": row.id,
+                        "content": row.content,
+                        "created_at": row.created_at.isoformat(),
+                    },
+                    ensure_ascii=False,
+                )
+                + "\n"
+                for row in partition
+            )
+    logger.info(f"Выгружено {exported} твитов пользователя {user_id}")
+
+
 async def add_like(user_id: int, tweet_id: int, session: AsyncSession):
     try:
         logger.info(
             f"Функция добавления лайка для user id {user_id}, tweet id {tweet_id} запущена"
         )
-        new_like = Like(user_id=user_id, tweet_id=tweet_id)
-        session.add(new_like)
-        await session.commit()
-        await session.refresh(new_like)
+        # лайк лежит на шарде твита, уведомление - в основной базе
+        async with shards.for_tweet(session, tweet_id) as tweet_session:
+            new_id = await shards.new_id(tweet_session, "likes", id_bucket(tweet_id))
+            new_like = Like(user_id=user_id, tweet_id=tweet_id, **new_id)
+            tweet_session.add(new_like)
+            author_id = (
+                await tweet_session.execute(
+                    select(Tweet.user_id).where(Tweet.id == tweet_id)
+                )
+            ).scalar_one_or_none()
+            if author_id is not None:
+                await notify(
+                    session=session,
+                    user_id=author_id,
+                    kind=LIKE,
+                    actor_id=user_id,
+                    tweet_id=tweet_id,
+                )
+            await tweet_cache.invalidate(
+                session=tweet_session,
+                tweet_ids=[tweet_id],
+                events=[like_event(user_id, tweet_id, liked=True)],
+            )
+            await tweet_session.commit()
+            await session.commit()
+            await tweet_session.refresh(new_like)
         logger.info(f"ID лайка: {new_like.id}")
         return new_like.id
     except ValidationError as e:
@@ -209,16 +649,95 @@ async def add_like(user_id: int, tweet_id: int, session: AsyncSession):
 
 
 async def delete_like(user_id: int, tweet_id: int, session: AsyncSession):
-    await session.execute(
-        delete(Like).filter(Like.tweet_id == tweet_id, Like.user_id == user_id)
-    )
-    await session.commit()
+    async with shards.for_tweet(session, tweet_id) as tweet_session:
+        await tweet_session.execute(
+            delete(Like).filter(Like.tweet_id == tweet_id, Like.user_id == user_id)
+        )
+        await tweet_cache.invalidate(
+            session=tweet_session,
+            tweet_ids=[tweet_id],
+            events=[like_event(user_id, tweet_id, liked=False)],
+        )
+        await tweet_session.commit()
 
 
-async def delete_tweet_by_id(tweet_id: int, session: AsyncSession) -> None:
-    stmt = delete(Tweet).where(Tweet.id == tweet_id)
-    await session.execute(stmt)
-    await session.commit()
+async def delete_likes_chunk(tweet_id: int, session: AsyncSession, chunk_size: int) -> int:
+    """Удаляет не больше chunk_size лайков твита, возвращает количество удаленных"""
+    chunk = select(Like.id).where(Like.tweet_id == tweet_id).limit(chunk_size)
+    result = await session.execute(delete(Like).where(Like.id.in_(chunk)))
+    return result.rowcount
+
+
+async def delete_tweet_by_id(
+    tweet_id: int,
+    session: AsyncSession,
+    chunk_size: int = settings.tweets.delete_chunk_size,
+) -> None:
+    """
+    Удаляет твит вместе с лайками, тегами и картинками одной транзакцией.
+
+    Внешних ключей на секционированную tweets нет, поэтому каскад выполняется
+    здесь запросами по множеству строк. Лайки удаляются пачкой не больше
+    chunk_size; если у твита их больше, остаток дочищает фоновая задача
+    cleanup_tweet, чтобы не держать долгие блокировки. Файлы картинок
+    удаляются с диска фоновой задачей remove_media_files после commit.
+
+    При шардировании твит удаляется на своем шарде, а задачи ставятся в
+    основной базе после его commit.
+    """
+    async with shards.for_tweet(session, tweet_id) as tweet_session:
+        await tweet_session.execute(delete(Tweet).where(Tweet.id == tweet_id))
+        await tweet_session.execute(delete(TweetTag).where(TweetTag.tweet_id == tweet_id))
+        result = await tweet_session.execute(
+            delete(Image).where(Image.tweet_id == tweet_id).returning(Image.url)
+        )
+        urls = list(result.scalars())
+        if urls:
+            await enqueue(
+                session=session, kind="remove_media_files", payload={"urls": urls}
+            )
+        deleted_likes = await delete_likes_chunk(
+            tweet_id=tweet_id, session=tweet_session, chunk_size=chunk_size
+        )
+        if deleted_likes >= chunk_size:
+            logger.info(f"У твита {tweet_id} много лайков, остаток удалит фоновая задача")
+            await enqueue(
+                session=session,
+                kind="cleanup_tweet",
+                payload={"tweet_id": tweet_id, "chunk_size": chunk_size},
+            )
+        await tweet_cache.invalidate(session=tweet_session, tweet_ids=[tweet_id])
+        await tweet_session.commit()
+        await session.commit()
+    logger.info(f"Твит {tweet_id} удален: лайков {deleted_likes}, картинок {len(urls)}")
+
+
+@job_handler("cleanup_tweet")
+async def cleanup_tweet(session: AsyncSession, payload: dict) -> None:
+    """
+    Фоновая задача: дочищает лайки удаленного твита пачками,
+    фиксируя каждую пачку отдельно.
+    """
+    tweet_id = payload["tweet_id"]
+    chunk_size = payload.get("chunk_size", settings.tweets.delete_chunk_size)
+    total = 0
+    async with shards.for_tweet(session, tweet_id) as tweet_session:
+        while True:
+            deleted = await delete_likes_chunk(
+                tweet_id=tweet_id, session=tweet_session, chunk_size=chunk_size
+            )
+            await tweet_session.commit()
+            total += deleted
+            if deleted < chunk_size:
+                break
+    logger.info(f"Удалено {total} оставшихся лайков твита {tweet_id}")
+
+
+@job_handler("remove_media_files")
+async def remove_media_files(session: AsyncSession, payload: dict) -> None:
+    """Фоновая задача: удаляет из хранилища файлы удаленных картинок"""
+    removed = await storage.delete_many(payload["urls"])
+    logger.info(f"Удалено файлов картинок: {removed}")
 
 
 async def delete_following_by_id(
@@ -255,6 +774,9 @@ async def create_follow_to_user(
 
         stmt = insert(Follow).values(follower_id=follower_id, following_id=following_id)
         await session.execute(stmt)
+        await notify(
+            session=session, user_id=following_id, kind=FOLLOW, actor_id=follower_id
+        )
         await session.commit()
         logger.info("Подписка создана")
         return True
@@ -262,3 +784,146 @@ async def create_follow_to_user(
         await session.rollback()
         logger.error(f"Ошибка создания подписки: {e}")
         return False
+
+
+# Общая логика эндпоинтов: ее вызывают и маршруты, и операции пакета /batch,
+# поэтому коды ошибок и сообщения у них совпадают. События и тренды
+# копятся в after_commit и выполняются вызывающим после фиксации.
+
+
+async def get_user_info(session: AsyncSession, user_id: int) -> dict:
+    user = await get_user_by_id(session=session, user_id=user_id)
+    if not user:
+        logger.error(f"Пользователь с id={user_id} не найден")
+        raise HTTPException(status_code=401, detail="Ошибка ввода данных")
+    logger.info("Получен юзер")
+    return {"result": True, "user": user}
+
+
+async def get_feed(session: AsyncSession, user_id: int) -> tuple[dict, Optional[float]]:
+    """
+    Лента через feed_cache: если база не отвечает, отдается последняя удачная.
+    Во внешней транзакции лента читается в ее сессии, чтобы увидеть свои записи.
+
+    :return: лента и ее возраст в секундах, None - только что из базы
+    """
+
+    async def load(feed_session: AsyncSession) -> dict:
+        tweets = await get_tweets_info(session=feed_session, user_id=user_id)
+        return TweetRead.model_validate(tweets).model_dump(mode="json")
+
+    if in_outer_transaction(session):
+        return await load(session), None
+    try:
+        return await feed_cache.get(user_id=user_id, load=load)
+    except FeedUnavailable as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(settings.admission.retry_after_seconds)},
+        )
+
+
+async def post_tweet(
+    session: AsyncSession, user_id: int, tweet_data: TweetCreate, after_commit: AfterCommit
+) -> dict:
+    tweet_id = await write_new_tweet(
+        user_id=user_id,
+        content=tweet_data.tweet_data,
+        session=session,
+        after_commit=after_commit,
+    )
+    if tweet_data.image_ids:
+        logger.info(f"обнаружены изображения {tweet_data.image_ids}")
+        await update_tweet_with_media(
+            media_ids=tweet_data.image_ids, tweet_id=tweet_id, session=session
+        )
+    logger.info("Твит добавлен")
+    after_commit.append(lambda: broker.publish_tweet(tweet_id=tweet_id, user_id=user_id))
+    return {"result": True, "tweet_id": tweet_id}
+
+
+async def remove_tweet(session: AsyncSession, user_id: int, tweet_id: int) -> dict:
+    tweet = await get_tweet_by_id(session=session, tweet_id=tweet_id)
+    if not tweet or tweet.user_id != user_id:
+        logger.info(
+            f"Пользователь id {user_id} не является автором твита. Удаление запрещено"
+        )
+        raise HTTPException(status_code=403, detail="Ошибка на стороне сервера")
+    await delete_tweet_by_id(tweet_id=tweet_id, session=session)
+    logger.info("Твит удален")
+    return {"result": True}
+
+
+async def like_tweet(
+    session: AsyncSession, user_id: int, tweet_id: int, after_commit: AfterCommit
+) -> dict:
+    if not await get_tweet_by_id(session=session, tweet_id=tweet_id):
+        logger.error(
+            f"Запрос POST LIKE для tweet ID: {tweet_id}, user ID: {user_id} не выполнен. Твит не найден"
+        )
+        raise HTTPException(status_code=404, detail="Твит не найден")
+    await add_like(user_id=user_id, tweet_id=tweet_id, session=session)
+    logger.info(f"Выполнен запрос POST LIKE для tweet ID: {tweet_id}, user ID: {user_id}")
+    after_commit.append(
+        lambda: broker.publish_like(tweet_id=tweet_id, user_id=user_id, liked=True)
+    )
+    return {"result": True}
+
+
+async def unlike_tweet(
+    session: AsyncSession, user_id: int, tweet_id: int, after_commit: AfterCommit
+) -> dict:
+    if not await get_tweet_by_id(session=session, tweet_id=tweet_id):
+        logger.info(f"Твит {tweet_id} не найден, лайк не удален")
+        raise HTTPException(status_code=403, detail="Ошибка на стороне сервера")
+    await delete_like(user_id=user_id, tweet_id=tweet_id, session=session)
+    logger.info("Лайк удален")
+    after_commit.append(
+        lambda: broker.publish_like(tweet_id=tweet_id, user_id=user_id, liked=False)
+    )
+    return {"result": True}
+
+
+async def follow_user(
+    session: AsyncSession, follower_id: int, following_id: int, after_commit: AfterCommit
+) -> dict:
+    if await check_follow_user(
+        user_id=follower_id, following_id=following_id, session=session
+    ):
+        logger.info(f"Пользователь {follower_id} уже подписан на {following_id}")
+        raise HTTPException(
+            status_code=401, detail="Запрос не обработан. Пользователь уже подписан"
+        )
+    if not await create_follow_to_user(
+        follower_id=follower_id, following_id=following_id, session=session
+    ):
+        logger.error(f"Ошибка создания подписки {follower_id} на {following_id}")
+        raise HTTPException(status_code=500, detail="Ошибка создания подписки")
+    after_commit.append(
+        lambda: broker.publish_follow(
+            follower_id=follower_id, following_id=following_id, followed=True
+        )
+    )
+    return {"result": True}
+
+
+async def unfollow_user(
+    session: AsyncSession, follower_id: int, following_id: int, after_commit: AfterCommit
+) -> dict:
+    if not await check_follow_user(
+        user_id=follower_id, following_id=following_id, session=session
+    ):
+        logger.info(
+            f"Пользователь {follower_id} не подписан на {following_id}, удаление невозможно"
+        )
+        raise HTTPException(status_code=401, detail="Подписки не существует")
+    await delete_following_by_id(
+        follower_id=follower_id, following_id=following_id, session=session
+    )
+    after_commit.append(
+        lambda: broker.publish_follow(
+            follower_id=follower_id, following_id=following_id, followed=False
+        )
+    )
+    return {"result": True}
@@ -0,0 +1,226 @@
+import asyncio
+import hashlib
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Optional
+
+from fastapi import HTTPException, Request, Response
+from sqlalchemy import and_, delete, null, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.base_models import IdempotencyKey
+from app.config import logger, settings
+from app.db_helper import db_helper
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def fingerprint(*parts: Any) -> str:
+    """Хэш запроса, с которым связан ключ"""
+    return hashlib.sha256("\n".join(str(part) for part in parts).encode()).hexdigest()
+
+
+class IdempotentRequest:
+    """
+    Запрос с ключом идемпотентности.
+
+    response - сохраненный ответ первого запроса с тем же ключом; если он
+    есть, обработчик возвращает его и ничего не делает.
+    """
+
+    def __init__(self, response: Optional[dict] = None) -> None:
+        self.response = response
+        self.result: Optional[dict] = None
+
+    def save(self, result: dict) -> dict:
+        """Запоминает ответ для повторов и возвращает его"""
+        self.result = result
+        return result
+
+
+class IdempotencyStore:
+    """
+    Ключи идемпотентности в таблице idempotency_keys.
+
+    Первый запрос с ключом занимает его отдельной короткой транзакцией,
+    чтобы ключ сразу видели другие воркеры; ответ записывается после
+    выполнения. Повтор после завершения получает ответ одним запросом,
+    параллельный дубль ждет первого, а при ошибке ключ освобождается,
+    и повтор выполняется заново.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        ttl_seconds: int,
+        lock_seconds: int,
+        wait_seconds: float,
+        poll_interval: float,
+        purge_interval_seconds: int,
+    ) -> None:
+        self.session_factory = session_factory
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.lock = timedelta(seconds=lock_seconds)
+        self.wait_seconds = wait_seconds
+        self.poll_interval = poll_interval
+        self.purge_interval_seconds = purge_interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    async def _claim(self, session: AsyncSession, user_id: int, key: str, digest: str) -> bool:
+        now = datetime.now()
+        stmt = insert(IdempotencyKey).values(
+            user_id=user_id, key=key, fingerprint=digest, created_at=now
+        )
+        # истекший или брошенный ключ занимаем заново
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[IdempotencyKey.user_id, IdempotencyKey.key],
+            set_={"fingerprint": digest, "response": null(), "created_at": now},
+            where=or_(
+                IdempotencyKey.created_at < now - self.ttl,
+                and_(
+                    IdempotencyKey.response.is_(None),
+                    IdempotencyKey.created_at < now - self.lock,
+                ),
+            ),
+        ).returning(IdempotencyKey.user_id)
+        claimed = (await session.execute(stmt)).scalar_one_or_none()
+        await session.commit()
+        return claimed is not None
+
+    async def begin(self, user_id: int, key: str, digest: str) -> Optional[dict]:
+        """
+        Занимает ключ или ждет ответа первого запроса с ним.
+
+        :return: None, если ключ занят этим запросом, иначе сохраненный ответ
+        """
+        deadline = time.monotonic() + self.wait_seconds
+        while True:
+            async with self.session_factory() as session:
+                row = (
+                    await session.execute(
+                        select(
+                            IdempotencyKey.fingerprint,
+                            IdempotencyKey.response,
+                            IdempotencyKey.created_at,
+                        ).where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+                    )
+                ).one_or_none()
+                now = datetime.now()
+                if row is not None and row.created_at >= now - self.ttl:
+                    if row.fingerprint != digest:
+                        raise HTTPException(
+                            status_code=422,
+                            detail="Ключ идемпотентности уже использован с другим запросом",
+                        )
+                    if row.response is not None:
+                        logger.info(f"Повтор запроса с ключом {key}, отдаем сохраненный ответ")
+                        return row.response
+                if row is None or row.created_at < now - self.lock:
+                    if await self._claim(session, user_id, key, digest):
+                        return None
+                    # ключ только что занял другой запрос
+                    continue
+            if time.monotonic() >= deadline:
+                raise HTTPException(
+                    status_code=409, detail="Запрос с этим ключом идемпотентности еще выполняется"
+                )
+            await asyncio.sleep(self.poll_interval)
+
+    async def complete(self, user_id: int, key: str, response: dict) -> None:
+        async with self.session_factory() as session:
+            await session.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+                .values(response=response)
+            )
+            await session.commit()
+
+    async def release(self, user_id: int, key: str) -> None:
+        async with self.session_factory() as session:
+            await session.execute(
+                delete(IdempotencyKey).where(
+                    IdempotencyKey.user_id == user_id,
+                    IdempotencyKey.key == key,
+                    IdempotencyKey.response.is_(None),
+                )
+            )
+            await session.commit()
+
+    @asynccontextmanager
+    async def request(
+        self, request: Request, response: Response, user_id: int, digest: str
+    ) -> AsyncIterator[IdempotentRequest]:
+        """
+        Выполняет блок не больше одного раза на ключ из заголовка запроса.
+
+        Без заголовка блок выполняется как обычно. Ответ, переданный в
+        IdempotentRequest.save, сохраняется для повторов; если блок упал,
+        ключ освобождается.
+        """
+        key = request.headers.get(settings.idempotency.header)
+        if key is None:
+            yield IdempotentRequest()
+            return
+        if not key or len(key) > 255:
+            raise HTTPException(status_code=400, detail="Некорректный ключ идемпотентности")
+
+        stored = await self.begin(user_id=user_id, key=key, digest=digest)
+        if stored is not None:
+            response.headers[REPLAYED_HEADER] = "true"
+            yield IdempotentRequest(stored)
+            return
+
+        idempotent = IdempotentRequest()
+        try:
+            yield idempotent
+        except BaseException:
+            await self.release(user_id=user_id, key=key)
+            raise
+        if idempotent.result is None:
+            await self.release(user_id=user_id, key=key)
+        else:
+            await self.complete(user_id=user_id, key=key, response=idempotent.result)
+
+    async def purge(self) -> int:
+        async with self.session_factory() as session:
+            result = await session.execute(
+                delete(IdempotencyKey).where(
+                    IdempotencyKey.created_at < datetime.now() - self.ttl
+                )
+            )
+            await session.commit()
+        if result.rowcount:
+            logger.info(f"Удалено {result.rowcount} истекших ключей идемпотентности")
+        return result.rowcount
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.purge_interval_seconds)
+            try:
+                await self.purge()
+            except Exception as e:
+                logger.error(f"Ошибка очистки ключей идемпотентности: {e}", exc_info=True)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+idempotency_store = IdempotencyStore(
+    session_factory=db_helper.session_factory,
+    ttl_seconds=settings.idempotency.ttl_seconds,
+    lock_seconds=settings.idempotency.lock_seconds,
+    wait_seconds=settings.idempotency.wait_seconds,
+    poll_interval=settings.idempotency.poll_interval_ms / 1000,
+    purge_interval_seconds=settings.idempotency.purge_interval_seconds,
+)
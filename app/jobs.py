@@ -0,0 +1,259 @@
+import asyncio
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable
+
+from sqlalchemy import and_, delete, func, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.base_models import Job
+from app.config import logger, settings
+from app.db_helper import db_helper
+
+JobHandler = Callable[[AsyncSession, dict[str, Any]], Awaitable[None]]
+HANDLERS: dict[str, JobHandler] = {}
+
+QUEUED = "queued"
+RUNNING = "running"
+FAILED = "failed"
+
+
+def job_handler(kind: str) -> Callable[[JobHandler], JobHandler]:
+    """Регистрирует обработчик задач вида kind"""
+
+    def decorator(func: JobHandler) -> JobHandler:
+        HANDLERS[kind] = func
+        return func
+
+    return decorator
+
+
+async def enqueue(
+    session: AsyncSession,
+    kind: str,
+    payload: dict[str, Any],
+    delay_seconds: float = 0,
+    max_attempts: int = settings.jobs.max_attempts,
+) -> int:
+    """
+    Ставит задачу в очередь в текущей транзакции, без commit.
+
+    Задача появится в очереди только вместе с изменениями вызывающего кода
+    и пропадет, если транзакция откатится.
+
+    :return: id задачи
+    """
+    stmt = (
+        insert(Job)
+        .values(
+            kind=kind,
+            payload=payload,
+            max_attempts=max_attempts,
+            run_at=datetime.now() + timedelta(seconds=delay_seconds),
+        )
+        .returning(Job.id)
+    )
+    job_id = (await session.execute(stmt)).scalar_one()
+    logger.info(f"Задача {kind} {job_id} поставлена в очередь")
+    return job_id
+
+
+class JobStats:
+    """Счетчики и задержки выполненных задач в этом процессе"""
+
+    def __init__(self, window: int = 1000) -> None:
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+        # от постановки в очередь до завершения, секунд
+        self.latencies: deque[float] = deque(maxlen=window)
+
+    def latency(self) -> dict[str, float]:
+        if not self.latencies:
+            return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+        values = sorted(self.latencies)
+        return {
+            "p50": values[len(values) // 2],
+            "p95": values[min(len(values) - 1, int(len(values) * 0.95))],
+            "max": values[-1],
+        }
+
+
+class JobQueue:
+    """
+    Очередь задач в таблице jobs.
+
+    Воркеры забирают задачи пачками через SELECT ... FOR UPDATE SKIP LOCKED,
+    поэтому несколько воркеров и процессов не получают одну задачу дважды.
+    Выполненная задача удаляется в той же транзакции, что и работа обработчика.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        workers: int,
+        batch_size: int,
+        poll_interval_seconds: float,
+        backoff_seconds: float,
+        backoff_max_seconds: float,
+        visibility_timeout_seconds: float,
+    ) -> None:
+        self.session_factory = session_factory
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval_seconds = poll_interval_seconds
+        self.backoff_seconds = backoff_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.visibility_timeout_seconds = visibility_timeout_seconds
+        self.stats = JobStats()
+        self._tasks: list[asyncio.Task] = []
+
+    def backoff(self, attempts: int) -> float:
+        return min(self.backoff_seconds * 2 ** (attempts - 1), self.backoff_max_seconds)
+
+    async def dequeue(self) -> list[Any]:
+        now = datetime.now()
+        abandoned = now - timedelta(seconds=self.visibility_timeout_seconds)
+        # брошенная задача, исчерпавшая попытки, больше не запускается
+        exhausted = (
+            update(Job)
+            .where(
+                Job.status == RUNNING,
+                Job.started_at < abandoned,
+                Job.attempts >= Job.max_attempts,
+            )
+            .values(
+                status=FAILED, last_error="Воркер не завершил задачу за отведенное время"
+            )
+            .returning(Job.id)
+        )
+        candidates = (
+            select(Job.id)
+            .where(
+                or_(
+                    and_(Job.status == QUEUED, Job.run_at <= now),
+                    and_(
+                        Job.status == RUNNING,
+                        Job.started_at < abandoned,
+                        Job.attempts < Job.max_attempts,
+                    ),
+                )
+            )
+            .order_by(Job.run_at)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        stmt = (
+            update(Job)
+            .where(Job.id.in_(candidates))
+            .values(status=RUNNING, attempts=Job.attempts + 1, started_at=now)
+            .returning(
+                Job.id, Job.kind, Job.payload, Job.attempts, Job.max_attempts, Job.created_at
+            )
+        )
+        async with self.session_factory() as session:
+            failed = (await session.execute(exhausted)).all()
+            jobs = (await session.execute(stmt)).all()
+            await session.commit()
+        if failed:
+            self.stats.failed += len(failed)
+            logger.error(f"Брошенные задачи исчерпали попытки: {[job.id for job in failed]}")
+        return jobs
+
+    async def _run_job(self, job: Any) -> None:
+        try:
+            handler = HANDLERS.get(job.kind)
+            if handler is None:
+                raise LookupError(f"Нет обработчика для задачи {job.kind}")
+            async with self.session_factory() as session:
+                await handler(session, job.payload)
+                await session.execute(delete(Job).where(Job.id == job.id))
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Задача {job.kind} {job.id} завершилась ошибкой: {e}")
+            await self._retry_or_fail(job, e)
+            return
+        self.stats.processed += 1
+        self.stats.latencies.append((datetime.now() - job.created_at).total_seconds())
+
+    async def _retry_or_fail(self, job: Any, error: Exception) -> None:
+        final = job.attempts >= job.max_attempts or job.kind not in HANDLERS
+        values: dict[str, Any] = {"last_error": f"{error.__class__.__name__}: {error}"}
+        if final:
+            values["status"] = FAILED
+            self.stats.failed += 1
+        else:
+            values["status"] = QUEUED
+            values["run_at"] = datetime.now() + timedelta(
+                seconds=self.backoff(job.attempts)
+            )
+            self.stats.retried += 1
+        async with self.session_factory() as session:
+            await session.execute(update(Job).where(Job.id == job.id).values(**values))
+            await session.commit()
+
+    async def run_batch(self) -> int:
+        """
+        Забирает и выполняет одну пачку задач.
+
+        :return: сколько задач было в пачке
+        """
+        jobs = await self.dequeue()
+        for job in jobs:
+            await self._run_job(job)
+        return len(jobs)
+
+    async def _worker(self, number: int) -> None:
+        logger.info(f"Воркер очереди {number} запущен")
+        while True:
+            try:
+                processed = await self.run_batch()
+            except Exception as e:
+                logger.error(f"Ошибка воркера очереди {number}: {e}", exc_info=True)
+                processed = 0
+            if processed < self.batch_size:
+                await asyncio.sleep(self.poll_interval_seconds)
+
+    def start(self) -> None:
+        self._tasks = [
+            asyncio.create_task(self._worker(number)) for number in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def metrics(self, session: AsyncSession) -> dict[str, Any]:
+        """Глубина очереди по статусам и задержки выполнения"""
+        result = await session.execute(
+            select(Job.status, func.count(Job.id), func.min(Job.run_at)).group_by(
+                Job.status
+            )
+        )
+        depth = {QUEUED: 0, RUNNING: 0, FAILED: 0}
+        oldest_queued = 0.0
+        for status, count, oldest in result:
+            depth[status] = count
+            if status == QUEUED and oldest:
+                oldest_queued = max(0.0, (datetime.now() - oldest).total_seconds())
+        return {
+            "depth": depth,
+            "oldest_queued_seconds": oldest_queued,
+            "processed": self.stats.processed,
+            "retried": self.stats.retried,
+            "failed": self.stats.failed,
+            "latency_seconds": self.stats.latency(),
+        }
+
+
+job_queue = JobQueue(
+    session_factory=db_helper.session_factory,
+    workers=settings.jobs.workers,
+    batch_size=settings.jobs.batch_size,
+    poll_interval_seconds=settings.jobs.poll_interval_seconds,
+    backoff_seconds=settings.jobs.backoff_seconds,
+    backoff_max_seconds=settings.jobs.backoff_max_seconds,
+    visibility_timeout_seconds=settings.jobs.visibility_timeout_seconds,
+)
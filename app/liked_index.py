@@ -0,0 +1,171 @@
+import asyncio
+import bisect
+from array import array
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.base_models import Like
+from app.cache import CacheSubscriber, tweet_cache
+from app.config import logger, settings
+from app.db_helper import db_helper
+from app.sharding import shards
+
+# примерная память на пользователя в индексе сверх самих id, байты
+ENTRY_OVERHEAD = 120
+
+
+def like_event(user_id: int, tweet_id: int, liked: bool) -> str:
+    """Сообщение в канал инвалидации: liked:<user_id>:+<tweet_id> или -<tweet_id>"""
+    return f"{LikedIndex.prefix}{user_id}:{'+' if liked else '-'}{tweet_id}"
+
+
+def _contains(tweet_ids: array, tweet_id: int) -> bool:
+    position = bisect.bisect_left(tweet_ids, tweet_id)
+    return position < len(tweet_ids) and tweet_ids[position] == tweet_id
+
+
+class LikedIndex(CacheSubscriber):
+    """
+    Лайкнутые твиты пользователей для liked_by_me в ленте.
+
+    На пользователя хранится отсортированный массив id (4 байта на лайк),
+    проверка страницы ленты - бинарный поиск по нему, без запроса к базе.
+    Массив загружается из базы при первом обращении и дальше меняется по
+    сообщениям add_like и delete_like в канале инвалидации кэша твитов:
+    NOTIFY уходит вместе с commit и доходит до всех воркеров, включая этот,
+    поэтому откаченный лайк в индекс не попадает. Память
+    ограничена max_bytes, первыми вытесняются давно не смотревшие ленту
+    пользователи. У пользователей с лайками больше max_user_items индекс
+    не строится: для них liked возвращает None, и лайки страницы
+    проверяются запросом.
+
+    Лайки, записанные в базу в обход add_like и delete_like, до вытеснения
+    пользователя не видны.
+    """
+
+    prefix = "liked:"
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        max_bytes: int,
+        max_user_items: int,
+    ) -> None:
+        self.session_factory = session_factory
+        self.max_bytes = max_bytes
+        self.max_user_items = max_user_items
+        # None - лайков слишком много, индекс не строится
+        self._users: OrderedDict[int, Optional[array]] = OrderedDict()
+        self._inflight: dict[int, asyncio.Task] = {}
+        # изменения, пришедшие во время загрузки пользователя
+        self._loading: dict[int, list[tuple[int, bool]]] = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _cost(self, tweet_ids: Optional[array]) -> int:
+        if tweet_ids is None:
+            return ENTRY_OVERHEAD
+        return ENTRY_OVERHEAD + tweet_ids.itemsize * len(tweet_ids)
+
+    def _store(self, user_id: int, tweet_ids: Optional[array]) -> None:
+        if user_id in self._users:
+            self.size -= self._cost(self._users.pop(user_id))
+        self._users[user_id] = tweet_ids
+        self.size += self._cost(tweet_ids)
+        self._evict()
+
+    def _evict(self) -> None:
+        while self.size > self.max_bytes and len(self._users) > 1:
+            _, tweet_ids = self._users.popitem(last=False)
+            self.size -= self._cost(tweet_ids)
+            self.evictions += 1
+
+    def apply(self, user_id: int, tweet_id: int, liked: bool) -> None:
+        """Лайк поставлен или снят; пользователь не в индексе - ничего не делает"""
+        if user_id in self._loading:
+            self._loading[user_id].append((tweet_id, liked))
+        tweet_ids = self._users.get(user_id)
+        if tweet_ids is None:
+            return
+        position = bisect.bisect_left(tweet_ids, tweet_id)
+        present = position < len(tweet_ids) and tweet_ids[position] == tweet_id
+        if liked and not present:
+            if len(tweet_ids) >= self.max_user_items:
+                self._store(user_id, None)
+                return
+            tweet_ids.insert(position, tweet_id)
+            self.size += tweet_ids.itemsize
+            self._evict()
+        elif not liked and present:
+            del tweet_ids[position]
+            self.size -= tweet_ids.itemsize
+
+    def notified(self, events: list[str]) -> None:
+        for event in events:
+            user_id, change = event[len(self.prefix) :].split(":")
+            self.apply(int(user_id), int(change[1:]), liked=change[0] == "+")
+
+    def reset(self) -> None:
+        self._users.clear()
+        self.size = 0
+
+    async def _load(self, user_id: int) -> Optional[array]:
+        async def load(session: AsyncSession) -> list[int]:
+            result = await session.execute(
+                select(Like.tweet_id)
+                .where(Like.user_id == user_id)
+                .distinct()
+                .limit(self.max_user_items + 1)
+            )
+            return list(result.scalars())
+
+        self._loading[user_id] = []
+        try:
+            async with self.session_factory() as session:
+                # при шардировании лайки пользователя лежат на шардах твитов
+                parts = await shards.scatter(session, load)
+            loaded = {tweet_id for part in parts for tweet_id in part}
+            if len(loaded) > self.max_user_items:
+                self._store(user_id, None)
+            else:
+                self._store(user_id, array("i", sorted(loaded)))
+        finally:
+            changes = self._loading.pop(user_id)
+            self._inflight.pop(user_id, None)
+        for tweet_id, liked in changes:
+            self.apply(user_id, tweet_id, liked)
+        logger.info(f"Загружены лайки пользователя {user_id}: {len(loaded)}")
+        return self._users.get(user_id)
+
+    async def liked(self, user_id: int, tweet_ids: Iterable[int]) -> Optional[set[int]]:
+        """
+        Какие из твитов лайкнул пользователь.
+
+        :return: None, если у пользователя слишком много лайков для индекса
+        """
+        if user_id in self._users:
+            self._users.move_to_end(user_id)
+            self.hits += 1
+            user_tweet_ids = self._users[user_id]
+        else:
+            self.misses += 1
+            task = self._inflight.get(user_id)
+            if task is None:
+                task = self._inflight[user_id] = asyncio.create_task(self._load(user_id))
+            user_tweet_ids = await asyncio.shield(task)
+        if user_tweet_ids is None:
+            return None
+        return {tweet_id for tweet_id in tweet_ids if _contains(user_tweet_ids, tweet_id)}
+
+
+liked_index = LikedIndex(
+    session_factory=db_helper.session_factory,
+    max_bytes=settings.liked_index.max_bytes,
+    max_user_items=settings.liked_index.max_user_items,
+)
+tweet_cache.subscribe(liked_index)
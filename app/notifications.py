@@ -0,0 +1,175 @@
+from datetime import datetime
+from typing import Any, Optional
+
+from sqlalchemy import case, func, select, type_coerce, update
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.expression import Grouping
+from sqlalchemy.types import Integer
+
+from app.base_models import Notification, NotificationCounter, User
+from app.config import logger, settings
+
+LIKE = "like"
+FOLLOW = "follow"
+
+
+def bucket_start(moment: datetime, bucket_seconds: int) -> datetime:
+    timestamp = moment.timestamp()
+    return datetime.fromtimestamp(timestamp - timestamp % bucket_seconds)
+
+
+async def _increment_unread(session: AsyncSession, user_id: int) -> None:
+    stmt = insert(NotificationCounter).values(user_id=user_id, unread=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[NotificationCounter.user_id],
+        set_={"unread": NotificationCounter.unread + 1},
+    )
+    await session.execute(stmt)
+
+
+async def notify(
+    session: AsyncSession,
+    user_id: int,
+    kind: str,
+    actor_id: int,
+    tweet_id: int = 0,
+    now: Optional[datetime] = None,
+) -> None:
+    """
+    Записывает событие в уведомления пользователя в текущей транзакции, без commit.
+
+    Событие добавляется к строке того же вида и объекта за текущий bucket,
+    поэтому тысяча лайков одного твита за час - одна строка. Счетчик
+    непрочитанных растет, только когда строка появляется или снова становится
+    непрочитанной.
+    """
+    if user_id == actor_id:
+        return
+    now = now or datetime.now()
+    bucket = bucket_start(now, settings.notifications.bucket_seconds)
+    key = (
+        Notification.user_id == user_id,
+        Notification.kind == kind,
+        Notification.tweet_id == tweet_id,
+        Notification.bucket == bucket,
+    )
+    # последний участник в начало; повтор участника из actor_ids не считается
+    others = func.array_remove(Notification.actor_ids, actor_id)
+    actors = Grouping(type_coerce(func.array_prepend(actor_id, others), ARRAY(Integer)))
+    previous = (
+        select(Notification.id, Notification.read)
+        .where(*key)
+        .with_for_update()
+        .subquery()
+    )
+    append = (
+        update(Notification.__table__)
+        .where(Notification.id == previous.c.id)
+        .values(
+            actor_count=Notification.actor_count
+            + case((Notification.actor_ids.any(actor_id), 0), else_=1),
+            actor_ids=actors[1 : settings.notifications.preview_size],
+            read=False,
+            updated_at=now,
+        )
+        .returning(previous.c.read)
+    )
+    create = (
+        insert(Notification)
+        .values(
+            user_id=user_id,
+            kind=kind,
+            tweet_id=tweet_id,
+            bucket=bucket,
+            actor_ids=[actor_id],
+            actor_count=1,
+            created_at=now,
+            updated_at=now,
+        )
+        .on_conflict_do_nothing(constraint="unique_notification_group")
+        .returning(Notification.id)
+    )
+
+    was_read = (await session.execute(append)).scalar_one_or_none()
+    if was_read is None:
+        created = (await session.execute(create)).scalar_one_or_none()
+        if created is None:
+            # строку только что вставил параллельный запрос
+            was_read = (await session.execute(append)).scalar_one()
+    if was_read is None or was_read:
+        await _increment_unread(session, user_id)
+    logger.info(f"Уведомление {kind} для пользователя {user_id} от {actor_id}")
+
+
+async def get_unread_count(session: AsyncSession, user_id: int) -> int:
+    result = await session.execute(
+        select(NotificationCounter.unread).where(NotificationCounter.user_id == user_id)
+    )
+    return result.scalar_one_or_none() or 0
+
+
+async def get_notifications(
+    session: AsyncSession, user_id: int, limit: int, cursor: Optional[int] = None
+) -> dict[str, Any]:
+    """
+    Страница уведомлений, от новых к старым, с курсором по id и счетчиком
+    непрочитанных. Имена участников загружаются одним запросом на страницу.
+    """
+    stmt = (
+        select(Notification)
+        .where(Notification.user_id == user_id)
+        .order_by(Notification.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor is not None:
+        stmt = stmt.where(Notification.id < cursor)
+    rows = list((await session.execute(stmt)).scalars())
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    rows = rows[:limit]
+
+    actor_ids = {actor_id for row in rows for actor_id in row.actor_ids}
+    names = {}
+    if actor_ids:
+        result = await session.execute(
+            select(User.id, User.name).where(User.id.in_(actor_ids))
+        )
+        names = {row.id: row.name for row in result}
+
+    notifications = [
+        {
+            "id": row.id,
+            "kind": row.kind,
+            "tweet_id": row.tweet_id or None,
+            "actors": [
+                {"id": actor_id, "name": names[actor_id]}
+                for actor_id in row.actor_ids
+                if actor_id in names
+            ],
+            "actor_count": row.actor_count,
+            "read": row.read,
+            "created_at": row.created_at,
+            "updated_at": row.updated_at,
+        }
+        for row in rows
+    ]
+    return {
+        "result": True,
+        "notifications": notifications,
+        "unread": await get_unread_count(session=session, user_id=user_id),
+        "next_cursor": next_cursor,
+    }
+
+
+async def mark_all_read(session: AsyncSession, user_id: int) -> None:
+    await session.execute(
+        update(Notification)
+        .where(Notification.user_id == user_id, Notification.read.is_(False))
+        .values(read=True)
+    )
+    await session.execute(
+        update(NotificationCounter)
+        .where(NotificationCounter.user_id == user_id)
+        .values(unread=0)
+    )
+    await session.commit()
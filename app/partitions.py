@@ -0,0 +1,216 @@
+import asyncio
+import gzip
+import os
+from datetime import date
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.config import logger, settings
+from app.db_helper import db_helper
+
+# таблицы, секционированные по месяцам created_at
+PARTITIONED_TABLES = ("tweets", "likes")
+# сериализует обслуживание секций между воркерами
+MAINTENANCE_LOCK_ID = 4_702_031
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+
+def partition_month(table: str, name: str) -> date | None:
+    """Месяц секции по ее имени или None для чужих таблиц"""
+    prefix = f"{table}_p"
+    if not name.startswith(prefix):
+        return None
+    try:
+        year, month = name[len(prefix) :].split("_")
+        return date(int(year), int(month), 1)
+    except ValueError:
+        return None
+
+
+async def create_partition(connection: AsyncConnection, table: str, month: date) -> None:
+    name = partition_name(table, month)
+    await connection.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"
+        )
+    )
+
+
+async def ensure_partitions(
+    connection: AsyncConnection, months_ahead: int, today: date | None = None
+) -> None:
+    """
+    Создает секции с прошлого месяца по months_ahead месяцев вперед.
+    """
+    current = month_start(today or date.today())
+    for table in PARTITIONED_TABLES:
+        for offset in range(-1, months_ahead + 1):
+            await create_partition(connection, table, add_months(current, offset))
+
+
+async def list_partitions(connection: AsyncConnection, table: str) -> dict[str, date]:
+    result = await connection.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "WHERE parent.relname = :table"
+        ),
+        {"table": table},
+    )
+    partitions = {}
+    for name in result.scalars():
+        month = partition_month(table, name)
+        if month:
+            partitions[name] = month
+    return partitions
+
+
+async def archive_partition(
+    connection: AsyncConnection, table: str, name: str, archive_dir: str
+) -> str:
+    """
+    Выгружает секцию в сжатый CSV, затем отсоединяет и удаляет ее.
+
+    Выгрузка идет до отсоединения: COPY не блокирует родительскую таблицу,
+    а DETACH и DROP выполняются короткой транзакцией. Зависимые строки
+    архивных твитов здесь не трогаются: лайки уходят в архив со своими
+    секциями, а теги и картинки вместе с файлами остаются на месте.
+
+    :return: путь к архиву
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+    raw = await connection.get_raw_connection()
+    with gzip.open(f"{path}.tmp", "wb") as archive:
+
+        async def write(chunk: bytes) -> None:
+            archive.write(chunk)
+
+        await raw.driver_connection.copy_from_table(
+            name, output=write, format="csv", header=True
+        )
+    os.replace(f"{path}.tmp", path)
+
+    async with connection.begin():
+        await connection.execute(text("SET LOCAL lock_timeout = '5s'"))
+        await connection.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+        await connection.execute(text(f"DROP TABLE {name}"))
+    logger.info(f"Секция {name} выгружена в {path} и удалена")
+    return path
+
+
+async def archive_partitions(
+    connection: AsyncConnection,
+    retention_months: int,
+    archive_dir: str,
+    today: date | None = None,
+) -> list[str]:
+    """
+    Архивирует секции старше retention_months месяцев.
+
+    :return: пути к созданным архивам
+    """
+    cutoff = add_months(month_start(today or date.today()), -retention_months)
+    archived = []
+    for table in PARTITIONED_TABLES:
+        partitions = await list_partitions(connection, table)
+        await connection.commit()
+        for name, month in sorted(partitions.items(), key=lambda item: item[1]):
+            if month < cutoff:
+                archived.append(
+                    await archive_partition(connection, table, name, archive_dir)
+                )
+    return archived
+
+
+class PartitionMaintenance:
+    """
+    Периодическое обслуживание секций: создание будущих и архивация старых.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        months_ahead: int,
+        retention_months: int,
+        archive_dir: str,
+        interval_seconds: float,
+    ) -> None:
+        self.engine = engine
+        self.months_ahead = months_ahead
+        self.retention_months = retention_months
+        self.archive_dir = archive_dir
+        self.interval_seconds = interval_seconds
+        self._task: asyncio.Task | None = None
+
+    async def run_once(self) -> list[str]:
+        async with self.engine.connect() as connection:
+            async with connection.begin():
+                await connection.execute(
+                    text("SELECT pg_advisory_xact_lock(:id)"), {"id": MAINTENANCE_LOCK_ID}
+                )
+                await ensure_partitions(connection, months_ahead=self.months_ahead)
+            if not self.retention_months:
+                return []
+            locked = await connection.scalar(
+                text("SELECT pg_try_advisory_lock(:id)"), {"id": MAINTENANCE_LOCK_ID}
+            )
+            await connection.commit()
+            if not locked:
+                logger.info("Архивацию секций выполняет другой воркер")
+                return []
+            try:
+                return await archive_partitions(
+                    connection,
+                    retention_months=self.retention_months,
+                    archive_dir=self.archive_dir,
+                )
+            finally:
+                await connection.execute(
+                    text("SELECT pg_advisory_unlock(:id)"), {"id": MAINTENANCE_LOCK_ID}
+                )
+                await connection.commit()
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка обслуживания секций: {e}", exc_info=True)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+partition_maintenance = PartitionMaintenance(
+    engine=db_helper.engine,
+    months_ahead=settings.partitions.months_ahead,
+    retention_months=settings.partitions.retention_months,
+    archive_dir=settings.partitions.archive_dir,
+    interval_seconds=settings.partitions.interval_seconds,
+)
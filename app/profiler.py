@@ -0,0 +1,149 @@
+import sys
+import threading
+import time
+from collections import Counter
+from types import FrameType
+from typing import Optional
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import logger, settings
+
+
+class ProfilerBusy(Exception):
+    """Профилировщик уже запущен"""
+
+
+def frame_label(frame: FrameType) -> str:
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{frame.f_code.co_name}"
+
+
+class SamplingProfiler:
+    """
+    Сэмплирующий профилировщик потока.
+
+    Отдельный поток раз в interval секунд снимает стек профилируемого потока
+    через sys._current_frames() и считает одинаковые стеки. Результат - формат
+    collapsed stacks ("a;b;c 12" в строке), который принимают flamegraph.pl,
+    speedscope и inferno. Пока профилировщик не запущен, он ничего не стоит.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(
+        self, thread_id: int, interval: float, only_frame: Optional[FrameType] = None
+    ) -> None:
+        """
+        :param thread_id: поток, который профилируется
+        :param interval: период сэмплирования, секунд
+        :param only_frame: учитывать только стеки, в которых есть этот кадр
+        """
+        self.thread_id = thread_id
+        self.interval = interval
+        self.only_frame = only_frame
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self) -> None:
+        frame = sys._current_frames().get(self.thread_id)
+        labels = []
+        matched = self.only_frame is None
+        while frame is not None:
+            if frame is self.only_frame:
+                matched = True
+            labels.append(frame_label(frame))
+            frame = frame.f_back
+        if matched and labels:
+            self.stacks[";".join(reversed(labels))] += 1
+        self.samples += 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self) -> None:
+        # один профилировщик на процесс: сэмплы двух сразу мешали бы друг другу
+        if not SamplingProfiler._lock.acquire(blocking=False):
+            raise ProfilerBusy("Профилировщик уже запущен")
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> str:
+        """Останавливает сэмплирование и возвращает collapsed stacks"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            SamplingProfiler._lock.release()
+        logger.info(f"Профилирование: {self.samples} сэмплов, {len(self.stacks)} стеков")
+        return self.collapsed()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def is_admin(api_key: Optional[str]) -> bool:
+    return bool(api_key) and api_key in settings.admin.api_keys
+
+
+class ProfileRequestMiddleware:
+    """
+    Профилирует один запрос с заголовком X-Profile от администратора.
+
+    Вместо ответа отдается collapsed stacks этого запроса; статус исходного
+    ответа - в заголовке X-Profiled-Status. Подключается только при
+    profiler.enabled, поэтому в обычном режиме не добавляет накладных расходов.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        headers = Headers(scope=scope)
+        if (
+            scope["type"] != "http"
+            or settings.profiler.header not in headers
+            or not is_admin(headers.get("api-key"))
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def discard(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+
+        profiler = SamplingProfiler(
+            thread_id=threading.get_ident(),
+            interval=settings.profiler.request_interval_ms / 1000,
+            only_frame=sys._getframe(),
+        )
+        try:
+            profiler.start()
+        except ProfilerBusy:
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, discard)
+        finally:
+            body = profiler.stop().encode()
+        logger.info(f"Запрос {scope['path']} профилирован за {time.perf_counter() - start:.3f} с")
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/plain; charset=utf-8"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"x-profiled-status", str(status_code).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
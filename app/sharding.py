@@ -0,0 +1,368 @@
+import asyncio
+import heapq
+import json
+import sys
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, TypeVar
+
+from sqlalchemy import MetaData, Sequence, delete, func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app.base_models import Base
+from app.config import logger, settings
+from app.db_helper import DatabaseHelper
+from app.partitions import (
+    PARTITIONED_TABLES,
+    PartitionMaintenance,
+    create_partition,
+    month_start,
+)
+
+T = TypeVar("T")
+
+# пользователи делятся на корзины по user_id % BUCKETS, корзины - по шардам
+BUCKETS = 256
+# таблицы, строки которых лежат на шарде автора твита
+SHARDED_TABLES = ("tweets", "likes", "images", "tweet_tags")
+# id этих таблиц на шардах содержат корзину: id % BUCKETS
+BUCKETED_IDS = ("tweets", "likes", "images")
+
+
+def user_bucket(user_id: int) -> int:
+    return user_id % BUCKETS
+
+
+def id_bucket(row_id: int) -> int:
+    """Корзина твита, лайка или картинки по id, выданному на шарде"""
+    return row_id % BUCKETS
+
+
+def sequence_name(table: str, bucket: int) -> str:
+    return f"{table}_b{bucket}_seq"
+
+
+def parse_bucket_map(ranges: dict[str, int], shard_count: int) -> list[int]:
+    """
+    Номер шарда для каждой корзины.
+
+    :param ranges: {"0-127": 0, "128-255": 1}; пусто - поровну по порядку
+    """
+    if not ranges:
+        return [bucket * shard_count // BUCKETS for bucket in range(BUCKETS)]
+    bucket_map = [-1] * BUCKETS
+    for key, shard in ranges.items():
+        first, _, last = key.partition("-")
+        for bucket in range(int(first), int(last or first) + 1):
+            bucket_map[bucket] = shard
+    if -1 in bucket_map:
+        raise ValueError(f"Корзине {bucket_map.index(-1)} не назначен шард")
+    if not all(0 <= shard < shard_count for shard in bucket_map):
+        raise ValueError(f"В карте корзин номер шарда вне 0..{shard_count - 1}")
+    return bucket_map
+
+
+def format_bucket_map(bucket_map: list[int]) -> dict[str, int]:
+    """Карта корзин в виде диапазонов для settings.sharding.buckets"""
+    ranges: dict[str, int] = {}
+    first = 0
+    for bucket in range(1, BUCKETS + 1):
+        if bucket == BUCKETS or bucket_map[bucket] != bucket_map[first]:
+            key = str(first) if first == bucket - 1 else f"{first}-{bucket - 1}"
+            ranges[key] = bucket_map[first]
+            first = bucket
+    return ranges
+
+
+def shard_metadata() -> MetaData:
+    """
+    Схема шарда: секционированные таблицы твитов без внешних ключей на
+    users (пользователи остаются в основной базе) и последовательности id
+    по корзинам.
+    """
+    metadata = MetaData(naming_convention=Base.metadata.naming_convention)
+    for name in SHARDED_TABLES:
+        table = Base.metadata.tables[name].to_metadata(metadata)
+        for constraint in list(table.foreign_key_constraints):
+            table.constraints.discard(constraint)
+        table.foreign_keys.clear()
+        for column in table.columns:
+            column.foreign_keys.clear()
+    for name in BUCKETED_IDS:
+        for bucket in range(BUCKETS):
+            Sequence(sequence_name(name, bucket), metadata=metadata)
+    return metadata
+
+
+def merge_by_time(
+    streams: Iterable[Iterable[tuple[Any, int]]],
+) -> list[int]:
+    """
+    Слияние лент шардов, каждая отсортирована по (created_at, id) от новых
+    к старым, в одну с тем же порядком: k-way merge через кучу.
+
+    :return: id твитов
+    """
+    return [row_id for _, row_id in heapq.merge(*streams, reverse=True)]
+
+
+class ShardedDatabaseHelper:
+    """
+    Маршрутизация твитов, лайков, картинок и тегов по шардам.
+
+    Строки лежат на шарде автора твита: шард пользователя определяется его
+    корзиной, а id строк на шардах выдаются так, что id % BUCKETS - корзина,
+    поэтому шард твита, его лайков и картинок известен по одному id. Без
+    settings.sharding.urls все в основной базе, и функции получают ту же
+    сессию, что передали.
+
+    Пользователи, подписки, уведомления и задачи остаются в основной базе.
+    """
+
+    def __init__(self, helpers: list[DatabaseHelper], bucket_map: list[int]) -> None:
+        self.helpers = helpers
+        self.bucket_map = bucket_map
+        self.metadata = shard_metadata()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.helpers)
+
+    @property
+    def urls(self) -> list[str]:
+        return [
+            helper.engine.url.render_as_string(hide_password=False)
+            for helper in self.helpers
+        ]
+
+    def shard_for_user(self, user_id: int) -> int:
+        return self.bucket_map[user_bucket(user_id)]
+
+    def shard_for_id(self, row_id: int) -> int:
+        return self.bucket_map[id_bucket(row_id)]
+
+    @asynccontextmanager
+    async def _session(
+        self, session: AsyncSession, shard: int
+    ) -> AsyncIterator[AsyncSession]:
+        if not self.enabled:
+            yield session
+            return
+        async with self.helpers[shard].session_factory() as shard_session:
+            yield shard_session
+
+    def for_user(self, session: AsyncSession, user_id: int):
+        """
+        Сессия шарда пользователя; без шардирования - переданная session.
+        commit на шарде не фиксирует основную базу, и наоборот.
+        """
+        return self._session(session, self.shard_for_user(user_id))
+
+    def for_tweet(self, session: AsyncSession, tweet_id: int):
+        """Сессия шарда, на котором лежит твит"""
+        return self._session(session, self.shard_for_id(tweet_id))
+
+    async def new_id(self, session: AsyncSession, table: str, bucket: int) -> dict[str, int]:
+        """
+        Значения для insert: id с корзиной на шарде, без шардирования - пусто,
+        и id выдает обычная последовательность.
+        """
+        if not self.enabled:
+            return {}
+        value = await session.scalar(select(func.nextval(sequence_name(table, bucket))))
+        return {"id": value * BUCKETS + bucket}
+
+    async def scatter(
+        self, session: AsyncSession, load: Callable[[AsyncSession], Awaitable[T]]
+    ) -> list[T]:
+        """Выполняет load на всех шардах параллельно"""
+        if not self.enabled:
+            return [await load(session)]
+
+        async def run(helper: DatabaseHelper) -> T:
+            async with helper.session_factory() as shard_session:
+                return await load(shard_session)
+
+        return list(await asyncio.gather(*(run(helper) for helper in self.helpers)))
+
+    async def scatter_ids(
+        self,
+        session: AsyncSession,
+        row_ids: Iterable[int],
+        load: Callable[[AsyncSession, list[int]], Awaitable[T]],
+    ) -> list[T]:
+        """Выполняет load(сессия, id) только на шардах, где лежат эти id"""
+        row_ids = list(row_ids)
+        if not self.enabled:
+            return [await load(session, row_ids)]
+        by_shard: dict[int, list[int]] = defaultdict(list)
+        for row_id in row_ids:
+            by_shard[self.shard_for_id(row_id)].append(row_id)
+
+        async def run(shard: int, ids: list[int]) -> T:
+            async with self.helpers[shard].session_factory() as shard_session:
+                return await load(shard_session, ids)
+
+        return list(
+            await asyncio.gather(*(run(shard, ids) for shard, ids in by_shard.items()))
+        )
+
+    async def recreate_tables(self) -> None:
+        """Пересоздает схему на всех шардах, как lifespan для основной базы"""
+        for helper in self.helpers:
+            async with helper.engine.begin() as connection:
+                await connection.run_sync(self.metadata.drop_all)
+                await connection.run_sync(self.metadata.create_all)
+
+    def partition_maintenance(self) -> list[PartitionMaintenance]:
+        return [
+            PartitionMaintenance(
+                engine=helper.engine,
+                months_ahead=settings.partitions.months_ahead,
+                retention_months=settings.partitions.retention_months,
+                archive_dir=settings.partitions.archive_dir,
+                interval_seconds=settings.partitions.interval_seconds,
+            )
+            for helper in self.helpers
+        ]
+
+    async def dispose(self) -> None:
+        for helper in self.helpers:
+            await helper.dispose()
+
+
+def _bucket_column(table: Any):
+    # у твитов и картинок корзина в id, у лайков и тегов - в id твита
+    return table.c.tweet_id if table.name in ("likes", "tweet_tags") else table.c.id
+
+
+async def _copy_bucket(
+    source: AsyncConnection,
+    target: AsyncConnection,
+    table: Any,
+    bucket: int,
+    batch_size: int,
+) -> int:
+    where = _bucket_column(table) % BUCKETS == bucket
+    # остатки прерванного переноса: корзина шарду еще не принадлежит
+    await target.execute(delete(table).where(where))
+    # id тегов не содержит корзину, на шарде назначения он выдается заново
+    columns = [
+        column
+        for column in table.c
+        if not (table.name == "tweet_tags" and column.name == "id")
+    ]
+    result = await source.stream(
+        select(*columns).where(where).execution_options(yield_per=batch_size)
+    )
+    copied = 0
+    async for rows in result.partitions():
+        if table.name in PARTITIONED_TABLES:
+            for month in {month_start(row.created_at.date()) for row in rows}:
+                await create_partition(target, table.name, month)
+        await target.execute(insert(table), [dict(row._mapping) for row in rows])
+        copied += len(rows)
+    return copied
+
+
+async def _advance_sequences(
+    source: AsyncConnection, target: AsyncConnection, bucket: int
+) -> None:
+    for name in BUCKETED_IDS:
+        sequence = sequence_name(name, bucket)
+        last_value = await source.scalar(text(f"SELECT last_value FROM {sequence}"))
+        await target.execute(
+            text(
+                f"SELECT setval('{sequence}', GREATEST(last_value, :value)) FROM {sequence}"
+            ),
+            {"value": last_value},
+        )
+
+
+async def move_bucket(
+    source: DatabaseHelper,
+    target: DatabaseHelper,
+    bucket: int,
+    metadata: MetaData,
+    batch_size: int = 1000,
+) -> dict[str, int]:
+    """
+    Переносит строки корзины с шарда source на target.
+
+    Строки копируются одной транзакцией на target, затем удаляются с
+    source; последовательности id корзины на target продвигаются до
+    значений source, чтобы новые id не совпали с перенесенными. Запись в
+    корзину на время переноса должна быть остановлена, а после него
+    приложение перезапускается с новой картой корзин. Прерванный перенос
+    можно просто повторить.
+
+    :return: сколько строк каждой таблицы перенесено
+    """
+    moved = {}
+    tables = [metadata.tables[name] for name in SHARDED_TABLES]
+    async with source.engine.connect() as source_connection:
+        async with target.engine.connect() as target_connection:
+            async with target_connection.begin():
+                for table in tables:
+                    moved[table.name] = await _copy_bucket(
+                        source_connection, target_connection, table, bucket, batch_size
+                    )
+                await _advance_sequences(source_connection, target_connection, bucket)
+            await source_connection.rollback()
+        async with source_connection.begin():
+            for table in tables:
+                await source_connection.execute(
+                    delete(table).where(_bucket_column(table) % BUCKETS == bucket)
+                )
+    logger.info(f"Корзина {bucket} перенесена: {moved}")
+    return moved
+
+
+def create_shards() -> ShardedDatabaseHelper:
+    helpers = [
+        DatabaseHelper(
+            url=url,
+            echo=settings.db.echo,
+            echo_pool=settings.db.echo_pool,
+            pool_size=settings.sharding.pool_size,
+            max_overflow=settings.sharding.max_overflow,
+        )
+        for url in settings.sharding.urls
+    ]
+    if helpers:
+        logger.info(f"Твиты разделены между {len(helpers)} шардами")
+    return ShardedDatabaseHelper(
+        helpers=helpers,
+        bucket_map=parse_bucket_map(settings.sharding.buckets, len(helpers) or 1),
+    )
+
+
+shards = create_shards()
+
+
+async def _main(args: list[str]) -> None:
+    """
+    python -m app.sharding buckets - текущая карта корзин
+    python -m app.sharding move BUCKET SHARD - перенос корзины на шард
+    """
+    if not shards.enabled:
+        print("Шардирование выключено: settings.sharding.urls пуст")
+        return
+    try:
+        if args[:1] == ["move"]:
+            bucket, target = int(args[1]), int(args[2])
+            source = shards.bucket_map[bucket]
+            if source != target:
+                moved = await move_bucket(
+                    shards.helpers[source], shards.helpers[target], bucket, shards.metadata
+                )
+                print(f"Перенесено: {moved}")
+                shards.bucket_map[bucket] = target
+            print("Новая карта корзин для APP_CONFIG__SHARDING__BUCKETS:")
+        print(json.dumps(format_bucket_map(shards.bucket_map)))
+    finally:
+        await shards.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1:]))
@@ -0,0 +1,100 @@
+import gzip
+import logging
+import os
+import re
+import sys
+from typing import Optional
+
+from starlette.responses import HTMLResponse, Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+# без app.config: модуль запускается при сборке образа, где нет настроек базы
+logger = logging.getLogger(__name__)
+
+# имена вида app.45d81840.css: хэш содержимого в имени, файл никогда не меняется
+HASHED_NAME = re.compile(r"\.[0-9a-f]{8,}\.[a-z0-9]+$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+COMPRESSIBLE = (".css", ".js", ".html", ".svg", ".json", ".map", ".txt")
+
+
+class IndexPage:
+    """
+    index.html, прочитанный один раз.
+
+    В режиме разработки (reload=True) файл перечитывается, если изменился.
+    """
+
+    def __init__(self, path: str, reload: bool = False) -> None:
+        self.path = path
+        self.reload = reload
+        self._content: Optional[bytes] = None
+        self._mtime = 0.0
+
+    def load(self) -> None:
+        with open(self.path, "rb") as f:
+            self._content = f.read()
+        self._mtime = os.path.getmtime(self.path)
+        logger.info(f"Загружена страница {self.path}")
+
+    def response(self) -> HTMLResponse:
+        if self._content is None or (
+            self.reload and os.path.getmtime(self.path) != self._mtime
+        ):
+            self.load()
+        return HTMLResponse(content=self._content)
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """Статика с долгим кэшированием файлов, в имени которых есть хэш"""
+
+    def file_response(
+        self, full_path, stat_result, scope: Scope, status_code: int = 200
+    ) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if HASHED_NAME.search(str(full_path)):
+            response.headers["Cache-Control"] = IMMUTABLE
+        return response
+
+
+def precompress(directory: str, minimum_size: int = 1024) -> list[str]:
+    """
+    Создает рядом с файлами статики сжатые копии .gz и, если установлен
+    brotli, .br для gzip_static/brotli_static в nginx.
+
+    Актуальные копии не пересоздаются.
+
+    :return: пути созданных файлов
+    """
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+    created = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            if not name.endswith(COMPRESSIBLE) or os.path.getsize(path) < minimum_size:
+                continue
+            with open(path, "rb") as f:
+                content = f.read()
+            variants = {".gz": lambda: gzip.compress(content, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                variants[".br"] = lambda: brotli.compress(content, quality=11)
+            for suffix, compress in variants.items():
+                target = path + suffix
+                if (
+                    os.path.exists(target)
+                    and os.path.getmtime(target) >= os.path.getmtime(path)
+                ):
+                    continue
+                with open(target, "wb") as f:
+                    f.write(compress())
+                created.append(target)
+    logger.info(f"Создано сжатых копий статики: {len(created)}")
+    return created
+
+
+if __name__ == "__main__":
+    for directory in sys.argv[1:] or ["static"]:
+        precompress(directory)
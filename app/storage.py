@@ -0,0 +1,255 @@
+import asyncio
+import hashlib
+import hmac
+import os
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import AsyncIterator, Iterable, Optional
+from urllib.parse import quote, urlsplit
+
+import httpx
+
+from app.config import logger, settings
+
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+
+
+class Storage(ABC):
+    """Хранилище файлов картинок; name - Image.url"""
+
+    @abstractmethod
+    async def write(self, name: str, data: bytes) -> None: ...
+
+    @abstractmethod
+    async def write_file(self, name: str, path: str) -> None:
+        """Переносит локальный файл в хранилище; файл по path удаляется"""
+
+    @abstractmethod
+    async def exists(self, name: str) -> bool: ...
+
+    @abstractmethod
+    async def delete_many(self, names: Iterable[str]) -> int: ...
+
+    def presign_upload(self, name: str, expires_seconds: int) -> Optional[dict]:
+        """
+        Ссылка, по которой клиент сам загрузит файл PUT-запросом.
+
+        :return: None, если хранилище не умеет принимать файлы напрямую
+        """
+        return None
+
+
+class LocalStorage(Storage):
+    """Каталог на диске, его отдает nginx (location /media/ в nginx.conf)"""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _write(self, name: str, data: bytes) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.path(name), "wb") as buffer:
+            buffer.write(data)
+
+    async def write(self, name: str, data: bytes) -> None:
+        await asyncio.to_thread(self._write, name, data)
+
+    async def write_file(self, name: str, path: str) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        # staging лежит на том же томе: переименование без копирования
+        os.replace(path, self.path(name))
+
+    async def exists(self, name: str) -> bool:
+        return os.path.exists(self.path(name))
+
+    def _remove(self, names: Iterable[str]) -> int:
+        removed = 0
+        for name in names:
+            try:
+                os.remove(self.path(name))
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    async def delete_many(self, names: Iterable[str]) -> int:
+        return await asyncio.to_thread(self._remove, list(names))
+
+
+def _sign(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode(), hashlib.sha256).digest()
+
+
+class S3Storage(Storage):
+    """
+    S3-совместимое хранилище (AWS S3, MinIO, Ceph) по HTTP.
+
+    Запросы подписываются AWS Signature V4 напрямую, без boto3; адресация
+    path-style (endpoint/bucket/key), которую понимают все совместимые серверы.
+    """
+
+    def __init__(
+        self,
+        endpoint_url: str,
+        bucket: str,
+        region: str,
+        access_key: str,
+        secret_key: str,
+        client: Optional[httpx.AsyncClient] = None,
+    ) -> None:
+        self.endpoint_url = endpoint_url.rstrip("/")
+        self.bucket = bucket
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.client = client or httpx.AsyncClient()
+
+    def _canonical_uri(self, name: str) -> str:
+        path = urlsplit(self.endpoint_url).path
+        return f"{path}/{quote(self.bucket, safe='')}/{quote(name, safe='-_.~')}"
+
+    def _signature(
+        self,
+        method: str,
+        uri: str,
+        query: dict[str, str],
+        headers: dict[str, str],
+        payload_hash: str,
+        moment: datetime,
+    ) -> tuple[str, str]:
+        """Подпись запроса и ее область (scope) по AWS Signature V4"""
+        day = moment.strftime("%Y%m%d")
+        scope = f"{day}/{self.region}/s3/aws4_request"
+        canonical_query = "&".join(
+            f"{quote(key, safe='-_.~')}={quote(value, safe='-_.~')}"
+            for key, value in sorted(query.items())
+        )
+        signed_headers = ";".join(sorted(headers))
+        canonical_headers = "".join(
+            f"{key}:{headers[key].strip()}\n" for key in sorted(headers)
+        )
+        canonical_request = "\n".join(
+            [method, uri, canonical_query, canonical_headers, signed_headers, payload_hash]
+        )
+        string_to_sign = "\n".join(
+            [
+                "AWS4-HMAC-SHA256",
+                moment.strftime("%Y%m%dT%H%M%SZ"),
+                scope,
+                hashlib.sha256(canonical_request.encode()).hexdigest(),
+            ]
+        )
+        key = _sign(f"AWS4{self.secret_key}".encode(), day)
+        for part in (self.region, "s3", "aws4_request"):
+            key = _sign(key, part)
+        return hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest(), scope
+
+    def _signed_headers(
+        self, method: str, name: str, payload_hash: str, extra: Optional[dict] = None
+    ) -> dict[str, str]:
+        moment = datetime.now(timezone.utc)
+        headers = {
+            "host": urlsplit(self.endpoint_url).netloc,
+            "x-amz-content-sha256": payload_hash,
+            "x-amz-date": moment.strftime("%Y%m%dT%H%M%SZ"),
+            **(extra or {}),
+        }
+        signature, scope = self._signature(
+            method, self._canonical_uri(name), {}, headers, payload_hash, moment
+        )
+        headers["authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+            f"SignedHeaders={';'.join(sorted(headers))}, Signature={signature}"
+        )
+        return headers
+
+    def url(self, name: str) -> str:
+        return f"{self.endpoint_url}/{quote(self.bucket, safe='')}/{quote(name, safe='-_.~')}"
+
+    async def _request(self, method: str, name: str, **kwargs) -> httpx.Response:
+        payload_hash = kwargs.pop("payload_hash", UNSIGNED_PAYLOAD)
+        headers = self._signed_headers(method, name, payload_hash, kwargs.pop("headers", None))
+        headers.pop("host")
+        return await self.client.request(method, self.url(name), headers=headers, **kwargs)
+
+    async def write(self, name: str, data: bytes) -> None:
+        response = await self._request(
+            "PUT", name, content=data, payload_hash=hashlib.sha256(data).hexdigest()
+        )
+        response.raise_for_status()
+
+    async def write_file(self, name: str, path: str) -> None:
+        async def blocks() -> AsyncIterator[bytes]:
+            with open(path, "rb") as file:
+                while block := await asyncio.to_thread(file.read, 1024 * 1024):
+                    yield block
+
+        # поток без буферизации всего файла в памяти, поэтому тело не хэшируется
+        response = await self._request(
+            "PUT",
+            name,
+            content=blocks(),
+            headers={"content-length": str(os.path.getsize(path))},
+        )
+        response.raise_for_status()
+        os.remove(path)
+
+    async def exists(self, name: str) -> bool:
+        response = await self._request("HEAD", name)
+        if response.status_code == 404:
+            return False
+        response.raise_for_status()
+        return True
+
+    async def delete_many(self, names: Iterable[str]) -> int:
+        removed = 0
+        for name in names:
+            response = await self._request("DELETE", name)
+            if response.status_code != 404:
+                response.raise_for_status()
+                removed += 1
+        return removed
+
+    def presign_upload(self, name: str, expires_seconds: int) -> Optional[dict]:
+        moment = datetime.now(timezone.utc)
+        query = {
+            "X-Amz-Algorithm": "AWS4-HMAC-SHA256",
+            "X-Amz-Credential": (
+                f"{self.access_key}/{moment.strftime('%Y%m%d')}/{self.region}/s3/aws4_request"
+            ),
+            "X-Amz-Date": moment.strftime("%Y%m%dT%H%M%SZ"),
+            "X-Amz-Expires": str(expires_seconds),
+            "X-Amz-SignedHeaders": "host",
+        }
+        signature, _ = self._signature(
+            "PUT",
+            self._canonical_uri(name),
+            query,
+            {"host": urlsplit(self.endpoint_url).netloc},
+            UNSIGNED_PAYLOAD,
+            moment,
+        )
+        query["X-Amz-Signature"] = signature
+        params = "&".join(
+            f"{quote(key, safe='-_.~')}={quote(value, safe='-_.~')}"
+            for key, value in query.items()
+        )
+        return {"url": f"{self.url(name)}?{params}", "method": "PUT"}
+
+
+def create_storage() -> Storage:
+    if settings.media.storage == "s3":
+        logger.info(f"Картинки хранятся в {settings.media.s3_endpoint_url}")
+        return S3Storage(
+            endpoint_url=settings.media.s3_endpoint_url,
+            bucket=settings.media.s3_bucket,
+            region=settings.media.s3_region,
+            access_key=settings.media.s3_access_key,
+            secret_key=settings.media.s3_secret_key,
+        )
+    return LocalStorage(directory=settings.media.directory)
+
+
+storage = create_storage()
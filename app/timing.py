@@ -0,0 +1,132 @@
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import logger, request_id_var
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+
+class RequestTimings:
+    """Замеры одного запроса, миллисекунды по этапам"""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.durations: dict[str, float] = {}
+        self.queries = 0
+        self.handler_done: Optional[float] = None
+
+    def add(self, name: str, seconds: float) -> None:
+        self.durations[name] = self.durations.get(name, 0.0) + seconds * 1000
+
+    def header(self, response_started: float) -> str:
+        """
+        Значение заголовка Server-Timing.
+
+        Этапы пересекаются: запросы к базе во время авторизации входят и в auth, и в db.
+        """
+        entries = []
+        for name, ms in self.durations.items():
+            desc = f';desc="{self.queries} queries"' if name == "db" else ""
+            entries.append(f"{name}{desc};dur={ms:.1f}")
+        if self.handler_done is not None:
+            serialize = (response_started - self.handler_done) * 1000
+            entries.append(f"serialize;dur={serialize:.1f}")
+        total = (response_started - self.started) * 1000
+        entries.append(f"total;dur={total:.1f}")
+        return ", ".join(entries)
+
+
+timings_var: ContextVar[Optional[RequestTimings]] = ContextVar("timings", default=None)
+
+
+def record(name: str, seconds: float) -> None:
+    """Добавляет seconds к этапу name текущего запроса, если он замеряется"""
+    timings = timings_var.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+@contextmanager
+def measure(name: str) -> Iterator[None]:
+    """Добавляет время блока к этапу name текущего запроса"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def handler_done() -> None:
+    """Отмечает конец обработчика: дальше идет сериализация ответа"""
+    timings = timings_var.get()
+    if timings is not None:
+        timings.handler_done = time.perf_counter()
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Считает время и число запросов к базе в замеры текущего запроса"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info["query_start"].pop()
+        timings = timings_var.get()
+        if timings is not None:
+            timings.add("db", time.perf_counter() - start)
+            timings.queries += 1
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        if context.connection is not None and context.connection.info.get("query_start"):
+            context.connection.info["query_start"].pop()
+
+
+class TimingMiddleware:
+    """
+    Замеры запроса в заголовке Server-Timing и сквозной id запроса.
+
+    id берется из X-Request-ID (его проставляет nginx) или генерируется,
+    возвращается в ответе и попадает в каждую строку лога запроса.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = Headers(scope=scope).get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        request_id_token = request_id_var.set(request_id)
+        timings = RequestTimings()
+        timings_token = timings_var.set(timings)
+        status_code = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", timings.header(time.perf_counter()))
+                headers[REQUEST_ID_HEADER] = request_id
+            await send(message)
+
+        logger.info(f"{scope['method']} {scope['path']}")
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            total = (time.perf_counter() - timings.started) * 1000
+            logger.info(f"Ответ {status_code} за {total:.1f} мс")
+            timings_var.reset(timings_token)
+            request_id_var.reset(request_id_token)
@@ -0,0 +1,141 @@
+import re
+import time
+from collections import deque
+from typing import Callable
+
+from app.config import logger, settings
+
+HASHTAG = "hashtag"
+MENTION = "mention"
+
+# тег начинается с # или @ и не является частью слова (email, anchor#id)
+TAG_PATTERN = re.compile(r"(?<![\w#@])([#@])(\w{1,100})")
+TAG_PREFIXES = {"#": HASHTAG, "@": MENTION}
+KIND_PREFIXES = {HASHTAG: "#", MENTION: "@"}
+
+
+def extract_tags(content: str) -> list[tuple[str, str]]:
+    """
+    Извлекает хэштеги и упоминания из текста твита.
+
+    :param content: текст твита
+    :return: уникальные пары (kind, tag) в порядке появления, тег в нижнем регистре
+    """
+    tags: dict[tuple[str, str], None] = {}
+    for prefix, tag in TAG_PATTERN.findall(content):
+        tags[(TAG_PREFIXES[prefix], tag.lower())] = None
+    return list(tags)
+
+
+class CountMinSketch:
+    """
+    Count-min sketch: оценка частоты элемента сверху в фиксированном объеме памяти.
+    """
+
+    def __init__(self, width: int, depth: int) -> None:
+        self.width = width
+        self.depth = depth
+        self._rows: list[list[int]] = [[0] * width for _ in range(depth)]
+
+    def _indexes(self, item: str):
+        for row in range(self.depth):
+            yield row, hash((row, item)) % self.width
+
+    def add(self, item: str, count: int = 1) -> None:
+        for row, index in self._indexes(item):
+            self._rows[row][index] += count
+
+    def estimate(self, item: str) -> int:
+        return min(self._rows[row][index] for row, index in self._indexes(item))
+
+
+class TrendTracker:
+    """
+    Тренды за скользящее окно.
+
+    Окно разбито на корзины по bucket_seconds, у каждой корзины свой sketch,
+    устаревшие корзины выбрасываются целиком. Кандидаты в тренды хранятся
+    в словаре ограниченного размера (heavy hitters): при переполнении
+    вытесняется кандидат с наименьшей оценкой.
+    """
+
+    def __init__(
+        self,
+        window_seconds: int,
+        bucket_seconds: int,
+        width: int,
+        depth: int,
+        capacity: int,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.bucket_seconds = bucket_seconds
+        self.buckets_count = max(1, window_seconds // bucket_seconds)
+        self.width = width
+        self.depth = depth
+        self.capacity = capacity
+        self._clock = clock
+        self._buckets: deque[tuple[int, CountMinSketch]] = deque()
+        self._candidates: dict[str, int] = {}
+
+    def _rotate(self) -> int:
+        current = int(self._clock() // self.bucket_seconds)
+        oldest = current - self.buckets_count + 1
+        while self._buckets and self._buckets[0][0] < oldest:
+            self._buckets.popleft()
+        return current
+
+    def _estimate(self, item: str) -> int:
+        return sum(sketch.estimate(item) for _, sketch in self._buckets)
+
+    def add(self, item: str, count: int = 1) -> None:
+        current = self._rotate()
+        if not self._buckets or self._buckets[-1][0] != current:
+            self._buckets.append((current, CountMinSketch(self.width, self.depth)))
+        self._buckets[-1][1].add(item, count)
+
+        estimate = self._estimate(item)
+        if item in self._candidates or len(self._candidates) < self.capacity:
+            self._candidates[item] = estimate
+            return
+        weakest = min(self._candidates, key=self._candidates.__getitem__)
+        if self._candidates[weakest] < estimate:
+            del self._candidates[weakest]
+            self._candidates[item] = estimate
+
+    def add_tags(self, tags: list[tuple[str, str]]) -> None:
+        for kind, tag in tags:
+            self.add(f"{KIND_PREFIXES[kind]}{tag}")
+
+    def top(self, limit: int, kind: str | None = None) -> list[tuple[str, int]]:
+        """
+        Возвращает самые частые теги за окно.
+
+        :param limit: количество тегов
+        :param kind: hashtag, mention или None для обоих
+        :return: пары (тег с # или @, оценка количества) по убыванию
+        """
+        self._rotate()
+        for item in list(self._candidates):
+            estimate = self._estimate(item)
+            if estimate:
+                self._candidates[item] = estimate
+            else:
+                del self._candidates[item]
+        prefix = KIND_PREFIXES[kind] if kind else ""
+        items = [
+            (item, count)
+            for item, count in self._candidates.items()
+            if item.startswith(prefix)
+        ]
+        items.sort(key=lambda pair: (-pair[1], pair[0]))
+        logger.info(f"Тренды посчитаны по {len(self._candidates)} кандидатам")
+        return items[:limit]
+
+
+trend_tracker = TrendTracker(
+    window_seconds=settings.trends.window_seconds,
+    bucket_seconds=settings.trends.bucket_seconds,
+    width=settings.trends.width,
+    depth=settings.trends.depth,
+    capacity=settings.trends.capacity,
+)
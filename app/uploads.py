@@ -0,0 +1,288 @@
+import asyncio
+import hashlib
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import AsyncIterator
+
+from fastapi import HTTPException
+from sqlalchemy import delete, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.requests import ClientDisconnect
+
+from app.base_models import Upload
+from app.config import logger, settings
+from app.functions import get_media, insert_image, media_name
+from app.jobs import enqueue, job_handler
+from app.sharding import shards
+from app.storage import storage
+
+
+def staging_path(upload_id: str) -> str:
+    return os.path.join(settings.uploads.staging_dir, upload_id)
+
+
+def upload_info(upload_id: str, received: int, size: int) -> dict:
+    return {"result": True, "upload_id": upload_id, "offset": received, "size": size}
+
+
+async def create_upload(
+    session: AsyncSession, user_id: int, filename: str, size: int
+) -> dict:
+    """Начинает загрузку: строка в uploads, задача на ее удаление и пустой файл"""
+    if size > settings.uploads.max_size:
+        raise HTTPException(status_code=413, detail="Файл слишком большой")
+    upload_id = uuid.uuid4().hex
+    await session.execute(
+        insert(Upload).values(
+            id=upload_id,
+            user_id=user_id,
+            filename=filename,
+            size=size,
+        )
+    )
+    await enqueue(
+        session=session,
+        kind="expire_upload",
+        payload={"upload_id": upload_id},
+        delay_seconds=settings.uploads.ttl_seconds,
+    )
+    path = staging_path(upload_id)
+    await asyncio.to_thread(_create_file, path)
+    try:
+        await session.commit()
+    except BaseException:
+        await asyncio.to_thread(_remove, path)
+        raise
+    logger.info(f"Начата загрузка {upload_id} на {size} байт")
+    return upload_info(upload_id, 0, size)
+
+
+async def get_upload(session: AsyncSession, upload_id: str, user_id: int) -> dict:
+    row = (
+        await session.execute(
+            select(Upload.received, Upload.size).where(
+                Upload.id == upload_id, Upload.user_id == user_id
+            )
+        )
+    ).one_or_none()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Загрузка не найдена")
+    return upload_info(upload_id, row.received, row.size)
+
+
+def _create_file(path: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, "wb").close()
+
+
+def _write_chunk(path: str, offset: int, chunk: bytes) -> None:
+    with open(path, "r+b") as file:
+        file.seek(offset)
+        file.write(chunk)
+
+
+async def _claim_upload(
+    session: AsyncSession, upload_id: str, user_id: int, offset: int
+) -> tuple[str, int]:
+    """
+    Закрепляет загрузку за запросом, если offset совпадает с принятым
+    размером и загрузку не принимает другой запрос. Фиксируется сразу:
+    пока идет часть, соединение с базой не держится.
+
+    :return: метка запроса и размер файла
+    """
+    lease_id = uuid.uuid4().hex
+    now = datetime.now()
+    result = await session.execute(
+        update(Upload)
+        .where(
+            Upload.id == upload_id,
+            Upload.user_id == user_id,
+            Upload.received == offset,
+            or_(Upload.leased_until.is_(None), Upload.leased_until < now),
+        )
+        .values(
+            lease_id=lease_id,
+            leased_until=now + timedelta(seconds=settings.uploads.lease_seconds),
+        )
+        .returning(Upload.size)
+    )
+    size = result.scalar_one_or_none()
+    await session.commit()
+    if size is not None:
+        return lease_id, size
+    info = await get_upload(session=session, upload_id=upload_id, user_id=user_id)
+    await session.rollback()
+    if info["offset"] != offset:
+        raise HTTPException(status_code=409, detail=f"Ожидается offset {info['offset']}")
+    raise HTTPException(status_code=409, detail="Часть этой загрузки уже принимается")
+
+
+async def _release_upload(
+    session: AsyncSession, upload_id: str, lease_id: str, offset: int, received: int
+) -> bool:
+    """Записывает принятый размер и снимает закрепление; False - загрузку перехватили"""
+    result = await session.execute(
+        update(Upload)
+        .where(
+            Upload.id == upload_id,
+            Upload.lease_id == lease_id,
+            Upload.received == offset,
+        )
+        .values(
+            received=received,
+            lease_id=None,
+            leased_until=None,
+            updated_at=datetime.now(),
+        )
+        .returning(Upload.id)
+    )
+    released = result.scalar_one_or_none() is not None
+    await session.commit()
+    return released
+
+
+async def append_chunk(
+    session: AsyncSession,
+    upload_id: str,
+    user_id: int,
+    offset: int,
+    chunks: AsyncIterator[bytes],
+) -> dict:
+    """
+    Дописывает часть файла с позиции offset.
+
+    offset должен совпадать с принятым размером, иначе 409 - клиент узнает
+    верную позицию через GET. Перед приемом загрузка закрепляется за запросом
+    на lease_seconds, одновременный запрос к ней с любого воркера получает
+    409; соединение с базой, пока идет часть, не держится. Если соединение
+    оборвалось посреди части, принятые байты сохраняются, и загрузка
+    продолжается с них.
+    """
+    lease_id, size = await _claim_upload(
+        session=session, upload_id=upload_id, user_id=user_id, offset=offset
+    )
+    path = staging_path(upload_id)
+    limit = min(settings.uploads.chunk_max_size, size - offset)
+    received = offset
+    try:
+        # хвост от оборванной раньше части не засчитан, отрезаем его
+        await asyncio.to_thread(os.truncate, path, offset)
+        try:
+            async for chunk in chunks:
+                if received + len(chunk) - offset > limit:
+                    raise HTTPException(
+                        status_code=413, detail="Часть больше допустимого размера"
+                    )
+                await asyncio.to_thread(_write_chunk, path, received, chunk)
+                received += len(chunk)
+        except ClientDisconnect:
+            logger.info(f"Обрыв загрузки {upload_id}, принято {received - offset} байт")
+    except BaseException:
+        # часть не засчитана: отрезаем ее и отпускаем загрузку
+        await asyncio.to_thread(os.truncate, path, offset)
+        await _release_upload(session, upload_id, lease_id, offset, offset)
+        raise
+
+    if not await _release_upload(session, upload_id, lease_id, offset, received):
+        # закрепление истекло, и загрузку продолжил другой запрос
+        raise HTTPException(status_code=409, detail="Загрузка изменилась, запросите offset")
+    logger.info(f"Загрузка {upload_id}: {received} из {size} байт")
+    return upload_info(upload_id, received, size)
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def finalize_upload(
+    session: AsyncSession, upload_id: str, user_id: int, checksum: str
+) -> int:
+    """
+    Проверяет sha256 и превращает загрузку в картинку, как POST /api/medias.
+
+    Файл переносится в хранилище до транзакции: пока он загружается,
+    блокировки в базе не держатся. Строки загрузки и картинки меняются
+    потом одной короткой транзакцией.
+
+    :return: id картинки
+    """
+    row = (
+        await session.execute(
+            select(Upload.received, Upload.size, Upload.filename).where(
+                Upload.id == upload_id, Upload.user_id == user_id
+            )
+        )
+    ).one_or_none()
+    await session.rollback()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Загрузка не найдена")
+    if row.received != row.size:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Загружено {row.received} из {row.size} байт",
+        )
+    path = staging_path(upload_id)
+    try:
+        digest = await asyncio.to_thread(_sha256, path)
+    except FileNotFoundError:
+        # файл уже забрал одновременный finalize этой загрузки
+        raise HTTPException(status_code=409, detail="Загрузка уже завершается")
+    if digest != checksum.lower():
+        # испорченный файл не продолжить: загрузка начинается заново
+        await session.execute(delete(Upload).where(Upload.id == upload_id))
+        await session.commit()
+        await asyncio.to_thread(_remove, path)
+        raise HTTPException(status_code=400, detail="Контрольная сумма не совпадает")
+
+    file_url = media_name(user_id, row.filename, digest)
+    media = await get_media(file_url=file_url, session=session, user_id=user_id)
+    if media is None:
+        try:
+            await storage.write_file(file_url, path)
+        except FileNotFoundError:
+            raise HTTPException(status_code=409, detail="Загрузка уже завершается")
+
+    result = await session.execute(
+        delete(Upload).where(Upload.id == upload_id).returning(Upload.id)
+    )
+    if result.scalar_one_or_none() is None:
+        await session.rollback()
+        raise HTTPException(status_code=404, detail="Загрузка не найдена")
+    if media:
+        await session.commit()
+        await asyncio.to_thread(_remove, path)
+        return media.id
+    async with shards.for_user(session, user_id) as media_session:
+        image_id = await insert_image(
+            session=media_session, user_id=user_id, file_url=file_url
+        )
+        await media_session.commit()
+    await session.commit()
+    logger.info(f"Загрузка {upload_id} сохранена как картинка {image_id}")
+    return image_id
+
+
+@job_handler("expire_upload")
+async def expire_upload(session: AsyncSession, payload: dict) -> None:
+    """Фоновая задача: удаляет незавершенную загрузку и ее файл"""
+    upload_id = payload["upload_id"]
+    result = await session.execute(
+        delete(Upload).where(Upload.id == upload_id).returning(Upload.id)
+    )
+    await session.commit()
+    if result.scalar_one_or_none() is not None:
+        await asyncio.to_thread(_remove, staging_path(upload_id))
+        logger.info(f"Удалена незавершенная загрузка {upload_id}")
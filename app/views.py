@@ -0,0 +1,187 @@
+import asyncio
+import hashlib
+import math
+from typing import Iterable, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.base_models import Tweet
+from app.config import logger, settings
+from app.db_helper import db_helper
+from app.sharding import shards
+
+
+class HyperLogLog:
+    """
+    Оценка числа уникальных элементов в 2**precision байтах.
+
+    Стандартная ошибка 1.04 / sqrt(2**precision): при precision=12 это 4 КБ
+    на твит и около 1.6% (в 95% случаев ошибка меньше 3.3%). До ~2.5 * 2**precision
+    элементов используется линейный подсчет, и оценка почти точная.
+    Элементы хэшируются blake2b, а не hash(): регистры разных процессов
+    должны совпадать, чтобы их можно было объединять.
+    """
+
+    def __init__(self, precision: int = 12, registers: Optional[bytes] = None) -> None:
+        if not 4 <= precision <= 16:
+            raise ValueError("precision должна быть от 4 до 16")
+        self.precision = precision
+        self.size = 1 << precision
+        if registers is not None and len(registers) != self.size:
+            raise ValueError("Размер регистров не соответствует precision")
+        self.registers = bytearray(registers or self.size)
+
+    @staticmethod
+    def hash(item: int | str) -> int:
+        digest = hashlib.blake2b(str(item).encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+    def add(self, item: int | str) -> None:
+        self.add_hash(self.hash(item))
+
+    def add_hash(self, value: int) -> None:
+        """Добавляет элемент по готовому хэшу из HyperLogLog.hash"""
+        index = value >> (64 - self.precision)
+        rest = value & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.precision != self.precision:
+            raise ValueError("Нельзя объединить скетчи с разной precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
+
+
+class ViewTracker:
+    """
+    Уникальные просмотры твитов.
+
+    Просмотры копятся в памяти воркера скетчами HyperLogLog и раз в
+    interval_seconds объединяются со скетчами в tweets.views_sketch; в
+    tweets.views пишется оценка. Одна и та же пара (зритель, твит) из разных
+    воркеров считается один раз: объединение скетчей - это максимум регистров.
+
+    Кэш твитов при сбросе не инвалидируется: views в ленте отстают от базы
+    не дольше ttl_seconds кэша.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        precision: int,
+        interval_seconds: float,
+        max_pending: int,
+    ) -> None:
+        self.session_factory = session_factory
+        self.precision = precision
+        self.interval_seconds = interval_seconds
+        self.max_pending = max_pending
+        self._pending: dict[int, HyperLogLog] = {}
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, tweet_ids: Iterable[int], viewer_id: int) -> None:
+        viewer_hash = HyperLogLog.hash(viewer_id)
+        for tweet_id in tweet_ids:
+            sketch = self._pending.get(tweet_id)
+            if sketch is None:
+                sketch = self._pending[tweet_id] = HyperLogLog(self.precision)
+            sketch.add_hash(viewer_hash)
+        if len(self._pending) >= self.max_pending and not self._flush_lock.locked():
+            # память под скетчи ограничена: сбрасываем, не дожидаясь интервала
+            asyncio.get_running_loop().create_task(self.flush())
+
+    async def flush(self) -> int:
+        """
+        Объединяет накопленные скетчи с сохраненными.
+
+        :return: сколько твитов обновлено
+        """
+        async with self._flush_lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            try:
+                updated = await self._save(pending)
+            except Exception:
+                # просмотры не теряем: вернутся в следующий сброс
+                for tweet_id, sketch in pending.items():
+                    if tweet_id in self._pending:
+                        sketch.merge(self._pending[tweet_id])
+                    self._pending[tweet_id] = sketch
+                raise
+        logger.info(f"Сохранены просмотры {updated} твитов")
+        return updated
+
+    async def _save(self, pending: dict[int, HyperLogLog]) -> int:
+        async def save(session: AsyncSession, tweet_ids: list[int]) -> int:
+            return await self._save_shard(
+                session, {tweet_id: pending[tweet_id] for tweet_id in tweet_ids}
+            )
+
+        async with self.session_factory() as session:
+            # при шардировании скетчи объединяются на шардах твитов параллельно
+            return sum(await shards.scatter_ids(session, pending, save))
+
+    async def _save_shard(
+        self, session: AsyncSession, pending: dict[int, HyperLogLog]
+    ) -> int:
+        # FOR UPDATE: другой воркер может объединять скетчи тех же твитов
+        result = await session.execute(
+            select(Tweet.id, Tweet.views_sketch)
+            .where(Tweet.id.in_(pending))
+            .order_by(Tweet.id)
+            .with_for_update()
+        )
+        rows = result.all()
+        for tweet_id, stored in rows:
+            sketch = pending[tweet_id]
+            if stored is not None:
+                sketch.merge(HyperLogLog(self.precision, stored))
+            await session.execute(
+                update(Tweet)
+                .where(Tweet.id == tweet_id)
+                .values(views=sketch.count(), views_sketch=sketch.to_bytes())
+            )
+        await session.commit()
+        return len(rows)
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка сохранения просмотров: {e}", exc_info=True)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+
+view_tracker = ViewTracker(
+    session_factory=db_helper.session_factory,
+    precision=settings.views.precision,
+    interval_seconds=settings.views.interval_seconds,
+    max_pending=settings.views.max_pending,
+)
@@ -0,0 +1,65 @@
+"""
+Размер ответа ленты и время его кодирования в разных форматах.
+
+Запуск: python -m benchmarks.encoding [число твитов]
+"""
+
+import json
+import sys
+import time
+
+from app.basic_schema import LikeBase, TweetBase, TweetRead, UserBase
+from app.compression import available_compressors, msgpack_available
+from app.config import settings
+
+
+def make_feed(size: int) -> TweetRead:
+    tweets = [
+        TweetBase(
+            id=i,
+            content=f"Твит номер {i} про #python и @user{i % 50}",
+            attachments=[f"{settings.media.url_prefix}image_{i}.jpg"],
+            author=UserBase(id=i % 50, name=f"Пользователь {i % 50}"),
+            likes=[LikeBase(id=i * 3 + j, user_id=j, name=f"Пользователь {j}") for j in range(3)],
+            likes_count=i % 1000,
+            liked_by_me=i % 2 == 0,
+        )
+        for i in range(size)
+    ]
+    return TweetRead(result=True, tweets=tweets)
+
+
+def measure(func, repeat: int = 20) -> tuple[bytes, float]:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.perf_counter() - start) / repeat * 1000
+
+
+def main(size: int) -> None:
+    data = make_feed(size).model_dump(mode="json")
+    formats = {"json": lambda: json.dumps(data, ensure_ascii=False).encode()}
+    if msgpack_available():
+        import msgpack
+
+        formats["msgpack"] = lambda: msgpack.packb(data, use_bin_type=True)
+
+    levels = {
+        "gzip": settings.compression.gzip_level,
+        "br": settings.compression.br_level,
+        "zstd": settings.compression.zstd_level,
+    }
+    print(f"{'формат':<10}{'сжатие':<8}{'байт':>10}{'мс':>10}")
+    for name, encode in formats.items():
+        body, encode_ms = measure(encode)
+        print(f"{name:<10}{'-':<8}{len(body):>10}{encode_ms:>10.2f}")
+        for encoding, compress in available_compressors().items():
+            compressed, compress_ms = measure(lambda: compress(body, levels[encoding]))
+            print(
+                f"{name:<10}{encoding:<8}{len(compressed):>10}"
+                f"{encode_ms + compress_ms:>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
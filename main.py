@@ -3,15 +3,26 @@ from contextlib import asynccontextmanager
 
 import uvicorn
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 from sqlalchemy import insert, select
 
 from app.add_data import API_KEY, NAMES
+from app.admission import AdmissionMiddleware, admission_controller
 from app.api_router import router as api_router
-from app.base_models import Base, Follow, Like, Tweet, User
-from app.base_router import router as base_router
-from app.config import logger
+from app.base_models import Base, Follow, Like, User
+from app.base_router import index_page, router as base_router
+from app.cache import tweet_cache
+from app.compression import CompressionMiddleware
+from app.config import logger, settings
 from app.db_helper import db_helper
+from app.functions import write_new_tweet
+from app.idempotency import idempotency_store
+from app.jobs import job_queue
+from app.partitions import partition_maintenance
+from app.profiler import ProfileRequestMiddleware
+from app.sharding import id_bucket, shards
+from app.static_assets import ImmutableStaticFiles
+from app.timing import TimingMiddleware, instrument_engine
+from app.views import view_tracker
 
 
 @asynccontextmanager
@@ -25,9 +36,14 @@ async def lifespan(app: FastAPI):
     :param app: объект приложения FastAPI.
     """
     # startup
+    index_page.load()
     async with db_helper.engine.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
+    await shards.recreate_tables()
+    shard_maintenance = shards.partition_maintenance()
+    for maintenance in [partition_maintenance, *shard_maintenance]:
+        await maintenance.run_once()
     async with db_helper.session_factory() as session:
         user1 = User(name=NAMES[0], api_key=API_KEY[0])
         user2 = User(name=NAMES[1], api_key=API_KEY[1])
@@ -43,41 +59,63 @@ async def lifespan(app: FastAPI):
         await session.commit()
 
     async with db_helper.session_factory() as session:
-        tweet1 = Tweet(user_id=1, content="test content1")
-        tweet2 = Tweet(user_id=3, content="test content2")
-        session.add_all([tweet1, tweet2])
-        await session.commit()
-
-    async with db_helper.session_factory() as session:
-        like1 = Like(user_id=4, tweet_id=1)
-        like2 = Like(user_id=2, tweet_id=2)
-        session.add_all([like1, like2])
-        await session.commit()
+        tweet1 = await write_new_tweet(user_id=1, content="test content1", session=session)
+        tweet2 = await write_new_tweet(user_id=3, content="test content2", session=session)
+        for user_id, tweet_id in ((4, tweet1), (2, tweet2)):
+            async with shards.for_tweet(session, tweet_id) as tweet_session:
+                new_id = await shards.new_id(tweet_session, "likes", id_bucket(tweet_id))
+                tweet_session.add(Like(user_id=user_id, tweet_id=tweet_id, **new_id))
+                await tweet_session.commit()
+
+    await tweet_cache.start_listener(settings.db.url, *shards.urls)
+    for maintenance in [partition_maintenance, *shard_maintenance]:
+        maintenance.start()
+    job_queue.start()
+    view_tracker.start()
+    idempotency_store.start()
 
     yield
     # shutdown
+    await idempotency_store.stop()
+    # до остановки кэша: сброс просмотров инвалидирует твиты
+    await view_tracker.stop()
+    await job_queue.stop()
+    for maintenance in [partition_maintenance, *shard_maintenance]:
+        await maintenance.stop()
+    await tweet_cache.stop_listener()
     logger.info("Dispose engine")
+    await shards.dispose()
     await db_helper.dispose()
 
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.compression.minimum_size,
+    levels={
+        "gzip": settings.compression.gzip_level,
+        "br": settings.compression.br_level,
+        "zstd": settings.compression.zstd_level,
+    },
+)
+if settings.profiler.enabled:
+    app.add_middleware(ProfileRequestMiddleware)
+if settings.admission.enabled:
+    # внутри TimingMiddleware: ожидание в очереди попадает в Server-Timing
+    app.add_middleware(AdmissionMiddleware, controller=admission_controller)
+# добавлен последним, поэтому внешний: в total входит и сжатие ответа
+app.add_middleware(TimingMiddleware)
+for engine in [db_helper.engine, *(helper.engine for helper in shards.helpers)]:
+    instrument_engine(engine.sync_engine)
 app.include_router(api_router)
 app.include_router(base_router, prefix="")
 # app.mount("/", StaticFiles(directory="static", html=True), name="static")
 static_dir = os.path.join(os.path.dirname(__file__), "static")
 if os.path.exists(static_dir):
-    app.mount("/", StaticFiles(directory=static_dir, html=True), name="static")
+    app.mount("/", ImmutableStaticFiles(directory=static_dir, html=True), name="static")
 else:
     print("Static directory not found, skipping static file mount")
 
 
-@app.middleware("http")
-async def log_requests(request, call_next):
-    logger.info(f"Accessing path: {request.url.path}")
-    response = await call_next(request)
-    logger.info(f"Response status: {response.status_code}")
-    return response
-
-
 if __name__ == "__main__":
     uvicorn.run("main:app", reload=True)
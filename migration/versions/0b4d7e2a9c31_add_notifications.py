@@ -0,0 +1,59 @@
+"""add notifications
+
+Revision ID: 0b4d7e2a9c31
+Revises: f8c3a6d1e029
+Create Date: 2026-10-19 18:31:47.209554
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0b4d7e2a9c31"
+down_revision: Union[str, None] = "f8c3a6d1e029"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "notifications",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.String(length=10), nullable=False),
+        sa.Column("tweet_id", sa.Integer(), nullable=False),
+        sa.Column("bucket", sa.DateTime(), nullable=False),
+        sa.Column("actor_ids", postgresql.ARRAY(sa.Integer()), nullable=False),
+        sa.Column("actor_count", sa.Integer(), nullable=False),
+        sa.Column("read", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["user_id"], ["users.id"], name=op.f("fk_notifications_user_id_users")
+        ),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_notifications")),
+        sa.UniqueConstraint(
+            "user_id", "kind", "tweet_id", "bucket", name="unique_notification_group"
+        ),
+    )
+    op.create_index("ix_notifications_user_id_id", "notifications", ["user_id", "id"])
+    op.create_table(
+        "notification_counters",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("unread", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["user_id"], ["users.id"], name=op.f("fk_notification_counters_user_id_users")
+        ),
+        sa.PrimaryKeyConstraint("user_id", name=op.f("pk_notification_counters")),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("notification_counters")
+    op.drop_index("ix_notifications_user_id_id", table_name="notifications")
+    op.drop_table("notifications")
@@ -0,0 +1,44 @@
+"""add tweet tags
+
+Revision ID: 3c6f0a1d2b47
+Revises: 89180fb7d0f4
+Create Date: 2026-10-19 12:30:11.402218
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3c6f0a1d2b47"
+down_revision: Union[str, None] = "89180fb7d0f4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "tweet_tags",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("tweet_id", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.String(length=10), nullable=False),
+        sa.Column("tag", sa.String(length=100), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["tweet_id"],
+            ["tweets.id"],
+            name=op.f("fk_tweet_tags_tweet_id_tweets"),
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_tweet_tags")),
+        sa.UniqueConstraint("tweet_id", "kind", "tag", name="unique_tweet_tag"),
+    )
+    op.create_index("ix_tweet_tags_kind_tag", "tweet_tags", ["kind", "tag"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_tweet_tags_kind_tag", table_name="tweet_tags")
+    op.drop_table("tweet_tags")
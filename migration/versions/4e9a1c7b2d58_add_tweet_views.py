@@ -0,0 +1,32 @@
+"""add tweet views
+
+Revision ID: 4e9a1c7b2d58
+Revises: 0b4d7e2a9c31
+Create Date: 2026-10-19 19:12:05.318240
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "4e9a1c7b2d58"
+down_revision: Union[str, None] = "0b4d7e2a9c31"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "tweets",
+        sa.Column("views", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.add_column("tweets", sa.Column("views_sketch", sa.LargeBinary(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("tweets", "views_sketch")
+    op.drop_column("tweets", "views")
@@ -0,0 +1,31 @@
+"""add images user_id
+
+Revision ID: 6b1e9d4a7c30
+Revises: d3f8b5a1c6e2
+Create Date: 2026-10-19 21:42:12.530117
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "6b1e9d4a7c30"
+down_revision: Union[str, None] = "d3f8b5a1c6e2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("images", sa.Column("user_id", sa.Integer(), nullable=True))
+    op.create_foreign_key(
+        op.f("fk_images_user_id_users"), "images", "users", ["user_id"], ["id"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint(op.f("fk_images_user_id_users"), "images", type_="foreignkey")
+    op.drop_column("images", "user_id")
@@ -0,0 +1,121 @@
+"""partition tweets and likes
+
+Revision ID: 7d2e5b8c1f90
+Revises: 3c6f0a1d2b47
+Create Date: 2026-10-19 13:42:57.118604
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "7d2e5b8c1f90"
+down_revision: Union[str, None] = "3c6f0a1d2b47"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONTHS_AHEAD = 3
+
+COLUMNS = {
+    "tweets": """
+        id integer NOT NULL DEFAULT nextval('tweets_id_seq'),
+        content varchar(280) NOT NULL,
+        created_at timestamp NOT NULL,
+        user_id integer NOT NULL,
+        CONSTRAINT fk_tweets_user_id_users FOREIGN KEY (user_id) REFERENCES users (id)
+    """,
+    "likes": """
+        id integer NOT NULL DEFAULT nextval('likes_id_seq'),
+        user_id integer NOT NULL,
+        tweet_id integer NOT NULL,
+        created_at timestamp NOT NULL,
+        CONSTRAINT fk_likes_user_id_users FOREIGN KEY (user_id) REFERENCES users (id)
+    """,
+}
+INDEXES = {"tweets": "user_id", "likes": "tweet_id"}
+TWEET_FOREIGN_KEYS = {
+    "likes": "fk_likes_tweet_id_tweets",
+    "images": "fk_images_tweet_id_tweets",
+    "tweet_tags": "fk_tweet_tags_tweet_id_tweets",
+}
+
+
+def _replace_table(table: str, new_table_sql: str) -> None:
+    """Переименовывает таблицу в {table}_old и создает новую на той же sequence"""
+    op.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+    op.execute(f"ALTER TABLE {table}_old RENAME CONSTRAINT pk_{table} TO pk_{table}_old")
+    op.execute(f"ALTER TABLE {table}_old ALTER COLUMN id DROP DEFAULT")
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+    op.execute(new_table_sql)
+
+
+def _move_rows(table: str) -> None:
+    op.execute(f"INSERT INTO {table} SELECT * FROM {table}_old")
+    op.execute(f"DROP TABLE {table}_old")
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+
+
+def upgrade() -> None:
+    # внешний ключ на секционированную таблицу требует created_at в ключе
+    for table, constraint in TWEET_FOREIGN_KEYS.items():
+        op.drop_constraint(constraint, table, type_="foreignkey")
+
+    for table, columns in COLUMNS.items():
+        _replace_table(
+            table,
+            f"CREATE TABLE {table} ({columns}, "
+            f"CONSTRAINT pk_{table} PRIMARY KEY (id, created_at)) "
+            f"PARTITION BY RANGE (created_at)",
+        )
+        op.create_index(f"ix_{table}_{INDEXES[table]}", table, [INDEXES[table]])
+        # секции по месяцам от самой старой строки до MONTHS_AHEAD месяцев вперед
+        op.execute(
+            f"""
+            DO $$
+            DECLARE
+                month date;
+            BEGIN
+                SELECT date_trunc('month', coalesce(min(created_at), now()))::date
+                INTO month FROM {table}_old;
+                WHILE month <= date_trunc('month', now()) + interval '{MONTHS_AHEAD} months'
+                LOOP
+                    EXECUTE format(
+                        'CREATE TABLE %I PARTITION OF {table} FOR VALUES FROM (%L) TO (%L)',
+                        '{table}_p' || to_char(month, 'YYYY_MM'),
+                        month,
+                        (month + interval '1 month')::date
+                    );
+                    month := (month + interval '1 month')::date;
+                END LOOP;
+            END $$
+            """
+        )
+        _move_rows(table)
+
+
+def downgrade() -> None:
+    for table, columns in COLUMNS.items():
+        _replace_table(
+            table,
+            f"CREATE TABLE {table} ({columns}, CONSTRAINT pk_{table} PRIMARY KEY (id))",
+        )
+        _move_rows(table)
+
+    # строки, ссылающиеся на удаленные или архивированные твиты, не пройдут FK
+    for table, constraint in TWEET_FOREIGN_KEYS.items():
+        op.execute(
+            f"DELETE FROM {table} WHERE tweet_id IS NOT NULL "
+            f"AND tweet_id NOT IN (SELECT id FROM tweets)"
+        )
+        op.create_foreign_key(
+            constraint,
+            table,
+            "tweets",
+            ["tweet_id"],
+            ["id"],
+            ondelete="CASCADE" if table == "tweet_tags" else None,
+        )
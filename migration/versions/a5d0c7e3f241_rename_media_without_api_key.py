@@ -0,0 +1,69 @@
+"""rename media without api key
+
+Revision ID: a5d0c7e3f241
+Revises: e7c2a9f5b813
+Create Date: 2026-10-19 23:05:41.218374
+
+Раньше Image.url и имя файла были <api_key>_<filename> и уходили в ленту,
+раскрывая api-ключ автора. Картинки переименовываются в <user_id>_<uuid><ext>,
+как media_name для файлов с заранее неизвестным содержимым; файлы в
+локальном хранилище переносятся под новые имена. Для s3 соответствие старых
+и новых ключей выводится в лог: объекты переносятся вручную.
+
+Шарды создаются из моделей, миграция обходит только основную базу.
+"""
+
+import logging
+import os
+import re
+import uuid
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a5d0c7e3f241"
+down_revision: Union[str, None] = "e7c2a9f5b813"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+logger = logging.getLogger("alembic.runtime.migration")
+EXTENSION = re.compile(r"\.[a-z0-9]{1,10}")
+
+
+def new_name(user_id: int, url: str) -> str:
+    extension = os.path.splitext(url)[1].lower()
+    if not EXTENSION.fullmatch(extension):
+        extension = ""
+    return f"{user_id}_{uuid.uuid4().hex}{extension}"
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.text(
+            "SELECT images.id, images.url, users.id AS user_id FROM images "
+            "JOIN users ON starts_with(images.url, users.api_key || '_')"
+        )
+    ).all()
+    for image_id, url, user_id in rows:
+        name = new_name(user_id, url)
+        connection.execute(
+            sa.text("UPDATE images SET url = :url, user_id = :user_id WHERE id = :id"),
+            {"url": name, "user_id": user_id, "id": image_id},
+        )
+        if settings.media.storage == "local":
+            path = os.path.join(settings.media.directory, url)
+            if os.path.exists(path):
+                os.replace(path, os.path.join(settings.media.directory, name))
+        else:
+            logger.warning(f"Объект {url} нужно переименовать в {name}")
+
+
+def downgrade() -> None:
+    # старые имена содержали api-ключ, возвращать их незачем
+    pass
@@ -0,0 +1,29 @@
+"""add uploads lease
+
+Revision ID: b2e8f4a6d910
+Revises: a5d0c7e3f241
+Create Date: 2026-10-19 23:41:08.604215
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b2e8f4a6d910"
+down_revision: Union[str, None] = "a5d0c7e3f241"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("uploads", sa.Column("lease_id", sa.String(length=32), nullable=True))
+    op.add_column("uploads", sa.Column("leased_until", sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("uploads", "leased_until")
+    op.drop_column("uploads", "lease_id")
@@ -0,0 +1,28 @@
+"""likes tweet_id id index
+
+Revision ID: c5d1e8a2f4b6
+Revises: a41c9e7f3d12
+Create Date: 2026-10-19 16:12:05.118204
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c5d1e8a2f4b6"
+down_revision: Union[str, None] = "a41c9e7f3d12"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.drop_index("ix_likes_tweet_id", table_name="likes")
+    op.create_index("ix_likes_tweet_id_id", "likes", ["tweet_id", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_likes_tweet_id_id", table_name="likes")
+    op.create_index("ix_likes_tweet_id", "likes", ["tweet_id"])
@@ -0,0 +1,28 @@
+"""follow pagination indexes
+
+Revision ID: e2b7f4c9a815
+Revises: c5d1e8a2f4b6
+Create Date: 2026-10-19 16:48:31.402917
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e2b7f4c9a815"
+down_revision: Union[str, None] = "c5d1e8a2f4b6"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_follow_following_id_id", "follow", ["following_id", "id"])
+    op.create_index("ix_follow_follower_id_id", "follow", ["follower_id", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_follow_follower_id_id", table_name="follow")
+    op.drop_index("ix_follow_following_id_id", table_name="follow")
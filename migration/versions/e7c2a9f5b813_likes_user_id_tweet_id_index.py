@@ -0,0 +1,26 @@
+"""likes user_id tweet_id index
+
+Revision ID: e7c2a9f5b813
+Revises: 6b1e9d4a7c30
+Create Date: 2026-10-19 22:31:47.904126
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e7c2a9f5b813"
+down_revision: Union[str, None] = "6b1e9d4a7c30"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_likes_user_id_tweet_id", "likes", ["user_id", "tweet_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_likes_user_id_tweet_id", table_name="likes")
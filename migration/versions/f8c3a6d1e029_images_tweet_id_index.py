@@ -0,0 +1,26 @@
+"""images tweet_id index
+
+Revision ID: f8c3a6d1e029
+Revises: e2b7f4c9a815
+Create Date: 2026-10-19 17:20:14.660381
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f8c3a6d1e029"
+down_revision: Union[str, None] = "e2b7f4c9a815"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(op.f("ix_images_tweet_id"), "images", ["tweet_id"])
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_images_tweet_id"), table_name="images")
@@ -12,7 +12,10 @@ from sqlalchemy import delete
 # sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from app.base_models import Base, User  # Import Base for dropping tables
+from app.cache import tweet_cache
+from app.config import settings
 from app.db_helper import db_helper
+from app.sharding import shards
 from main import app
 
 NAMES = [
@@ -53,3 +56,15 @@ async def async_client() -> AsyncGenerator[AsyncClient, None]:
     transport = ASGITransport(app=app)
     async with AsyncClient(transport=transport, base_url="http://test") as client:
         yield client
+
+
+@pytest_asyncio.fixture(scope="function")
+async def cache_listener():
+    """
+    Слушатель канала инвалидации, как в lifespan: без него индекс лайков
+    этого воркера не узнает о новых лайках
+    """
+    await tweet_cache.start_listener(settings.db.url, *shards.urls)
+    await asyncio.sleep(0.2)
+    yield tweet_cache
+    await tweet_cache.stop_listener()
@@ -28,6 +28,10 @@ async def test_get_user(async_client, db_session):
             "name": NAMES[1],
             "following": [],
             "followers": [{"id": 1, "name": NAMES[0]}],
+            "followers_count": 1,
+            "following_count": 0,
+            "followers_next_cursor": None,
+            "following_next_cursor": None,
         },
     }
 
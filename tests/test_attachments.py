@@ -0,0 +1,91 @@
+import hashlib
+import json
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event, insert
+
+from app.add_data import API_KEY
+from app.base_models import Image, Tweet
+from app.cache import tweet_cache
+from app.db_helper import db_helper
+from app.storage import storage
+from app.functions import get_tweets_info, media_url
+
+
+@contextmanager
+def count_statements():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = db_helper.engine.sync_engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+async def cold_feed(session):
+    await tweet_cache.backend.clear()
+    with count_statements() as statements:
+        feed = await get_tweets_info(session=session, user_id=1)
+    return feed, len(statements)
+
+
+@pytest.mark.asyncio
+async def test_feed_attachments_fixed_queries(db_session):
+    """
+    Проверяет, что картинки ленты загружаются одним запросом на всю страницу
+    """
+    await get_tweets_info(session=db_session, user_id=1)
+    _, before = await cold_feed(db_session)
+
+    tweet_ids = (
+        await db_session.execute(
+            insert(Tweet).returning(Tweet.id),
+            [{"user_id": 1, "content": f"Твит с картинкой {i}"} for i in range(100)],
+        )
+    ).scalars().all()
+    await db_session.execute(
+        insert(Image),
+        [{"url": f"attachment_{tweet_id}.jpg", "tweet_id": tweet_id} for tweet_id in tweet_ids],
+    )
+    await db_session.commit()
+
+    feed, after = await cold_feed(db_session)
+    assert after == before
+    attachments = {tweet.id: tweet.attachments for tweet in feed["tweets"]}
+    for tweet_id in tweet_ids:
+        assert attachments[tweet_id] == [media_url(f"attachment_{tweet_id}.jpg")]
+
+
+@pytest.mark.asyncio
+async def test_feed_media_url_hides_api_key(async_client, db_session):
+    """
+    Проверяет, что адрес загруженной картинки в ленте не содержит api-ключ автора
+    """
+    headers = {"api-key": API_KEY[0]}
+    data = b"real upload"
+    resp = await async_client.post(
+        "/api/medias", headers=headers, files={"file": ("../photo.PNG", data, "image/png")}
+    )
+    assert resp.status_code == 201
+    media_id = resp.json()["media_id"]
+    resp = await async_client.post(
+        "/api/tweets",
+        headers=headers,
+        json={"tweet_data": "Твит с загруженной картинкой", "image_ids": [media_id]},
+    )
+    tweet_id = resp.json()["tweet_id"]
+    image = await db_session.get(Image, media_id)
+    try:
+        assert image.url == f"1_{hashlib.sha256(data).hexdigest()[:32]}.png"
+        resp = await async_client.get("/api/tweets", headers={"api-key": API_KEY[1]})
+        tweet = next(t for t in json.loads(resp.text)["tweets"] if t["id"] == tweet_id)
+        assert tweet["attachments"] == [media_url(image.url)]
+        assert API_KEY[0] not in tweet["attachments"][0]
+    finally:
+        await storage.delete_many([image.url])
@@ -0,0 +1,86 @@
+import json
+
+import pytest
+from sqlalchemy import func, select
+
+from app.add_data import API_KEY, NAMES
+from app.base_models import Tweet
+
+
+@pytest.mark.asyncio
+async def test_batch(async_client, db_session):
+    """
+    Проверяет пакет без атомарности: ошибка одной операции не мешает остальным
+    """
+    headers = {"api-key": API_KEY[2]}
+    data = {
+        "operations": [
+            {"op": "get_me"},
+            {"op": "like", "id": 100500},
+            {"op": "create_tweet", "data": {"tweet_data": "Твит из пакета"}},
+            {"op": "get_tweets"},
+        ]
+    }
+    resp = await async_client.post("/api/batch", headers=headers, json=data)
+    assert resp.status_code == 200
+    batch = json.loads(resp.text)
+    assert batch["result"] is False
+    assert [result["status"] for result in batch["results"]] == [200, 404, 200, 200]
+    assert batch["results"][0]["body"]["user"]["name"] == NAMES[2]
+    tweet_id = batch["results"][2]["body"]["tweet_id"]
+    assert tweet_id in [tweet["id"] for tweet in batch["results"][3]["body"]["tweets"]]
+
+
+@pytest.mark.asyncio
+async def test_batch_atomic(async_client, db_session):
+    """
+    Проверяет, что атомарный пакет откатывается целиком при ошибке
+    """
+    headers = {"api-key": API_KEY[2]}
+    count_query = select(func.count(Tweet.id)).where(Tweet.content == "Откатится")
+    data = {
+        "atomic": True,
+        "operations": [
+            {"op": "create_tweet", "data": {"tweet_data": "Откатится"}},
+            {"op": "like"},
+            {"op": "get_me"},
+        ],
+    }
+    resp = await async_client.post("/api/batch", headers=headers, json=data)
+    assert resp.status_code == 200
+    batch = json.loads(resp.text)
+    assert batch["result"] is False
+    assert [result["status"] for result in batch["results"]] == [200, 422, 424]
+    assert (await db_session.execute(count_query)).scalar_one() == 0
+
+
+@pytest.mark.asyncio
+async def test_batch_unauthorized(async_client, db_session):
+    """
+    Проверяет, что пакет не выполняется без api ключа
+    """
+    data = {"operations": [{"op": "get_me"}]}
+    resp = await async_client.post("/api/batch", json=data)
+    assert resp.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_batch_matches_routes(async_client, db_session):
+    """
+    Проверяет, что операции пакета отвечают теми же статусами и сообщениями,
+    что и одиночные эндпоинты
+    """
+    headers = {"api-key": API_KEY[2]}
+    requests = [
+        ("unlike", 100500, "DELETE", "/api/tweets/100500/likes"),
+        ("delete_tweet", 100500, "DELETE", "/api/tweets/100500"),
+        ("get_user", 100500, "GET", "/api/users/100500"),
+        ("unfollow", 100500, "DELETE", "/api/users/100500/follow"),
+    ]
+    data = {"operations": [{"op": op, "id": id} for op, id, _, _ in requests]}
+    resp = await async_client.post("/api/batch", headers=headers, json=data)
+    results = json.loads(resp.text)["results"]
+    for result, (_, _, method, url) in zip(results, requests):
+        single = await async_client.request(method, url, headers=headers)
+        assert result["status"] == single.status_code
+        assert result["body"] == json.loads(single.text)
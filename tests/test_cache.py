@@ -0,0 +1,189 @@
+import asyncio
+import json
+
+import pytest
+
+from app.add_data import API_KEY
+from app.cache import (
+    NOTIFY_PAYLOAD_LIMIT,
+    LRUCacheBackend,
+    RedisCacheBackend,
+    TweetCache,
+    notify_chunks,
+    tweet_cache,
+    tweet_key,
+)
+from app.config import settings
+
+
+class FakeRedis:
+    """Заменитель redis.asyncio клиента для тестов"""
+
+    def __init__(self):
+        self.data = {}
+
+    async def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    def set(self, key, value, ex=None):
+        self.commands.append((key, value))
+
+    async def execute(self):
+        self.redis.data.update(self.commands)
+
+
+@pytest.mark.asyncio
+async def test_lru_backend():
+    """
+    Проверяет вытеснение старых ключей и истечение ttl
+    """
+    backend = LRUCacheBackend(max_items=2, ttl_seconds=60)
+    await backend.set_many({"a": 1, "b": 2})
+    assert await backend.get_many(["a"]) == {"a": 1}
+    await backend.set_many({"c": 3})
+    assert await backend.get_many(["a", "b", "c"]) == {"a": 1, "c": 3}
+
+    backend.ttl_seconds = -1
+    await backend.set_many({"d": 4})
+    assert await backend.get_many(["d"]) == {}
+
+
+@pytest.mark.asyncio
+async def test_redis_backend():
+    """
+    Проверяет работу с redis-совместимым клиентом
+    """
+    client = FakeRedis()
+    cache = TweetCache(backend=RedisCacheBackend(client, ttl_seconds=60), channel="test")
+    await cache.set_tweets({1: {"id": 1, "content": "test"}})
+    assert json.loads(client.data["microblogs:" + tweet_key(1)]) == {"id": 1, "content": "test"}
+    assert await cache.get_tweets([1, 2]) == {1: {"id": 1, "content": "test"}}
+    await cache.backend.delete_many([tweet_key(1)])
+    assert await cache.get_tweets([1]) == {}
+
+
+@pytest.mark.asyncio
+async def test_cross_worker_invalidation(db_session):
+    """
+    Проверяет, что инвалидация доходит до другого воркера только после commit
+    """
+    other_worker = TweetCache(
+        backend=LRUCacheBackend(max_items=10, ttl_seconds=60),
+        channel=settings.cache.channel,
+    )
+    await other_worker.start_listener(settings.db.url)
+    try:
+        await asyncio.sleep(0.2)
+        await other_worker.set_tweets({1: {"id": 1}, 2: {"id": 2}})
+        local = TweetCache(
+            backend=LRUCacheBackend(max_items=10, ttl_seconds=60),
+            channel=settings.cache.channel,
+        )
+        await local.invalidate(session=db_session, tweet_ids=[1])
+        await db_session.rollback()
+        await asyncio.sleep(0.2)
+        assert await other_worker.get_tweets([1, 2]) == {1: {"id": 1}, 2: {"id": 2}}
+
+        await local.invalidate(session=db_session, tweet_ids=[1])
+        await db_session.commit()
+        await asyncio.sleep(0.2)
+        assert await other_worker.get_tweets([1, 2]) == {2: {"id": 2}}
+    finally:
+        await other_worker.stop_listener()
+
+
+def test_notify_chunks():
+    """
+    Проверяет, что длинная инвалидация делится на payload меньше 8000 байт
+    """
+    entries = [tweet_key(i) for i in range(3000)]
+    chunks = notify_chunks(entries)
+    assert len(chunks) > 1
+    assert all(len(chunk.encode()) <= NOTIFY_PAYLOAD_LIMIT for chunk in chunks)
+    assert ",".join(chunks).split(",") == entries
+    assert notify_chunks([]) == []
+
+
+@pytest.mark.asyncio
+async def test_large_invalidation(db_session):
+    """
+    Проверяет, что инвалидация тысяч твитов доходит до другого воркера
+    """
+    other_worker = TweetCache(
+        backend=LRUCacheBackend(max_items=5000, ttl_seconds=60),
+        channel=settings.cache.channel,
+    )
+    await other_worker.start_listener(settings.db.url)
+    try:
+        await asyncio.sleep(0.2)
+        tweet_ids = list(range(1, 3001))
+        await other_worker.set_tweets({i: {"id": i} for i in tweet_ids})
+        await tweet_cache.invalidate(session=db_session, tweet_ids=tweet_ids)
+        await db_session.commit()
+        await asyncio.sleep(0.2)
+        assert await other_worker.get_tweets(tweet_ids) == {}
+    finally:
+        await other_worker.stop_listener()
+
+
+@pytest.mark.asyncio
+async def test_atomic_batch_not_cached(async_client, db_session):
+    """
+    Проверяет, что твит откатанного атомарного пакета не остается в кэше
+    """
+    data = {
+        "atomic": True,
+        "operations": [
+            {"op": "create_tweet", "data": {"tweet_data": "Только в пакете"}},
+            {"op": "get_tweets"},
+            {"op": "like"},
+        ],
+    }
+    resp = await async_client.post(
+        "/api/batch", headers={"api-key": API_KEY[2]}, json=data
+    )
+    results = json.loads(resp.text)["results"]
+    assert [result["status"] for result in results] == [200, 200, 422]
+    tweet_id = results[0]["body"]["tweet_id"]
+    assert tweet_id in [tweet["id"] for tweet in results[1]["body"]["tweets"]]
+    assert await tweet_cache.get_tweets([tweet_id]) == {}
+
+
+@pytest.mark.asyncio
+async def test_feed_sees_new_like(async_client, db_session):
+    """
+    Проверяет, что лента из кэша показывает новый лайк
+    """
+    headers = {"api-key": API_KEY[3]}
+    resp = await async_client.post(
+        "/api/tweets", headers=headers, json={"tweet_data": "Кэшируемый твит"}
+    )
+    tweet_id = json.loads(resp.text)["tweet_id"]
+    resp = await async_client.get("/api/tweets", headers=headers)
+    tweet = next(t for t in json.loads(resp.text)["tweets"] if t["id"] == tweet_id)
+    assert tweet["likes"] == []
+
+    resp = await async_client.post(f"/api/tweets/{tweet_id}/likes", headers=headers)
+    assert resp.status_code == 201
+    resp = await async_client.get("/api/tweets", headers=headers)
+    tweet = next(t for t in json.loads(resp.text)["tweets"] if t["id"] == tweet_id)
+    assert [like["user_id"] for like in tweet["likes"]] == [4]
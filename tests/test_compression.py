@@ -0,0 +1,95 @@
+import pytest
+from fastapi import Request, Response
+
+from app.add_data import API_KEY
+from app.basic_schema import UserRead
+from app.compression import MsgPackResponse, choose_encoding, negotiate, parse_accept
+
+
+def test_choose_encoding():
+    """
+    Проверяет выбор кодировки по Accept-Encoding с учетом q
+    """
+    assert parse_accept("gzip;q=0.5, br") == {"gzip": 0.5, "br": 1.0}
+    assert choose_encoding("gzip, deflate", ["zstd", "br", "gzip"]) == "gzip"
+    assert choose_encoding("gzip;q=0.5, br", ["zstd", "br", "gzip"]) == "br"
+    assert choose_encoding("*", ["zstd", "gzip"]) == "zstd"
+    assert choose_encoding("gzip;q=0, identity", ["gzip"]) is None
+    assert choose_encoding("", ["gzip"]) is None
+
+
+@pytest.mark.asyncio
+async def test_feed_gzip(async_client, db_session):
+    """
+    Проверяет сжатие большой ленты и отсутствие сжатия у маленьких ответов
+    """
+    headers = {"api-key": API_KEY[0], "accept-encoding": "gzip"}
+    for i in range(30):
+        await async_client.post(
+            "/api/tweets", headers=headers, json={"tweet_data": f"Твит для сжатия {i}"}
+        )
+    resp = await async_client.get("/api/tweets", headers=headers)
+    assert resp.status_code == 200
+    assert resp.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in resp.headers["vary"]
+    assert int(resp.headers["content-length"]) < len(resp.content)
+    assert resp.json()["result"] is True
+
+    resp = await async_client.get("/api/trends", headers=headers)
+    assert "content-encoding" not in resp.headers
+
+    resp = await async_client.get(
+        "/api/tweets", headers={"api-key": API_KEY[0], "accept-encoding": "identity"}
+    )
+    assert "content-encoding" not in resp.headers
+
+
+@pytest.mark.asyncio
+async def test_export_not_compressed(async_client, db_session):
+    """
+    Проверяет, что потоковые ответы не сжимаются
+    """
+    headers = {"api-key": API_KEY[0], "accept-encoding": "gzip"}
+    resp = await async_client.get("/api/users/1/tweets/export", headers=headers)
+    assert resp.status_code == 200
+    assert "content-encoding" not in resp.headers
+
+
+@pytest.mark.asyncio
+async def test_feed_msgpack(async_client, db_session):
+    """
+    Проверяет ответ ленты в MessagePack по заголовку Accept
+    """
+    msgpack = pytest.importorskip("msgpack")
+    headers = {"api-key": API_KEY[0], "accept": "application/msgpack"}
+    resp = await async_client.get("/api/tweets", headers=headers)
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/msgpack"
+    feed = msgpack.unpackb(resp.content)
+    assert feed["result"] is True
+    assert {"id", "content", "author", "likes"} <= feed["tweets"][0].keys()
+
+
+def test_negotiate_keeps_headers():
+    """
+    Проверяет, что ответ MessagePack сохраняет заголовки и статус обработчика
+    """
+    msgpack = pytest.importorskip("msgpack")
+    request = Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": "/",
+            "headers": [(b"accept", b"application/msgpack")],
+        }
+    )
+    response = Response()
+    del response.headers["content-length"]
+    response.status_code = 203
+    response.headers["Age"] = "7"
+    user = {"result": True, "user": {"id": 1, "name": "Vasya", "followers": [], "following": []}}
+    result = negotiate(request, response, UserRead, user)
+    assert isinstance(result, MsgPackResponse)
+    assert result.status_code == 203
+    assert result.headers["age"] == "7" and result.headers["vary"] == "Accept"
+    assert msgpack.unpackb(result.body)["user"]["name"] == "Vasya"
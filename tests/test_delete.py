@@ -0,0 +1,58 @@
+import pytest
+from sqlalchemy import func, insert, select
+
+from app.add_data import API_KEY
+from app.base_models import Image, Job, Like, TweetTag
+from app.db_helper import db_helper
+from app.functions import delete_tweet_by_id, write_new_tweet
+from app.jobs import JobQueue
+from app.storage import storage
+
+
+@pytest.mark.asyncio
+async def test_delete_viral_tweet(db_session):
+    """
+    Проверяет удаление твита с лайками пачками и удаление файлов картинок
+    """
+    tweet_id = await write_new_tweet(user_id=2, content="Вирусный #твит", session=db_session)
+    await db_session.execute(
+        insert(Like), [{"user_id": user_id, "tweet_id": tweet_id} for user_id in range(1, 6)]
+    )
+    url = f"test_delete_{tweet_id}.jpg"
+    await db_session.execute(insert(Image).values(url=url, tweet_id=tweet_id))
+    await db_session.commit()
+    await storage.write(url, b"image")
+
+    await delete_tweet_by_id(tweet_id=tweet_id, session=db_session, chunk_size=2)
+
+    likes_count = select(func.count(Like.id)).where(Like.tweet_id == tweet_id)
+    assert (await db_session.execute(likes_count)).scalar_one() == 3
+    tags_count = select(func.count(TweetTag.id)).where(TweetTag.tweet_id == tweet_id)
+    assert (await db_session.execute(tags_count)).scalar_one() == 0
+    kinds = (await db_session.execute(select(Job.kind))).scalars().all()
+    assert {"cleanup_tweet", "remove_media_files"} <= set(kinds)
+
+    queue = JobQueue(
+        session_factory=db_helper.session_factory,
+        workers=1,
+        batch_size=100,
+        poll_interval_seconds=0.01,
+        backoff_seconds=1,
+        backoff_max_seconds=1,
+        visibility_timeout_seconds=300,
+    )
+    await queue.run_batch()
+    assert (await db_session.execute(likes_count)).scalar_one() == 0
+    assert not await storage.exists(url)
+
+
+@pytest.mark.asyncio
+async def test_delete_foreign_tweet(async_client, db_session):
+    """
+    Проверяет, что чужой твит удалить нельзя
+    """
+    tweet_id = await write_new_tweet(user_id=2, content="Чужой твит", session=db_session)
+    resp = await async_client.delete(
+        f"/api/tweets/{tweet_id}", headers={"api-key": API_KEY[0]}
+    )
+    assert resp.status_code == 403
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from app.events import FOLLOW, LIKE, RESYNC, TWEET, EventBroker, event_stream
+
+
+@pytest.mark.asyncio
+async def test_subscription_coalesce_and_drop():
+    """
+    Проверяет схлопывание лайков и выброс старых событий у медленного клиента
+    """
+    broker = EventBroker(queue_size=2)
+    subscription = broker.subscribe(user_id=1)
+    broker.publish_like(tweet_id=1, user_id=2, liked=True)
+    broker.publish_like(tweet_id=1, user_id=2, liked=False)
+    events = await subscription.get(timeout=0.1)
+    assert events == [{"type": LIKE, "tweet_id": 1, "user_id": 2, "liked": False}]
+
+    for tweet_id in range(3):
+        broker.publish_tweet(tweet_id=tweet_id, user_id=2)
+    events = await subscription.get(timeout=0.1)
+    assert [event["type"] for event in events] == [TWEET, TWEET, RESYNC]
+    assert events[0]["tweet_id"] == 1
+    assert events[-1]["dropped"] == 1
+
+    assert await subscription.get(timeout=0.01) == []
+
+
+@pytest.mark.asyncio
+async def test_follow_event_audience():
+    """
+    Проверяет, что событие подписки получают только участники
+    """
+    broker = EventBroker(queue_size=10)
+    subscription = broker.subscribe(user_id=1)
+    other = broker.subscribe(user_id=5)
+    broker.publish_follow(follower_id=3, following_id=1, followed=True)
+    assert [event["type"] for event in await subscription.get(timeout=0.1)] == [FOLLOW]
+    assert await other.get(timeout=0.01) == []
+
+
+@pytest.mark.asyncio
+async def test_event_stream():
+    """
+    Проверяет формат Server-Sent Events и отписку после отключения клиента
+    """
+    broker = EventBroker(queue_size=10)
+    subscription = broker.subscribe(user_id=1)
+    disconnected = [False]
+
+    async def is_disconnected():
+        return disconnected[0]
+
+    stream = event_stream(
+        broker=broker,
+        subscription=subscription,
+        is_disconnected=is_disconnected,
+        heartbeat=0.01,
+    )
+    assert await anext(stream) == "retry: 3000\n\n"
+    assert await anext(stream) == ": ping\n\n"
+    broker.publish_tweet(tweet_id=7, user_id=2)
+    chunk = await anext(stream)
+    assert chunk.startswith("event: tweet\ndata: ")
+    assert json.loads(chunk.split("data: ")[1]) == {
+        "type": TWEET,
+        "tweet_id": 7,
+        "user_id": 2,
+    }
+    disconnected[0] = True
+    with pytest.raises(StopAsyncIteration):
+        await anext(stream)
+    assert len(broker) == 0
+
+
+@pytest.mark.asyncio
+async def test_event_stream_unauthorized(async_client, db_session):
+    """
+    Проверяет, что поток событий недоступен без api ключа
+    """
+    resp = await async_client.get("/api/stream", params={"api_key": "unknown"})
+    assert resp.status_code == 401
@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from app.add_data import API_KEY
+from app.functions import stream_user_tweets
+
+
+@pytest.mark.asyncio
+async def test_export_user_tweets(async_client, db_session):
+    """
+    Проверяет выгрузку твитов пользователя в NDJSON
+    """
+    headers = {"api-key": API_KEY[4]}
+    contents = [f"Твит для выгрузки {i}" for i in range(3)]
+    for content in contents:
+        await async_client.post("/api/tweets", headers=headers, json={"tweet_data": content})
+
+    resp = await async_client.get("/api/users/5/tweets/export", headers=headers)
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in resp.text.splitlines()]
+    assert [row["content"] for row in rows] == contents
+    assert rows == sorted(rows, key=lambda row: row["id"])
+
+
+@pytest.mark.asyncio
+async def test_stream_user_tweets_fetch_size(db_session):
+    """
+    Проверяет, что курсор отдает твиты пачками по fetch_size
+    """
+    chunks = [
+        chunk
+        async for chunk in stream_user_tweets(session=db_session, user_id=5, fetch_size=2)
+    ]
+    assert [chunk.count("\n") for chunk in chunks] == [2, 1]
+
+
+@pytest.mark.asyncio
+async def test_export_unknown_user(async_client, db_session):
+    """
+    Проверяет выгрузку несуществующего пользователя
+    """
+    headers = {"api-key": API_KEY[4]}
+    resp = await async_client.get("/api/users/100500/tweets/export", headers=headers)
+    assert resp.status_code == 404
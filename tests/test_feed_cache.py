@@ -0,0 +1,170 @@
+import asyncio
+import time
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app.add_data import API_KEY
+from app.cache import LRUCacheBackend
+from app.db_helper import db_helper
+from app.feed_cache import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    FeedCache,
+    FeedUnavailable,
+    feed_cache,
+    feed_key,
+)
+
+
+def make_cache(timeout: float = 0.05, max_stale_seconds: float = 60) -> FeedCache:
+    return FeedCache(
+        backend=LRUCacheBackend(max_items=100, ttl_seconds=60),
+        session_factory=db_helper.session_factory,
+        breaker=CircuitBreaker(failure_threshold=2, reset_seconds=60),
+        timeout=timeout,
+        max_stale_seconds=max_stale_seconds,
+    )
+
+
+def test_circuit_breaker():
+    """
+    Проверяет размыкание после ошибок, пробную загрузку и замыкание
+    """
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=10, clock=lambda: now[0])
+    breaker.failure()
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.state == OPEN and not breaker.allow()
+
+    now[0] = 10.0
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.failure()
+    assert breaker.state == OPEN
+
+    now[0] = 20.0
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == CLOSED and breaker.allow()
+
+
+@pytest.mark.asyncio
+async def test_stale_feed_served():
+    """
+    Проверяет отдачу сохраненной ленты при ошибке и медленной базе
+    и одну фоновую загрузку на все одновременные запросы
+    """
+    cache = make_cache()
+    calls = []
+
+    async def load(session):
+        calls.append(1)
+        return {"result": True, "tweets": [len(calls)]}
+
+    async def failing(session):
+        raise OperationalError("select", {}, Exception("connection refused"))
+
+    async def slow(session):
+        await asyncio.sleep(0.2)
+        return await load(session)
+
+    with pytest.raises(FeedUnavailable):
+        await cache.get(user_id=1, load=failing)
+    assert await cache.get(user_id=1, load=load) == ({"result": True, "tweets": [1]}, None)
+
+    feed, age = await cache.get(user_id=1, load=failing)
+    assert feed["tweets"] == [1] and age is not None
+
+    results = await asyncio.gather(*[cache.get(user_id=1, load=slow) for _ in range(5)])
+    assert all(feed["tweets"] == [1] for feed, _ in results)
+    await asyncio.sleep(0.25)
+    # одна фоновая загрузка обновила копию
+    assert len(calls) == 2
+    feed, _ = await cache._stale("feed:1")
+    assert feed["tweets"] == [2]
+
+
+@pytest.mark.asyncio
+async def test_timeout_counted_once():
+    """
+    Проверяет, что медленная загрузка - одна ошибка размыкателя, сколько бы
+    запросов ее ни ждали
+    """
+    cache = make_cache()
+
+    async def load(session):
+        return {"result": True, "tweets": []}
+
+    async def slow(session):
+        await asyncio.sleep(0.2)
+        return await load(session)
+
+    await cache.get(user_id=1, load=load)
+    for _ in range(3):
+        await asyncio.gather(*[cache.get(user_id=1, load=slow) for _ in range(5)])
+    assert cache.breaker.failures == 1 and cache.breaker.state == CLOSED
+    await asyncio.sleep(0.25)
+    assert cache.breaker.failures == 0
+
+
+@pytest.mark.asyncio
+async def test_breaker_stops_loads():
+    """
+    Проверяет, что при разомкнутом размыкателе база не запрашивается,
+    а слишком старая копия не отдается
+    """
+    cache = make_cache(max_stale_seconds=60)
+    calls = []
+
+    async def load(session):
+        calls.append(1)
+        return {"result": True, "tweets": []}
+
+    await cache.get(user_id=1, load=load)
+    cache.breaker.state = OPEN
+    cache.breaker.opened_at = time.monotonic()
+    feed, age = await cache.get(user_id=1, load=load)
+    assert age is not None and len(calls) == 1
+    with pytest.raises(FeedUnavailable):
+        await cache.get(user_id=2, load=load)
+
+    entry = (await cache.backend.get_many(["feed:1"]))["feed:1"]
+    entry["stored_at"] -= 120
+    with pytest.raises(FeedUnavailable):
+        await cache.get(user_id=1, load=load)
+
+
+@pytest.mark.asyncio
+async def test_get_tweets_stale_headers(async_client, monkeypatch):
+    """
+    Проверяет заголовки устаревшей ленты и 503 без сохраненной копии
+    """
+    headers = {"api-key": API_KEY[0]}
+    fresh = await async_client.get("/api/tweets", headers=headers)
+    assert fresh.status_code == 200
+    assert "x-feed-stale" not in fresh.headers
+
+    monkeypatch.setattr(feed_cache.breaker, "state", OPEN)
+    monkeypatch.setattr(feed_cache.breaker, "opened_at", time.monotonic())
+    stale = await async_client.get("/api/tweets", headers=headers)
+    assert stale.status_code == 200
+    assert stale.headers["x-feed-stale"] == "1"
+    assert int(stale.headers["age"]) >= 0
+    assert stale.json() == fresh.json()
+
+    await feed_cache.backend.delete_many([feed_key(5)])
+    missing = await async_client.get("/api/tweets", headers={"api-key": API_KEY[4]})
+    assert missing.status_code == 503
+    assert "retry-after" in missing.headers
+
+    msgpack = pytest.importorskip("msgpack")
+    packed = await async_client.get(
+        "/api/tweets", headers={**headers, "accept": "application/msgpack"}
+    )
+    assert packed.headers["content-type"] == "application/msgpack"
+    assert packed.headers["x-feed-stale"] == "1" and "age" in packed.headers
+    assert msgpack.unpackb(packed.content) == fresh.json()
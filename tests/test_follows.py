@@ -0,0 +1,44 @@
+import json
+
+import pytest
+from sqlalchemy import delete, insert
+
+from app.base_models import Follow
+
+
+@pytest.mark.asyncio
+async def test_followers_pages(async_client, db_session):
+    """
+    Проверяет постраничный вывод подписчиков и подписок по курсору
+    """
+    await db_session.execute(delete(Follow).where(Follow.following_id == 5))
+    await db_session.execute(
+        insert(Follow), [{"follower_id": user_id, "following_id": 5} for user_id in range(1, 5)]
+    )
+    await db_session.commit()
+
+    user_ids = []
+    cursor = None
+    while True:
+        params = {"limit": 3} if cursor is None else {"limit": 3, "cursor": cursor}
+        resp = await async_client.get("/api/users/5/followers", params=params)
+        assert resp.status_code == 200
+        page = json.loads(resp.text)
+        user_ids += [user["id"] for user in page["users"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert user_ids == [4, 3, 2, 1]
+
+    resp = await async_client.get("/api/users/4/following")
+    assert [user["id"] for user in json.loads(resp.text)["users"]] == [5]
+
+    resp = await async_client.get("/api/users/5")
+    user = json.loads(resp.text)["user"]
+    assert user["followers_count"] == 4
+    assert len(user["followers"]) == 4
+
+    resp = await async_client.get("/api/users/0/followers")
+    assert resp.status_code == 404
+    resp = await async_client.get("/api/users/5/friends")
+    assert resp.status_code == 422
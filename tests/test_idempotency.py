@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import delete, func, select
+
+from app.add_data import API_KEY
+from app.base_models import IdempotencyKey, Image, Tweet
+from app.db_helper import db_helper
+from app.idempotency import REPLAYED_HEADER, IdempotencyStore, fingerprint
+from app.storage import storage
+
+
+async def count_tweets(db_session, content: str) -> int:
+    return await db_session.scalar(
+        select(func.count(Tweet.id)).where(Tweet.content == content)
+    )
+
+
+@pytest.mark.asyncio
+async def test_tweet_retry_replayed(async_client, db_session):
+    """
+    Проверяет, что повтор публикации с тем же ключом не создает дубликат
+    """
+    headers = {"api-key": API_KEY[0], "Idempotency-Key": "retry-1"}
+    body = {"tweet_data": "Твит с ключом идемпотентности"}
+    first = await async_client.post("/api/tweets", headers=headers, json=body)
+    second = await async_client.post("/api/tweets", headers=headers, json=body)
+    assert first.status_code == second.status_code == 200
+    assert second.json() == first.json()
+    assert REPLAYED_HEADER not in first.headers
+    assert second.headers[REPLAYED_HEADER] == "true"
+    assert await count_tweets(db_session, body["tweet_data"]) == 1
+
+    body["tweet_data"] = "Другой твит с тем же ключом"
+    response = await async_client.post("/api/tweets", headers=headers, json=body)
+    assert response.status_code == 422
+    assert await count_tweets(db_session, body["tweet_data"]) == 0
+
+    # ключи разных пользователей не пересекаются
+    headers["api-key"] = API_KEY[1]
+    response = await async_client.post("/api/tweets", headers=headers, json=body)
+    assert response.status_code == 200
+    assert response.json()["tweet_id"] != first.json()["tweet_id"]
+
+
+@pytest.mark.asyncio
+async def test_media_retry_compares_content(async_client, db_session):
+    """
+    Проверяет, что повтор загрузки сравнивается по содержимому файла, а не по размеру
+    """
+    headers = {"api-key": API_KEY[0], "Idempotency-Key": "media-1"}
+
+    async def upload(content: bytes):
+        files = {"file": ("same.jpg", content, "image/jpeg")}
+        return await async_client.post("/api/medias", headers=headers, files=files)
+
+    first = await upload(b"a" * 100)
+    try:
+        assert first.status_code == 201
+        retry = await upload(b"a" * 100)
+        assert retry.json() == first.json()
+        assert retry.headers[REPLAYED_HEADER] == "true"
+
+        # тот же размер и имя, другое содержимое
+        other = await upload(b"b" * 100)
+        assert other.status_code == 422
+    finally:
+        image = await db_session.get(Image, first.json()["media_id"])
+        await storage.delete_many([image.url])
+        await db_session.delete(image)
+        await db_session.commit()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicates(async_client, db_session):
+    """
+    Проверяет, что параллельный дубль ждет первый запрос и получает его ответ
+    """
+    headers = {"api-key": API_KEY[0], "Idempotency-Key": "concurrent-1"}
+    body = {"tweet_data": "Параллельные повторы"}
+    responses = await asyncio.gather(
+        *[async_client.post("/api/tweets", headers=headers, json=body) for _ in range(3)]
+    )
+    assert {response.status_code for response in responses} == {200}
+    assert len({response.json()["tweet_id"] for response in responses}) == 1
+    assert await count_tweets(db_session, body["tweet_data"]) == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_request_releases_key(db_session):
+    """
+    Проверяет ожидание незавершенного ключа и его освобождение после ошибки
+    """
+    store = IdempotencyStore(
+        session_factory=db_helper.session_factory,
+        ttl_seconds=3600,
+        lock_seconds=30,
+        wait_seconds=0.1,
+        poll_interval=0.02,
+        purge_interval_seconds=600,
+    )
+    digest = fingerprint("test", 1)
+    try:
+        assert await store.begin(user_id=1, key="release-1", digest=digest) is None
+        with pytest.raises(HTTPException) as error:
+            await store.begin(user_id=1, key="release-1", digest=digest)
+        assert error.value.status_code == 409
+
+        await store.release(user_id=1, key="release-1")
+        assert await store.begin(user_id=1, key="release-1", digest=digest) is None
+        await store.complete(user_id=1, key="release-1", response={"result": True})
+        assert await store.begin(user_id=1, key="release-1", digest=digest) == {
+            "result": True
+        }
+    finally:
+        await db_session.execute(
+            delete(IdempotencyKey).where(IdempotencyKey.key == "release-1")
+        )
+        await db_session.commit()
@@ -0,0 +1,135 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+from app.add_data import API_KEY
+from app.base_models import Job, Like, Tweet
+from app.config import settings
+from app.db_helper import db_helper
+from app.jobs import FAILED, QUEUED, RUNNING, JobQueue, enqueue, job_handler
+
+calls = []
+
+
+@job_handler("test_flaky")
+async def flaky_job(session, payload):
+    calls.append(payload["value"])
+    if len(calls) == 1:
+        raise RuntimeError("первая попытка")
+
+
+def make_queue():
+    return JobQueue(
+        session_factory=db_helper.session_factory,
+        workers=1,
+        batch_size=10,
+        poll_interval_seconds=0.01,
+        backoff_seconds=60,
+        backoff_max_seconds=600,
+        visibility_timeout_seconds=300,
+    )
+
+
+@pytest.mark.asyncio
+async def test_job_retry_with_backoff(db_session):
+    """
+    Проверяет повтор задачи после ошибки с отложенным запуском
+    """
+    queue = make_queue()
+    job_id = await enqueue(session=db_session, kind="test_flaky", payload={"value": 1})
+    await db_session.commit()
+
+    assert await queue.run_batch() >= 1
+    job = await db_session.get(Job, job_id)
+    await db_session.refresh(job)
+    assert job.status == QUEUED
+    assert job.attempts == 1
+    assert job.run_at > datetime.now()
+    assert "первая попытка" in job.last_error
+
+    await db_session.execute(
+        update(Job).where(Job.id == job_id).values(run_at=datetime.now())
+    )
+    await db_session.commit()
+    await queue.run_batch()
+    assert calls == [1, 1]
+    result = await db_session.execute(select(Job).where(Job.id == job_id))
+    assert result.scalar_one_or_none() is None
+    assert queue.stats.processed >= 1
+    assert queue.stats.retried == 1
+
+
+@pytest.mark.asyncio
+async def test_unknown_job_fails(db_session):
+    """
+    Проверяет, что задача без обработчика сразу помечается как failed
+    """
+    queue = make_queue()
+    job_id = await enqueue(session=db_session, kind="test_unknown", payload={})
+    await db_session.commit()
+    await queue.run_batch()
+    job = await db_session.get(Job, job_id)
+    await db_session.refresh(job)
+    assert job.status == FAILED
+    assert queue.stats.failed == 1
+
+
+@pytest.mark.asyncio
+async def test_abandoned_job_attempts(db_session):
+    """
+    Проверяет, что брошенная задача перезапускается, пока не исчерпает попытки
+    """
+    queue = make_queue()
+    job_ids = [
+        await enqueue(session=db_session, kind="test_unknown", payload={}, max_attempts=2)
+        for _ in range(2)
+    ]
+    started_at = datetime.now() - timedelta(hours=1)
+    for job_id, attempts in zip(job_ids, (1, 2)):
+        await db_session.execute(
+            update(Job)
+            .where(Job.id == job_id)
+            .values(status=RUNNING, attempts=attempts, started_at=started_at)
+        )
+    await db_session.commit()
+
+    jobs = await queue.dequeue()
+    retried, exhausted = job_ids
+    assert [job.id for job in jobs if job.id in job_ids] == [retried]
+    job = await db_session.get(Job, exhausted)
+    await db_session.refresh(job)
+    assert job.status == FAILED and job.attempts == 2
+    assert queue.stats.failed == 1
+    # вторая задача без обработчика: не оставляем ее выполняющейся
+    await queue._retry_or_fail(next(job for job in jobs if job.id == retried), LookupError())
+
+
+@pytest.mark.asyncio
+async def test_cleanup_tweet_job(async_client, db_session, monkeypatch):
+    """
+    Проверяет, что лайки удаленного твита удаляются фоновой задачей
+    """
+    headers = {"api-key": API_KEY[3]}
+    resp = await async_client.post(
+        "/api/tweets", headers=headers, json={"tweet_data": "Удалим #скоро"}
+    )
+    tweet_id = json.loads(resp.text)["tweet_id"]
+    await async_client.post(f"/api/tweets/{tweet_id}/likes", headers={"api-key": API_KEY[1]})
+    resp = await async_client.delete(f"/api/tweets/{tweet_id}", headers=headers)
+    assert resp.status_code == 202
+
+    await make_queue().run_batch()
+    result = await db_session.execute(select(Like).where(Like.tweet_id == tweet_id))
+    assert result.scalars().all() == []
+    result = await db_session.execute(select(Tweet).where(Tweet.id == tweet_id))
+    assert result.scalar_one_or_none() is None
+
+    resp = await async_client.get("/api/admin/jobs", headers=headers)
+    assert resp.status_code == 403
+    monkeypatch.setattr(settings.admin, "api_keys", ["admin-test-key"])
+    resp = await async_client.get("/api/admin/jobs", headers={"api-key": "admin-test-key"})
+    assert resp.status_code == 200
+    metrics = json.loads(resp.text)
+    assert metrics["depth"][QUEUED] >= 0
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+from sqlalchemy import distinct, func, select
+
+from app.base_models import Like
+from app.cache import LRUCacheBackend, TweetCache
+from app.config import settings
+from app.db_helper import db_helper
+from app.functions import add_like, delete_like, get_tweets_info, write_new_tweet
+from app.liked_index import ENTRY_OVERHEAD, LikedIndex, like_event, liked_index
+
+
+@pytest.mark.asyncio
+async def test_liked_index_updates(db_session):
+    """
+    Проверяет, что индекс загружается один раз и меняется лайками без запросов
+    """
+    index = LikedIndex(
+        session_factory=db_helper.session_factory, max_bytes=1 << 20, max_user_items=100
+    )
+    tweet_id = await write_new_tweet(user_id=1, content="Для индекса", session=db_session)
+    assert await index.liked(3, [tweet_id]) == set()
+    assert (index.hits, index.misses) == (0, 1)
+
+    index.apply(3, tweet_id, liked=True)
+    index.notified([like_event(3, tweet_id - 1, liked=True)])
+    assert await index.liked(3, [tweet_id - 1, tweet_id, tweet_id + 1]) == {
+        tweet_id - 1,
+        tweet_id,
+    }
+    index.notified([like_event(3, tweet_id, liked=False)])
+    assert await index.liked(3, [tweet_id]) == set()
+    assert (index.hits, index.misses) == (2, 1)
+
+    # изменения для пользователя не из индекса ничего не загружают
+    index.apply(5, tweet_id, liked=True)
+    assert 5 not in index._users
+
+
+@pytest.mark.asyncio
+async def test_liked_index_budget(db_session):
+    """
+    Проверяет вытеснение давно не смотревших ленту и предел лайков на пользователя
+    """
+    index = LikedIndex(
+        session_factory=db_helper.session_factory,
+        max_bytes=2 * ENTRY_OVERHEAD + 64,
+        max_user_items=100,
+    )
+    for user_id in (1, 2, 3):
+        await index.liked(user_id, [])
+    assert index.size <= index.max_bytes or len(index._users) == 1
+    # первым вытесняется пользователь, дольше всех не смотревший ленту
+    assert 1 not in index._users and 3 in index._users and index.evictions >= 1
+
+    tweet_id = await write_new_tweet(user_id=1, content="Много лайков", session=db_session)
+    await add_like(user_id=5, tweet_id=tweet_id, session=db_session)
+    liked_count = await db_session.scalar(
+        select(func.count(distinct(Like.tweet_id))).where(Like.user_id == 5)
+    )
+    small = LikedIndex(
+        session_factory=db_helper.session_factory,
+        max_bytes=1 << 20,
+        max_user_items=liked_count,
+    )
+    assert await small.liked(5, [tweet_id]) == {tweet_id}
+    # второй лайк не помещается: дальше liked_by_me проверяется запросом
+    small.apply(5, tweet_id + 1, liked=True)
+    assert await small.liked(5, [tweet_id]) is None
+
+
+@pytest.mark.asyncio
+async def test_liked_index_other_worker(db_session, cache_listener):
+    """
+    Проверяет, что лайк доходит до индекса другого воркера и попадает в ленту
+    """
+    other_worker = TweetCache(
+        backend=LRUCacheBackend(max_items=10, ttl_seconds=60),
+        channel=settings.cache.channel,
+    )
+    other_index = LikedIndex(
+        session_factory=db_helper.session_factory, max_bytes=1 << 20, max_user_items=100
+    )
+    other_worker.subscribe(other_index)
+    await other_worker.start_listener(settings.db.url)
+    try:
+        await asyncio.sleep(0.2)
+        tweet_id = await write_new_tweet(user_id=2, content="Лайк издалека", session=db_session)
+        assert await other_index.liked(4, [tweet_id]) == set()
+
+        await add_like(user_id=4, tweet_id=tweet_id, session=db_session)
+        await asyncio.sleep(0.2)
+        assert await other_index.liked(4, [tweet_id]) == {tweet_id}
+
+        feed = await get_tweets_info(session=db_session, user_id=4)
+        assert next(tweet for tweet in feed["tweets"] if tweet.id == tweet_id).liked_by_me
+        assert 4 in liked_index._users
+
+        await delete_like(user_id=4, tweet_id=tweet_id, session=db_session)
+        await asyncio.sleep(0.2)
+        assert await other_index.liked(4, [tweet_id]) == set()
+        assert await liked_index.liked(4, [tweet_id]) == set()
+    finally:
+        await other_worker.stop_listener()
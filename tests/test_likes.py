@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+import pytest
+from sqlalchemy import insert
+
+from app.add_data import API_KEY
+from app.base_models import Like
+from app.functions import add_like, write_new_tweet
+
+
+@pytest.mark.asyncio
+async def test_likes_pages(async_client, db_session):
+    """
+    Проверяет постраничный вывод лайков твита по курсору
+    """
+    tweet_id = await write_new_tweet(user_id=1, content="Лайкайте", session=db_session)
+    await db_session.execute(
+        insert(Like), [{"user_id": user_id, "tweet_id": tweet_id} for user_id in range(1, 6)]
+    )
+    await db_session.commit()
+    headers = {"api-key": API_KEY[0]}
+
+    user_ids = []
+    cursor = None
+    while True:
+        params = {"limit": 2} if cursor is None else {"limit": 2, "cursor": cursor}
+        resp = await async_client.get(
+            f"/api/tweets/{tweet_id}/likes", headers=headers, params=params
+        )
+        assert resp.status_code == 200
+        page = json.loads(resp.text)
+        assert len(page["likes"]) <= 2
+        user_ids += [like["user_id"] for like in page["likes"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert user_ids == [5, 4, 3, 2, 1]
+
+    resp = await async_client.get("/api/tweets/0/likes", headers=headers)
+    assert resp.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_feed_likes_summary(async_client, db_session, cache_listener):
+    """
+    Проверяет количество лайков, превью лайкнувших и liked_by_me в ленте
+    """
+    tweet_id = await write_new_tweet(user_id=1, content="Популярный твит", session=db_session)
+    # через add_like: liked_by_me берется из индекса лайков, а не из базы
+    for user_id in range(2, 6):
+        await add_like(user_id=user_id, tweet_id=tweet_id, session=db_session)
+    # индекс обновляется по NOTIFY после commit
+    await asyncio.sleep(0.2)
+
+    async def feed_tweet(api_key):
+        resp = await async_client.get("/api/tweets", headers={"api-key": api_key})
+        assert resp.status_code == 200
+        tweets = json.loads(resp.text)["tweets"]
+        return next(tweet for tweet in tweets if tweet["id"] == tweet_id)
+
+    tweet = await feed_tweet(API_KEY[1])
+    assert tweet["likes_count"] == 4
+    assert [like["user_id"] for like in tweet["likes"]] == [5, 4, 3]
+    assert all(like["name"] for like in tweet["likes"])
+    assert tweet["liked_by_me"] is True
+
+    tweet = await feed_tweet(API_KEY[0])
+    assert tweet["likes_count"] == 4
+    assert tweet["liked_by_me"] is False
@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from starlette.responses import JSONResponse
+
+from app.add_data import API_KEY
+from app.admission import (
+    DEADLINE,
+    QUEUE_FULL,
+    TIMEOUT,
+    AdmissionController,
+    AdmissionMiddleware,
+    Limiter,
+)
+from app.config import settings
+
+
+@pytest.mark.asyncio
+async def test_limiter_priority():
+    """
+    Проверяет, что освободившееся место получает запрос с меньшим priority
+    """
+    limiter = Limiter("test", limit=1, queue_size=10)
+    assert await limiter.acquire(priority=0, timeout=1) is None
+    order = []
+
+    async def wait(priority: int) -> None:
+        assert await limiter.acquire(priority=priority, timeout=1) is None
+        order.append(priority)
+        limiter.release(0.01)
+
+    heavy = asyncio.create_task(wait(3))
+    await asyncio.sleep(0)
+    cheap = asyncio.create_task(wait(0))
+    await asyncio.sleep(0)
+    assert limiter.waiting == 2
+    limiter.release(0.01)
+    await asyncio.gather(heavy, cheap)
+    assert order == [0, 3]
+    assert limiter.active == 0
+
+
+@pytest.mark.asyncio
+async def test_limiter_sheds():
+    """
+    Проверяет отказы: полная очередь, непосильный срок и истекшее ожидание
+    """
+    limiter = Limiter("test", limit=1, queue_size=1)
+    assert await limiter.acquire(priority=0, timeout=1) is None
+
+    limiter.service_time = 10.0
+    assert await limiter.acquire(priority=0, timeout=0.5) == DEADLINE
+
+    limiter.service_time = 0.001
+    waiter = asyncio.create_task(limiter.acquire(priority=0, timeout=0.05))
+    await asyncio.sleep(0)
+    assert await limiter.acquire(priority=0, timeout=1) == QUEUE_FULL
+    assert await waiter == TIMEOUT
+    assert limiter.metrics()["shed"] == {QUEUE_FULL: 1, DEADLINE: 1, TIMEOUT: 1}
+
+    limiter.release()
+    assert limiter.active == 0
+    assert await limiter.acquire(priority=0, timeout=1) is None
+
+
+@pytest.mark.asyncio
+async def test_middleware_returns_503():
+    """
+    Проверяет 503 с Retry-After при перегрузке и пропуск путей вне лимита
+    """
+    release = asyncio.Event()
+
+    async def slow_app(scope, receive, send):
+        await release.wait()
+        await JSONResponse({"result": True})(scope, receive, send)
+
+    controller = AdmissionController(
+        max_concurrency=1,
+        queue_size=10,
+        route_limits={},
+        exempt=["/api/stream"],
+        queue_timeout=0.05,
+    )
+    app = AdmissionMiddleware(slow_app, controller=controller)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        first = asyncio.create_task(client.get("/api/tweets"))
+        await asyncio.sleep(0.01)
+        shed = await client.get("/api/tweets")
+        assert shed.status_code == 503
+        assert shed.headers["retry-after"] == str(settings.admission.retry_after_seconds)
+        assert shed.json()["error_type"] == "Overloaded"
+
+        stream = asyncio.create_task(client.get("/api/stream"))
+        await asyncio.sleep(0.01)
+        release.set()
+        assert (await first).status_code == 200
+        assert (await stream).status_code == 200
+    assert controller.metrics()["total"]["shed"][TIMEOUT] == 1
+
+
+@pytest.mark.asyncio
+async def test_admission_metrics(async_client, monkeypatch):
+    """
+    Проверяет метрики ограничения нагрузки для администратора
+    """
+    resp = await async_client.get("/api/admin/admission", headers={"api-key": API_KEY[0]})
+    assert resp.status_code == 403
+    monkeypatch.setattr(settings.admin, "api_keys", ["admin-test-key"])
+    await async_client.get("/api/tweets", headers={"api-key": API_KEY[0]})
+    resp = await async_client.get(
+        "/api/admin/admission", headers={"api-key": "admin-test-key"}
+    )
+    assert resp.status_code == 200
+    limiters = resp.json()["limiters"]
+    assert limiters["total"]["admitted"] > 0
+    assert set(limiters) == {"total", *settings.admission.route_limits}
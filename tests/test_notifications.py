@@ -0,0 +1,81 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import delete, select
+
+from app.add_data import API_KEY
+from app.base_models import Follow, Notification
+from app.notifications import LIKE, get_unread_count, mark_all_read, notify
+
+
+@pytest.mark.asyncio
+async def test_likes_coalesced(db_session):
+    """
+    Проверяет схлопывание лайков одного твита за интервал в одно уведомление
+    """
+    moment = datetime(2031, 1, 1, 12, 30)
+    unread = await get_unread_count(session=db_session, user_id=1)
+    for actor_id in (2, 3, 4, 5, 4):
+        await notify(
+            session=db_session,
+            user_id=1,
+            kind=LIKE,
+            actor_id=actor_id,
+            tweet_id=999001,
+            now=moment,
+        )
+    await notify(session=db_session, user_id=1, kind=LIKE, actor_id=1, tweet_id=999001)
+    await db_session.commit()
+
+    rows = (
+        await db_session.execute(select(Notification).where(Notification.tweet_id == 999001))
+    ).scalars().all()
+    assert len(rows) == 1
+    assert rows[0].actor_count == 4
+    assert rows[0].actor_ids == [4, 5, 3]
+    assert await get_unread_count(session=db_session, user_id=1) == unread + 1
+
+    await mark_all_read(session=db_session, user_id=1)
+    assert await get_unread_count(session=db_session, user_id=1) == 0
+    await notify(
+        session=db_session, user_id=1, kind=LIKE, actor_id=3, tweet_id=999001, now=moment
+    )
+    await notify(
+        session=db_session,
+        user_id=1,
+        kind=LIKE,
+        actor_id=3,
+        tweet_id=999001,
+        now=datetime(2031, 1, 1, 14, 0),
+    )
+    await db_session.commit()
+    assert await get_unread_count(session=db_session, user_id=1) == 2
+
+
+@pytest.mark.asyncio
+async def test_notifications_api(async_client, db_session):
+    """
+    Проверяет уведомление о подписке и постраничный вывод уведомлений
+    """
+    await db_session.execute(
+        delete(Follow).where(Follow.follower_id == 5, Follow.following_id == 3)
+    )
+    await db_session.commit()
+    resp = await async_client.post("/api/users/3/follow", headers={"api-key": API_KEY[4]})
+    assert resp.status_code == 202
+
+    headers = {"api-key": API_KEY[2]}
+    resp = await async_client.get("/api/notifications", headers=headers, params={"limit": 1})
+    assert resp.status_code == 200
+    page = resp.json()
+    assert page["unread"] >= 1
+    notification = page["notifications"][0]
+    assert notification["kind"] == "follow"
+    assert notification["tweet_id"] is None
+    assert notification["actors"][0]["id"] == 5
+
+    resp = await async_client.post("/api/notifications/read", headers=headers)
+    assert resp.status_code == 200
+    resp = await async_client.get("/api/notifications", headers=headers)
+    assert resp.json()["unread"] == 0
+    assert all(item["read"] for item in resp.json()["notifications"])
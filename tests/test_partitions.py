@@ -0,0 +1,88 @@
+import gzip
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import func, insert, select
+
+from app.base_models import Image, Like, Tweet, TweetTag
+from app.db_helper import db_helper
+from app.partitions import (
+    add_months,
+    archive_partitions,
+    create_partition,
+    ensure_partitions,
+    list_partitions,
+    partition_month,
+)
+from app.storage import storage
+
+
+def test_months():
+    """
+    Проверяет арифметику месяцев и разбор имени секции
+    """
+    assert add_months(date(2024, 11, 1), 3) == date(2025, 2, 1)
+    assert add_months(date(2024, 1, 1), -1) == date(2023, 12, 1)
+    assert partition_month("tweets", "tweets_p2024_02") == date(2024, 2, 1)
+    assert partition_month("tweets", "likes_p2024_02") is None
+
+
+@pytest.mark.asyncio
+async def test_ensure_partitions():
+    """
+    Проверяет создание секций на будущие месяцы
+    """
+    async with db_helper.engine.begin() as connection:
+        await ensure_partitions(connection, months_ahead=2, today=date(2031, 5, 20))
+        for table in ("tweets", "likes"):
+            months = set((await list_partitions(connection, table)).values())
+            assert {date(2031, 4, 1), date(2031, 5, 1), date(2031, 7, 1)} <= months
+
+
+@pytest.mark.asyncio
+async def test_archive_partitions(db_session, tmp_path):
+    """
+    Проверяет выгрузку старой секции в архив и ее удаление
+    """
+    async with db_helper.engine.begin() as connection:
+        await create_partition(connection, "tweets", date(2020, 1, 1))
+    stmt = (
+        insert(Tweet)
+        .values(user_id=1, content="Архивный твит", created_at=datetime(2020, 1, 15))
+        .returning(Tweet.id)
+    )
+    tweet_id = (await db_session.execute(stmt)).scalar_one()
+    db_session.add_all(
+        [
+            Like(user_id=2, tweet_id=tweet_id),
+            TweetTag(tweet_id=tweet_id, kind="hashtag", tag="архив"),
+            Image(url="archived.jpg", tweet_id=tweet_id, user_id=1),
+        ]
+    )
+    await db_session.commit()
+    await storage.write("archived.jpg", b"image")
+
+    async with db_helper.engine.connect() as connection:
+        archived = await archive_partitions(
+            connection,
+            retention_months=1,
+            archive_dir=str(tmp_path),
+            today=date(2020, 3, 1),
+        )
+        assert archived == [str(tmp_path / "tweets_p2020_01.csv.gz")]
+        assert "tweets_p2020_01" not in await list_partitions(connection, "tweets")
+
+    with gzip.open(archived[0], "rt", encoding="utf-8") as archive:
+        lines = archive.read().splitlines()
+    assert lines[0] == "id,content,created_at,user_id,views,views_sketch"
+    assert lines[1].startswith(f"{tweet_id},Архивный твит,2020-01-15")
+
+    result = await db_session.execute(select(Tweet).where(Tweet.id == tweet_id))
+    assert result.scalar_one_or_none() is None
+    # зависимые строки архивного твита остаются своей ретенции,
+    # а картинки не в архиве и не удаляются вместе с файлами
+    for model in (Like, TweetTag, Image):
+        count = select(func.count()).select_from(model).where(model.tweet_id == tweet_id)
+        assert await db_session.scalar(count) == 1
+    assert await storage.exists("archived.jpg")
+    await storage.delete_many(["archived.jpg"])
@@ -0,0 +1,42 @@
+import pytest
+
+from app.add_data import API_KEY
+from app.config import settings
+from app.db_helper import db_helper
+
+
+@pytest.mark.asyncio
+async def test_cached_auth_skips_pool(async_client):
+    """
+    Проверяет, что повторная авторизация и отказ в ней не берут соединение из пула
+    """
+    headers = {"api-key": API_KEY[2]}
+    await async_client.get("/api/trends", headers=headers)
+    await async_client.get("/api/trends", headers={"api-key": "unknown-key"})
+
+    checkouts = db_helper.pool_stats.checkouts
+    resp = await async_client.get("/api/trends", headers=headers)
+    assert resp.status_code == 200
+    resp = await async_client.get("/api/trends", headers={"api-key": "unknown-key"})
+    assert resp.status_code == 401
+    assert db_helper.pool_stats.checkouts == checkouts
+
+
+@pytest.mark.asyncio
+async def test_pool_wait_metrics(async_client, monkeypatch):
+    """
+    Проверяет учет ожидания соединения и метрики пула
+    """
+    waits = len(db_helper.pool_stats.waits)
+    resp = await async_client.get("/api/tweets", headers={"api-key": API_KEY[0]})
+    assert "pool;dur=" in resp.headers["server-timing"]
+    assert len(db_helper.pool_stats.waits) > waits
+
+    resp = await async_client.get("/api/admin/pool", headers={"api-key": API_KEY[0]})
+    assert resp.status_code == 403
+    monkeypatch.setattr(settings.admin, "api_keys", ["admin-test-key"])
+    resp = await async_client.get("/api/admin/pool", headers={"api-key": "admin-test-key"})
+    assert resp.status_code == 200
+    metrics = resp.json()
+    assert metrics["size"] == settings.db.pool_size
+    assert metrics["wait_ms"]["max"] >= 0
@@ -0,0 +1,87 @@
+import threading
+import time
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app.add_data import API_KEY
+from app.config import settings
+from app.profiler import ProfileRequestMiddleware, ProfilerBusy, SamplingProfiler
+from main import app
+
+ADMIN_KEY = "admin-test-key"
+
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_sampling_profiler():
+    """
+    Проверяет сбор стеков чужого потока в формате collapsed stacks
+    """
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_loop, args=(stop,))
+    worker.start()
+    profiler = SamplingProfiler(thread_id=worker.ident, interval=0.001)
+    profiler.start()
+    with pytest.raises(ProfilerBusy):
+        SamplingProfiler(thread_id=worker.ident, interval=0.001).start()
+    time.sleep(0.05)
+    stacks = profiler.stop()
+    stop.set()
+    worker.join()
+
+    assert profiler.samples > 0
+    stack, count = stacks.splitlines()[0].rsplit(" ", 1)
+    assert stack.endswith("tests.test_profiler:busy_loop")
+    assert int(count) > 0
+
+
+@pytest.fixture
+def profiler_enabled(monkeypatch):
+    monkeypatch.setattr(settings.profiler, "enabled", True)
+    monkeypatch.setattr(settings.admin, "api_keys", [ADMIN_KEY])
+
+
+@pytest.mark.asyncio
+async def test_profile_endpoint(async_client, profiler_enabled):
+    """
+    Проверяет доступ к профилированию воркера и формат ответа
+    """
+    resp = await async_client.get("/api/admin/profile", headers={"api-key": API_KEY[0]})
+    assert resp.status_code == 403
+
+    resp = await async_client.get(
+        "/api/admin/profile", params={"seconds": 0.05}, headers={"api-key": ADMIN_KEY}
+    )
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+
+
+@pytest.mark.asyncio
+async def test_profile_endpoint_disabled(async_client):
+    """
+    Проверяет, что выключенный профилировщик недоступен
+    """
+    resp = await async_client.get("/api/admin/profile", headers={"api-key": ADMIN_KEY})
+    assert resp.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_profile_single_request(db_session, profiler_enabled):
+    """
+    Проверяет профилирование одного запроса по заголовку
+    """
+    transport = ASGITransport(app=ProfileRequestMiddleware(app))
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        resp = await client.get(
+            "/api/tweets", headers={"api-key": ADMIN_KEY, settings.profiler.header: "1"}
+        )
+        assert resp.status_code == 200
+        assert resp.headers["x-profiled-status"] == "401"
+        assert resp.headers["content-type"].startswith("text/plain")
+
+        resp = await client.get("/api/tweets", headers={"api-key": API_KEY[0]})
+        assert "x-profiled-status" not in resp.headers
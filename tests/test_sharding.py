@@ -0,0 +1,210 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import func, select, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+
+from app.add_data import API_KEY
+from app.base_models import Like, Tweet, TweetTag
+from app.cache import tweet_cache
+from app.config import settings
+from app.db_helper import DatabaseHelper, db_helper
+from app.functions import (
+    add_like,
+    delete_tweet_by_id,
+    get_tweet_by_id,
+    get_tweet_likes,
+    get_tweets_info,
+    write_new_tweet,
+)
+from app.sharding import (
+    BUCKETS,
+    format_bucket_map,
+    merge_by_time,
+    move_bucket,
+    parse_bucket_map,
+    shards,
+)
+from app.views import view_tracker
+
+SHARD_COUNT = 2
+
+
+def test_bucket_map():
+    """
+    Проверяет разбор и запись карты корзин
+    """
+    even = parse_bucket_map({}, 2)
+    assert even[0] == 0 and even[BUCKETS - 1] == 1
+    assert format_bucket_map(even) == {"0-127": 0, "128-255": 1}
+
+    bucket_map = parse_bucket_map({"0-99": 1, "100": 0, "101-255": 1}, 2)
+    assert bucket_map[100] == 0 and bucket_map[99] == bucket_map[101] == 1
+    assert parse_bucket_map(format_bucket_map(bucket_map), 2) == bucket_map
+
+    with pytest.raises(ValueError):
+        parse_bucket_map({"0-100": 0}, 2)
+    with pytest.raises(ValueError):
+        parse_bucket_map({"0-255": 2}, 2)
+
+
+def test_merge_by_time():
+    """
+    Проверяет слияние лент шардов от новых к старым
+    """
+    first = [(5, 21), (3, 11), (1, 1)]
+    second = [(4, 18), (3, 12), (2, 2)]
+    assert merge_by_time([first, second, []]) == [21, 18, 12, 11, 2, 1]
+
+
+@pytest_asyncio.fixture
+async def sharded():
+    """
+    Два шарда в локальных базах <db>_shard0 и <db>_shard1; нечетные
+    пользователи - на шарде 1, четные - на шарде 0.
+    """
+    url = make_url(settings.db.url)
+    admin = db_helper.engine.execution_options(isolation_level="AUTOCOMMIT")
+    helpers = []
+    try:
+        async with admin.connect() as connection:
+            for shard in range(SHARD_COUNT):
+                name = f"{url.database}_shard{shard}"
+                exists = await connection.scalar(
+                    text("SELECT 1 FROM pg_database WHERE datname = :name"), {"name": name}
+                )
+                if not exists:
+                    await connection.execute(text(f'CREATE DATABASE "{name}"'))
+    except DBAPIError as e:
+        pytest.skip(f"Не удалось создать базы шардов: {e}")
+    for shard in range(SHARD_COUNT):
+        shard_url = url.set(database=f"{url.database}_shard{shard}")
+        helpers.append(
+            DatabaseHelper(
+                url=shard_url.render_as_string(hide_password=False),
+                echo=False,
+                echo_pool=False,
+                pool_size=2,
+                max_overflow=2,
+            )
+        )
+
+    shards.helpers = helpers
+    shards.bucket_map = [bucket % SHARD_COUNT for bucket in range(BUCKETS)]
+    await tweet_cache.backend.clear()
+    try:
+        await shards.recreate_tables()
+        for maintenance in shards.partition_maintenance():
+            await maintenance.run_once()
+        yield helpers
+        await view_tracker.flush()
+    finally:
+        shards.helpers = []
+        shards.bucket_map = parse_bucket_map({}, 1)
+        await tweet_cache.backend.clear()
+        for helper in helpers:
+            await helper.dispose()
+
+
+async def count_rows(helper: DatabaseHelper, stmt) -> int:
+    async with helper.session_factory() as session:
+        return await session.scalar(stmt)
+
+
+@pytest.mark.asyncio
+async def test_sharded_feed(sharded, cache_listener, db_session):
+    """
+    Проверяет, что твиты и лайки лежат на шарде автора, а лента
+    собирается со всех шардов по времени
+    """
+    tweet_ids = []
+    for user_id, content in ((1, "Первый"), (2, "Второй"), (3, "Третий"), (2, "Четвертый")):
+        tweet_ids.append(
+            await write_new_tweet(user_id=user_id, content=content, session=db_session)
+        )
+    first, second, third, fourth = tweet_ids
+    assert [tweet_id % BUCKETS for tweet_id in tweet_ids] == [1, 2, 3, 2]
+    assert await count_rows(sharded[1], select(func.count()).select_from(Tweet)) == 2
+    assert await count_rows(sharded[0], select(func.count()).select_from(Tweet)) == 2
+    # основная база шардированных твитов не видит
+    assert (await db_session.scalar(select(Tweet.id).where(Tweet.id == first))) is None
+
+    await add_like(user_id=4, tweet_id=first, session=db_session)
+    await add_like(user_id=5, tweet_id=first, session=db_session)
+    await add_like(user_id=4, tweet_id=fourth, session=db_session)
+    await asyncio.sleep(0.2)
+    assert await count_rows(sharded[1], select(func.count()).select_from(Like)) == 2
+
+    feed = await get_tweets_info(session=db_session, user_id=4)
+    tweets = feed["tweets"]
+    assert [tweet.id for tweet in tweets] == [fourth, third, second, first]
+    assert [tweet.liked_by_me for tweet in tweets] == [True, False, False, True]
+    assert tweets[3].likes_count == 2
+    assert {like.user_id for like in tweets[3].likes} == {4, 5}
+    assert all(like.name for like in tweets[3].likes)
+    assert tweets[1].author.id == 3
+
+    likes = await get_tweet_likes(tweet_id=first, session=db_session, limit=1)
+    assert len(likes["likes"]) == 1 and likes["next_cursor"] is not None
+
+    await delete_tweet_by_id(tweet_id=first, session=db_session)
+    assert await get_tweet_by_id(session=db_session, tweet_id=first) is None
+    assert await count_rows(sharded[1], select(func.count()).select_from(Like)) == 0
+    feed = await get_tweets_info(session=db_session)
+    assert first not in [tweet.id for tweet in feed["tweets"]]
+
+
+@pytest.mark.asyncio
+async def test_sharded_batch_atomic(sharded, async_client, db_session):
+    """
+    Проверяет, что атомарный пакет при шардировании отклоняется и ничего не пишет
+    """
+    data = {
+        "atomic": True,
+        "operations": [
+            {"op": "create_tweet", "data": {"tweet_data": "Не запишется"}},
+            {"op": "like"},
+        ],
+    }
+    resp = await async_client.post("/api/batch", headers={"api-key": API_KEY[0]}, json=data)
+    assert resp.status_code == 422
+    assert resp.json()["result"] is False
+    for helper in sharded:
+        assert await count_rows(helper, select(func.count()).select_from(Tweet)) == 0
+
+    data["atomic"] = False
+    resp = await async_client.post("/api/batch", headers={"api-key": API_KEY[0]}, json=data)
+    assert [result["status"] for result in resp.json()["results"]] == [200, 422]
+    assert await count_rows(sharded[1], select(func.count()).select_from(Tweet)) == 1
+
+
+@pytest.mark.asyncio
+async def test_move_bucket(sharded, cache_listener, db_session):
+    """
+    Проверяет перенос корзины пользователя на другой шард
+    """
+    tweet_id = await write_new_tweet(
+        user_id=3, content="Переезжаю #шард", session=db_session
+    )
+    await add_like(user_id=2, tweet_id=tweet_id, session=db_session)
+    await asyncio.sleep(0.2)
+    bucket = 3 % BUCKETS
+    assert shards.shard_for_user(3) == 1
+
+    moved = await move_bucket(sharded[1], sharded[0], bucket, shards.metadata)
+    assert moved == {"tweets": 1, "likes": 1, "images": 0, "tweet_tags": 1}
+    shards.bucket_map[bucket] = 0
+    assert await count_rows(sharded[1], select(func.count()).select_from(Tweet)) == 0
+    assert await count_rows(sharded[0], select(func.count()).select_from(TweetTag)) == 1
+
+    tweet = await get_tweet_by_id(session=db_session, tweet_id=tweet_id)
+    assert tweet is not None and tweet.content == "Переезжаю #шард"
+    feed = await get_tweets_info(session=db_session, user_id=2)
+    assert [(tweet.id, tweet.liked_by_me) for tweet in feed["tweets"]] == [(tweet_id, True)]
+
+    # последовательность корзины продвинута: новые id не совпадают со старыми
+    new_tweet_id = await write_new_tweet(user_id=3, content="Уже здесь", session=db_session)
+    assert new_tweet_id > tweet_id and new_tweet_id % BUCKETS == bucket
+    assert await count_rows(sharded[0], select(func.count()).select_from(Tweet)) == 2
@@ -0,0 +1,57 @@
+import gzip
+import os
+
+import pytest
+
+from app.static_assets import IMMUTABLE, IndexPage, precompress
+
+
+@pytest.mark.asyncio
+async def test_index_page(async_client):
+    """
+    Проверяет отдачу главной страницы
+    """
+    resp = await async_client.get("/")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/html")
+    assert "<html" in resp.text.lower()
+
+
+def test_index_page_reload(tmp_path):
+    """
+    Проверяет, что страница перечитывается только в режиме разработки
+    """
+    path = tmp_path / "index.html"
+    path.write_text("<p>1</p>")
+    cached, reloading = IndexPage(str(path)), IndexPage(str(path), reload=True)
+    assert cached.response().body == reloading.response().body == b"<p>1</p>"
+
+    path.write_text("<p>2</p>")
+    os.utime(path, (0, 1))
+    assert cached.response().body == b"<p>1</p>"
+    assert reloading.response().body == b"<p>2</p>"
+
+
+@pytest.mark.asyncio
+async def test_hashed_static_immutable(async_client):
+    """
+    Проверяет долгое кэширование файлов с хэшем в имени
+    """
+    resp = await async_client.get("/css/app.45d81840.css")
+    assert resp.status_code == 200
+    assert resp.headers["cache-control"] == IMMUTABLE
+
+
+def test_precompress(tmp_path):
+    """
+    Проверяет создание сжатых копий и пропуск маленьких файлов
+    """
+    content = b"body { color: red; }\n" * 100
+    (tmp_path / "app.1234abcd.css").write_bytes(content)
+    (tmp_path / "small.css").write_bytes(b"a{}")
+
+    created = precompress(str(tmp_path))
+    assert str(tmp_path / "app.1234abcd.css.gz") in created
+    assert not (tmp_path / "small.css.gz").exists()
+    assert gzip.decompress((tmp_path / "app.1234abcd.css.gz").read_bytes()) == content
+    assert precompress(str(tmp_path)) == []
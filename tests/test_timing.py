@@ -0,0 +1,43 @@
+import logging
+
+import pytest
+
+from app.add_data import API_KEY
+from app.timing import REQUEST_ID_HEADER
+
+
+def parse_server_timing(header):
+    metrics = {}
+    for entry in header.split(","):
+        name, *params = entry.strip().split(";")
+        metrics[name] = dict(param.split("=", 1) for param in params)
+    return metrics
+
+
+@pytest.mark.asyncio
+async def test_server_timing(async_client, db_session):
+    """
+    Проверяет разбивку времени запроса в заголовке Server-Timing
+    """
+    resp = await async_client.get("/api/tweets", headers={"api-key": API_KEY[0]})
+    assert resp.status_code == 200
+    metrics = parse_server_timing(resp.headers["server-timing"])
+    assert {"auth", "db", "serialize", "total"} <= metrics.keys()
+    assert metrics["db"]["desc"].endswith('queries"')
+    assert float(metrics["total"]["dur"]) >= float(metrics["auth"]["dur"])
+
+
+@pytest.mark.asyncio
+async def test_request_id(async_client, db_session, caplog):
+    """
+    Проверяет, что id запроса возвращается в ответе и попадает в логи
+    """
+    caplog.set_level(logging.INFO)
+    resp = await async_client.get("/api/trends", headers={REQUEST_ID_HEADER: "test-request-1"})
+    assert resp.headers[REQUEST_ID_HEADER] == "test-request-1"
+    assert any(
+        getattr(record, "request_id", None) == "test-request-1" for record in caplog.records
+    )
+
+    resp = await async_client.get("/api/trends")
+    assert len(resp.headers[REQUEST_ID_HEADER]) == 32
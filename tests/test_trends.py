@@ -0,0 +1,94 @@
+import json
+
+import pytest
+from sqlalchemy import select
+
+from app.add_data import API_KEY
+from app.base_models import TweetTag
+from app.trends import HASHTAG, MENTION, TrendTracker, extract_tags, trend_tracker
+
+
+def test_extract_tags():
+    """
+    Проверяет извлечение хэштегов и упоминаний из текста
+    """
+    content = "Привет @Vasya! #Python и #python, почта a@b.ru, #фастапи"
+    assert extract_tags(content) == [
+        (MENTION, "vasya"),
+        (HASHTAG, "python"),
+        (HASHTAG, "фастапи"),
+    ]
+
+
+def test_trend_tracker_window():
+    """
+    Проверяет, что тренды считаются только за окно, а кандидатов не больше capacity
+    """
+    now = [0.0]
+    tracker = TrendTracker(
+        window_seconds=60,
+        bucket_seconds=10,
+        width=256,
+        depth=4,
+        capacity=3,
+        clock=lambda: now[0],
+    )
+    for _ in range(5):
+        tracker.add("#old")
+    now[0] = 30.0
+    for _ in range(3):
+        tracker.add("#python")
+    tracker.add("@vasya")
+    tracker.add("#rare")
+    assert tracker.top(limit=2) == [("#old", 5), ("#python", 3)]
+    assert tracker.top(limit=5, kind=MENTION) == [("@vasya", 1)]
+
+    now[0] = 65.0
+    assert tracker.top(limit=5) == [("#python", 3), ("@vasya", 1)]
+    assert len(tracker._candidates) <= 3
+
+
+@pytest.mark.asyncio
+async def test_get_trends(async_client, db_session):
+    """
+    Проверяет сохранение тегов при публикации твита и эндпоинт трендов
+    """
+    headers = {"api-key": API_KEY[0]}
+    data = {"tweet_data": "Учу #FastAPI вместе с @petya #fastapi"}
+    resp = await async_client.post("/api/tweets", headers=headers, json=data)
+    assert resp.status_code == 200
+    tweet_id = json.loads(resp.text)["tweet_id"]
+
+    result = await db_session.execute(
+        select(TweetTag.kind, TweetTag.tag).where(TweetTag.tweet_id == tweet_id)
+    )
+    assert sorted(result.all()) == [(HASHTAG, "fastapi"), (MENTION, "petya")]
+
+    resp = await async_client.get(
+        "/api/trends", headers=headers, params={"kind": "hashtag"}
+    )
+    assert resp.status_code == 200
+    trends = json.loads(resp.text)
+    assert trends["result"] is True
+    assert {"tag": "#fastapi", "count": 1} in trends["trends"]
+
+
+@pytest.mark.asyncio
+async def test_rolled_back_batch_not_trending(async_client, db_session):
+    """
+    Проверяет, что теги твита из откатанного атомарного пакета не попадают в тренды
+    """
+    data = {
+        "atomic": True,
+        "operations": [
+            {"op": "create_tweet", "data": {"tweet_data": "Не случилось #откатанный"}},
+            {"op": "like"},
+        ],
+    }
+    resp = await async_client.post("/api/batch", headers={"api-key": API_KEY[0]}, json=data)
+    assert resp.json()["result"] is False
+    assert "#откатанный" not in dict(trend_tracker.top(100))
+
+    data["atomic"] = False
+    await async_client.post("/api/batch", headers={"api-key": API_KEY[0]}, json=data)
+    assert "#откатанный" in dict(trend_tracker.top(100))
@@ -0,0 +1,167 @@
+import hashlib
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import delete, select, update
+from starlette.requests import ClientDisconnect
+
+from app.add_data import API_KEY
+from app.base_models import Image, Upload
+from app.storage import storage
+from app.uploads import append_chunk, create_upload, expire_upload, staging_path
+
+HEADERS = {"api-key": API_KEY[0]}
+
+
+@pytest.mark.asyncio
+async def test_resumable_upload(async_client, db_session):
+    """
+    Проверяет загрузку по частям с продолжением и проверкой sha256
+    """
+    data = os.urandom(100_000)
+    response = await async_client.post(
+        "/api/medias/uploads",
+        headers=HEADERS,
+        json={"filename": "resumable.jpg", "size": len(data)},
+    )
+    assert response.status_code == 201
+    upload_id = response.json()["upload_id"]
+    url = f"/api/medias/uploads/{upload_id}"
+
+    response = await async_client.put(
+        url, params={"offset": 0}, headers=HEADERS, content=data[:60_000]
+    )
+    assert response.json()["offset"] == 60_000
+    # повтор уже принятой части
+    response = await async_client.put(
+        url, params={"offset": 0}, headers=HEADERS, content=data[:60_000]
+    )
+    assert response.status_code == 409
+
+    response = await async_client.get(url, headers=HEADERS)
+    offset = response.json()["offset"]
+    assert offset == 60_000
+    response = await async_client.put(
+        url, params={"offset": offset}, headers=HEADERS, content=data[offset:]
+    )
+    assert response.json()["offset"] == len(data)
+
+    response = await async_client.post(
+        f"{url}/finalize",
+        headers=HEADERS,
+        json={"checksum": hashlib.sha256(data).hexdigest()},
+    )
+    assert response.status_code == 201
+    media_id = response.json()["media_id"]
+
+    image = await db_session.get(Image, media_id)
+    path = storage.path(image.url)
+    try:
+        assert image.url == f"1_{hashlib.sha256(data).hexdigest()[:32]}.jpg"
+        assert API_KEY[0] not in image.url
+        with open(path, "rb") as file:
+            assert file.read() == data
+        assert not os.path.exists(staging_path(upload_id))
+        assert await db_session.get(Upload, upload_id) is None
+    finally:
+        os.remove(path)
+        await db_session.execute(delete(Image).where(Image.id == media_id))
+        await db_session.commit()
+
+
+@pytest.mark.asyncio
+async def test_upload_rejected(async_client, db_session):
+    """
+    Проверяет отказ при части больше файла и при неверной контрольной сумме
+    """
+    response = await async_client.post(
+        "/api/medias/uploads", headers=HEADERS, json={"filename": "bad.jpg", "size": 10}
+    )
+    upload_id = response.json()["upload_id"]
+    url = f"/api/medias/uploads/{upload_id}"
+
+    response = await async_client.put(
+        url, params={"offset": 0}, headers=HEADERS, content=b"x" * 20
+    )
+    assert response.status_code == 413
+    assert os.path.getsize(staging_path(upload_id)) == 0
+
+    await async_client.put(url, params={"offset": 0}, headers=HEADERS, content=b"x" * 10)
+    response = await async_client.post(
+        f"{url}/finalize", headers=HEADERS, json={"checksum": "0" * 64}
+    )
+    assert response.status_code == 400
+    assert not os.path.exists(staging_path(upload_id))
+    response = await async_client.get(url, headers={"api-key": API_KEY[0]})
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_interrupted_chunk_kept(db_session):
+    """
+    Проверяет, что байты оборванной части засчитываются и удаляются по истечении
+    """
+    info = await create_upload(
+        session=db_session, user_id=1, filename="interrupted.jpg", size=1000
+    )
+    upload_id = info["upload_id"]
+
+    async def dropped():
+        yield b"a" * 300
+        yield b"b" * 200
+        raise ClientDisconnect()
+
+    info = await append_chunk(
+        session=db_session, upload_id=upload_id, user_id=1, offset=0, chunks=dropped()
+    )
+    assert info["offset"] == 500
+    received = await db_session.scalar(select(Upload.received).where(Upload.id == upload_id))
+    assert received == 500
+
+    await expire_upload(db_session, {"upload_id": upload_id})
+    assert await db_session.get(Upload, upload_id) is None
+    assert not os.path.exists(staging_path(upload_id))
+
+
+@pytest.mark.asyncio
+async def test_concurrent_chunk_rejected(db_session):
+    """
+    Проверяет, что часть загрузки, которую уже принимает другой запрос,
+    получает 409, а брошенную запросом загрузку можно продолжить
+    """
+    info = await create_upload(session=db_session, user_id=1, filename="busy.jpg", size=10)
+    upload_id = info["upload_id"]
+
+    async def chunk():
+        # пока идет часть, соединение с базой не держится
+        assert not db_session.in_transaction()
+        yield b"x" * 10
+
+    # другой запрос принимает свою часть
+    await db_session.execute(
+        update(Upload)
+        .where(Upload.id == upload_id)
+        .values(lease_id="other", leased_until=datetime.now() + timedelta(minutes=1))
+    )
+    await db_session.commit()
+    with pytest.raises(HTTPException) as error:
+        await append_chunk(
+            session=db_session, upload_id=upload_id, user_id=1, offset=0, chunks=chunk()
+        )
+    assert error.value.status_code == 409
+
+    await db_session.execute(
+        update(Upload)
+        .where(Upload.id == upload_id)
+        .values(leased_until=datetime.now() - timedelta(seconds=1))
+    )
+    await db_session.commit()
+    info = await append_chunk(
+        session=db_session, upload_id=upload_id, user_id=1, offset=0, chunks=chunk()
+    )
+    assert info["offset"] == 10
+    upload = await db_session.get(Upload, upload_id)
+    assert upload.lease_id is None and upload.leased_until is None
+    await expire_upload(db_session, {"upload_id": upload_id})
@@ -0,0 +1,64 @@
+import pytest
+from sqlalchemy import select
+
+from app.add_data import API_KEY
+from app.base_models import Tweet
+from app.cache import tweet_cache
+from app.views import HyperLogLog, view_tracker
+
+
+def test_hyperloglog_estimate():
+    """
+    Проверяет точность оценки и объединение скетчей
+    """
+    first = HyperLogLog(precision=12)
+    second = HyperLogLog(precision=12)
+    for viewer_id in range(60000):
+        first.add(viewer_id)
+    for viewer_id in range(40000, 100000):
+        second.add(viewer_id)
+    # 4 стандартные ошибки по 1.6%
+    assert abs(first.count() - 60000) < 60000 * 0.065
+    first.merge(second)
+    assert abs(first.count() - 100000) < 100000 * 0.065
+
+    small = HyperLogLog(precision=12)
+    for _ in range(3):
+        for viewer_id in range(100):
+            small.add(viewer_id)
+    # на малых числах работает линейный подсчет, повторы не считаются
+    assert abs(small.count() - 100) <= 2
+    restored = HyperLogLog(precision=12, registers=small.to_bytes())
+    assert restored.count() == small.count()
+
+    with pytest.raises(ValueError):
+        small.merge(HyperLogLog(precision=10))
+
+
+@pytest.mark.asyncio
+async def test_views_flush(async_client, db_session):
+    """
+    Проверяет, что просмотры ленты сохраняются как уникальные зрители
+    """
+    tweet = Tweet(user_id=1, content="Твит с просмотрами")
+    db_session.add(tweet)
+    await db_session.commit()
+
+    for api_key in (API_KEY[1], API_KEY[2], API_KEY[1]):
+        response = await async_client.get("/api/tweets", headers={"api-key": api_key})
+        assert response.status_code == 200
+    await view_tracker.flush()
+
+    await db_session.refresh(tweet)
+    assert tweet.views == 2
+    assert tweet.views_sketch is not None
+
+    # сброс просмотров кэш не инвалидирует: ждать ttl в тесте не будем
+    await tweet_cache.backend.clear()
+    response = await async_client.get("/api/tweets", headers={"api-key": API_KEY[3]})
+    views = {item["id"]: item["views"] for item in response.json()["tweets"]}
+    assert views[tweet.id] == 2
+
+    await view_tracker.flush()
+    stored = await db_session.scalar(select(Tweet.views).where(Tweet.id == tweet.id))
+    assert stored == 3